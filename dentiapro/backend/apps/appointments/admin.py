@@ -1,8 +1,19 @@
 from django.contrib import admin
-from .models import Appointment
+from .models import Appointment, ReminderDelivery, WorkingHours
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ('tenant', 'patient', 'dentist', 'date', 'start_time', 'status')
     list_filter = ('status', 'date', 'dentist')
     search_fields = ('patient__user__username', 'dentist__user__username', 'tenant__name')
+
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ('dentist', 'weekday', 'start_time', 'end_time', 'tenant')
+    list_filter = ('weekday', 'dentist')
+
+@admin.register(ReminderDelivery)
+class ReminderDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'channel', 'recipient', 'status', 'attempts', 'sent_at', 'tenant')
+    list_filter = ('status', 'channel')
+    search_fields = ('recipient', 'tenant__name')
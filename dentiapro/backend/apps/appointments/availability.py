@@ -0,0 +1,167 @@
+"""
+Free-slot search: dentists' working hours minus their bookings.
+
+An AvailabilityIndex keeps, per dentist, the weekly working intervals and the
+booked intervals of each day as minute offsets. The free time of a day is one
+sweep over the two sorted lists, so a search costs O(dentists x days x
+intervals per day) however long the booking history is: load() only reads
+the requested window, through the (tenant, dentist, date, start_time) index,
+and expands the occurrences of appointment series in it.
+"""
+from collections import defaultdict, namedtuple
+from datetime import time, timedelta
+
+from .calendar import series_occurrences
+from .models import Appointment, AppointmentSeries, WorkingHours
+
+Slot = namedtuple('Slot', ['dentist_id', 'date', 'start_time', 'end_time'])
+
+# Appointments that do not block their time.
+FREE_STATUSES = ('cancelled',)
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def merge(intervals):
+    """
+    Sorted, non-overlapping union of (start, end) intervals.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(intervals, busy):
+    """
+    Parts of the sorted, disjoint `intervals` not covered by the sorted, disjoint `busy` ones.
+    """
+    free, i = [], 0
+    for start, end in intervals:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        cursor, j = start, i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+
+class AvailabilityIndex:
+    """
+    Per-dentist interval index of working hours and bookings.
+    """
+
+    def __init__(self):
+        self.working = {}                   # dentist id -> [weekday -> merged (start, end) minutes]
+        self.booked = defaultdict(dict)     # dentist id -> date -> [(start, end) minutes]
+        self._busy = {}                     # (dentist id, date) -> merged bookings, built on first use
+
+    @classmethod
+    def load(cls, tenant, start_date, end_date, dentist_ids=None):
+        """
+        Index of the tenant's dentists (or `dentist_ids`) with the bookings from start_date to end_date.
+        """
+        index = cls()
+        hours = WorkingHours.objects.filter(tenant=tenant)
+        if dentist_ids is not None:
+            hours = hours.filter(dentist_id__in=dentist_ids)
+        for row in hours.values_list('dentist_id', 'weekday', 'start_time', 'end_time'):
+            index.add_working_hours(*row)
+        if index.working:
+            for row in booked_intervals(tenant, list(index.working), start_date, end_date):
+                index.add_booking(*row)
+            series = AppointmentSeries.objects.filter(tenant=tenant)
+            for row in series_occurrences(series, start_date, end_date, list(index.working)):
+                index.add_booking(row['dentist'], row['date'], row['start_time'], row['end_time'])
+        return index
+
+    def add_working_hours(self, dentist_id, weekday, start_time, end_time):
+        week = self.working.setdefault(dentist_id, [[] for _ in range(7)])
+        week[weekday] = merge(week[weekday] + [(to_minutes(start_time), to_minutes(end_time))])
+
+    def add_booking(self, dentist_id, day, start_time, end_time):
+        self.booked[dentist_id].setdefault(day, []).append((to_minutes(start_time), to_minutes(end_time)))
+        self._busy.pop((dentist_id, day), None)
+
+    def free_intervals(self, dentist_id, day):
+        """
+        Sorted (start, end) minute intervals of `day` when the dentist works and is not booked.
+        """
+        week = self.working.get(dentist_id)
+        if week is None or not week[day.weekday()]:
+            return []
+        key = (dentist_id, day)
+        busy = self._busy.get(key)
+        if busy is None:
+            busy = self._busy[key] = merge(self.booked.get(dentist_id, {}).get(day, ()))
+        return subtract(week[day.weekday()], busy)
+
+    def free_slots(self, start_date, end_date, duration, step=None, dentist_ids=None, earliest=None, limit=None):
+        """
+        Slots of `duration` minutes starting on a `step`-minute grid (default:
+        the duration), from start_date to end_date inclusive, in chronological
+        order. Slots starting before the naive datetime `earliest` are skipped.
+        """
+        step = step or duration
+        dentists = sorted(self.working if dentist_ids is None else set(dentist_ids) & set(self.working))
+        slots = []
+        day = start_date
+        while day <= end_date:
+            first = 0
+            if earliest is not None:
+                if day < earliest.date():
+                    day += timedelta(days=1)
+                    continue
+                if day == earliest.date():
+                    first = to_minutes(earliest) + (earliest.second > 0 or earliest.microsecond > 0)
+            day_slots = []
+            for dentist_id in dentists:
+                for start, end in self.free_intervals(dentist_id, day):
+                    slot_start = -(-max(start, first) // step) * step  # Next grid point
+                    while slot_start + duration <= end:
+                        day_slots.append((slot_start, dentist_id))
+                        slot_start += step
+            day_slots.sort()
+            for slot_start, dentist_id in day_slots:
+                slots.append(Slot(dentist_id, day, to_time(slot_start), to_time(slot_start + duration)))
+                if limit is not None and len(slots) >= limit:
+                    return slots
+            day += timedelta(days=1)
+        return slots
+
+
+def booked_intervals(tenant, dentist_ids, start_date, end_date):
+    """
+    (dentist id, date, start time, end time) of the bookings that block time in the window.
+    """
+    return (
+        Appointment.objects
+        .filter(tenant=tenant, dentist_id__in=dentist_ids, date__range=(start_date, end_date))
+        .exclude(status__in=FREE_STATUSES)
+        .order_by()
+        .values_list('dentist_id', 'date', 'start_time', 'end_time')
+    )
+
+
+def find_free_slots(tenant, start_date, end_date, duration, step=None, dentist_ids=None, earliest=None, limit=None):
+    """
+    Free slots of the tenant's dentists; see AvailabilityIndex.free_slots().
+    """
+    index = AvailabilityIndex.load(tenant, start_date, end_date, dentist_ids)
+    return index.free_slots(start_date, end_date, duration, step, dentist_ids, earliest, limit)
+
@@ -0,0 +1,78 @@
+"""
+Calendar reads: the appointments of a date range, for some dentists or the whole clinic.
+
+Both shapes have a covering index (see Appointment.Meta.indexes), so
+Postgres answers them with an index-only scan of the range, whatever the
+size of the table:
+- a dentist's calendar: (tenant, dentist, date, start_time);
+- the clinic's day or week view: (tenant, date, start_time).
+Only CALENDAR_FIELDS are read; they are all in those indexes.
+
+Occurrences of appointment series are not stored: series_occurrences()
+expands the series active in the window and drops the occurrences that were
+materialized as Appointment rows (which the queryset returns instead).
+"""
+from django.db.models import Q
+
+from .models import Appointment
+
+CALENDAR_FIELDS = ('id', 'dentist', 'patient', 'date', 'start_time', 'end_time', 'status', 'series')
+
+
+def calendar_queryset(queryset, start_date, end_date, dentist_ids=None):
+    """
+    values() rows of CALENDAR_FIELDS from `queryset` (already scoped to a
+    tenant) between start_date and end_date inclusive, in time order.
+    """
+    queryset = queryset.filter(date__range=(start_date, end_date))
+    if dentist_ids is not None:
+        queryset = queryset.filter(dentist_id__in=dentist_ids)
+    return queryset.order_by('date', 'start_time', 'dentist').values(*CALENDAR_FIELDS)
+
+
+def active_series(queryset, start_date, end_date, dentist_ids=None):
+    """
+    The series of `queryset` with occurrences possibly falling between start_date and end_date.
+    """
+    queryset = queryset.filter(Q(last_date__isnull=True) | Q(last_date__gte=start_date), start_date__lte=end_date)
+    if dentist_ids is not None:
+        queryset = queryset.filter(dentist_id__in=dentist_ids)
+    return queryset
+
+
+def series_occurrences(queryset, start_date, end_date, dentist_ids=None):
+    """
+    Calendar rows (with no id) of the occurrences of the series in
+    `queryset` between start_date and end_date that are not materialized.
+    Two queries, whatever the length of the series.
+    """
+    series = list(active_series(queryset, start_date, end_date, dentist_ids))
+    if not series:
+        return []
+    materialized = set(
+        Appointment.objects.using(queryset.db)
+        .filter(series__in=series, original_date__range=(start_date, end_date))
+        .values_list('series_id', 'original_date')
+    )
+    rows = []
+    for item in series:
+        for day in item.dates(start_date, end_date):
+            if (item.pk, day) not in materialized:
+                rows.append({
+                    'id': None, 'dentist': item.dentist_id, 'patient': item.patient_id, 'date': day,
+                    'start_time': item.start_time, 'end_time': item.end_time, 'status': 'scheduled',
+                    'series': item.pk,
+                })
+    return rows
+
+
+def calendar_rows(queryset, series_queryset, start_date, end_date, dentist_ids=None):
+    """
+    Stored appointments and series occurrences of the window, in time order.
+    """
+    rows = list(calendar_queryset(queryset, start_date, end_date, dentist_ids))
+    occurrences = series_occurrences(series_queryset, start_date, end_date, dentist_ids)
+    if occurrences:
+        rows.extend(occurrences)
+        rows.sort(key=lambda row: (row['date'], row['start_time'], row['dentist']))
+    return rows
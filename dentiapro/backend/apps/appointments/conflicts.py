@@ -0,0 +1,257 @@
+"""
+Double-booking prevention.
+
+On Postgres the appointments table carries a generated `slot` tsrange column
+and an exclusion constraint (constraints.py: added to the provisioning
+template when it is prepared, to existing schemas by the
+appointment_constraints command): two appointments of the same tenant and
+dentist that are not cancelled can never overlap, however many requests race
+for the same slot. The GiST index behind the constraint makes the check a
+lookup.
+
+The views add a cheap pre-check on the (tenant, dentist, date, start_time)
+index to explain the conflict, and turn a violation of the constraint (the
+race the pre-check cannot see) into the same 409 response. Occurrences of
+appointment series are not rows, so only the pre-checks see them: bookings
+are checked against series occurrences, and a series being created or
+rescheduled against everything else (ensure_series_available). Those
+pre-checks run under a per-dentist advisory lock (booking_guard), so two
+writes for a dentist cannot both pass them.
+"""
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core import metrics
+from core.response_cache import get_response_cache
+from .availability import FREE_STATUSES, to_minutes
+from .calendar import series_occurrences
+from .models import Appointment, AppointmentSeries
+
+EXCLUSION_VIOLATION = '23P01'   # SQLSTATE exclusion_violation
+# How far ahead the occurrences of an open-ended series are checked for conflicts.
+SERIES_HORIZON = timedelta(days=365)
+
+conflicts_detected = metrics.counter(
+    'appointment_conflicts', 'Bookings rejected because the dentist already has an appointment at that time'
+)
+
+# `row` is the index of a conflicting row; `other_row` the index of the batch row it
+# overlaps, `appointment` the id of the stored appointment or `series` the id of the series.
+Conflict = namedtuple('Conflict', ['row', 'other_row', 'appointment', 'series'], defaults=(None,))
+
+
+class AppointmentConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The dentist already has an appointment at that time."
+    default_code = 'conflict'
+
+    def __init__(self, detail=None, code=None, conflicts=(), series=()):
+        super().__init__(detail, code)
+        self.conflicts = list(conflicts)
+        self.series = list(series)
+        if self.conflicts or self.series:
+            self.detail = {'detail': self.detail, 'conflicts': self.conflicts}
+            if self.series:
+                self.detail['series'] = self.series
+
+
+def is_exclusion_violation(exc):
+    cause = exc.__cause__
+    # psycopg2 exposes `pgcode`, psycopg 3 `sqlstate`.
+    return EXCLUSION_VIOLATION in (getattr(cause, 'pgcode', None), getattr(cause, 'sqlstate', None))
+
+
+@contextmanager
+def booking_guard(tenant=None, dentist_ids=()):
+    """
+    Run the block in a savepoint and raise AppointmentConflict if the exclusion constraint rejects it.
+
+    Series occurrences are not rows, so the constraint cannot stop a booking
+    and a series racing for the same dentist. With a tenant, the block first
+    takes the booking lock of each of `dentist_ids` (lock_dentists()), so the
+    pre-checks of concurrent appointment and series writes run one at a time.
+    """
+    using = router.db_for_write(Appointment)
+    try:
+        with transaction.atomic(using=using):
+            if tenant is not None:
+                lock_dentists(tenant, dentist_ids, using=using)
+            yield
+    except IntegrityError as exc:
+        if not is_exclusion_violation(exc):
+            raise
+        conflicts_detected.inc()
+        raise AppointmentConflict() from exc
+
+
+def lock_dentists(tenant, dentist_ids, using=None):
+    """
+    Take the transaction-level advisory lock of each dentist of `tenant`, in
+    id order so that writes locking several dentists cannot deadlock.
+    Postgres only; held until the transaction ends.
+    """
+    connection = connections[using or router.db_for_write(Appointment)]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for dentist_id in sorted(set(dentist_ids)):
+            # (int4, int4) keys: ids wrap, which at worst makes two dentists share a lock.
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [tenant.pk % 2 ** 31, dentist_id % 2 ** 31])
+
+
+def overlapping(tenant, dentist_id, day, start_time, end_time):
+    """
+    Appointments of the dentist that block part of the interval.
+    """
+    return (
+        Appointment.objects
+        .filter(tenant=tenant, dentist_id=dentist_id, date=day, start_time__lt=end_time, end_time__gt=start_time)
+        .exclude(status__in=FREE_STATUSES)
+    )
+
+
+def ensure_available(tenant, dentist_id, day, start_time, end_time, exclude=None, status=None):
+    """
+    Raise AppointmentConflict if an appointment other than `exclude` (a pk)
+    or an occurrence of a series blocks the interval. Bookings with a free
+    status (cancelled) never conflict.
+    """
+    if status in FREE_STATUSES:
+        return
+    queryset = overlapping(tenant, dentist_id, day, start_time, end_time)
+    if exclude is not None:
+        queryset = queryset.exclude(pk=exclude)
+    conflicts = list(queryset.values_list('pk', flat=True)[:10])
+    occurrences = series_occurrences(AppointmentSeries.objects.filter(tenant=tenant), day, day, [dentist_id])
+    series = [row['series'] for row in occurrences if row['start_time'] < end_time and row['end_time'] > start_time]
+    if conflicts or series:
+        conflicts_detected.inc()
+        raise AppointmentConflict(conflicts=conflicts, series=series)
+
+
+def find_conflicts(tenant, rows, using=None, exclude_series=None):
+    """
+    Conflicts of a batch of bookings (Appointment instances or dicts with
+    dentist_id, date, start_time, end_time and optionally status) with each
+    other and with the tenant's appointments and series occurrences (but
+    those of `exclude_series`, a pk), in a few queries.
+
+    Rows are grouped per dentist and day and sorted once. A row overlapping
+    an earlier-starting one of the batch is reported against the one that
+    ends last; stored appointments are walked alongside in start order. So a
+    batch of n rows costs O(n log n), not a query or a scan per row.
+    """
+    groups = defaultdict(list)
+    for position, row in enumerate(rows):
+        values = row if isinstance(row, dict) else vars(row)
+        if values.get('status') in FREE_STATUSES:
+            continue
+        key = (values['dentist_id'], values['date'])
+        groups[key].append((to_minutes(values['start_time']), to_minutes(values['end_time']), position))
+    if not groups:
+        return []
+
+    stored = defaultdict(list)
+    days = [day for _, day in groups]
+    queryset = (
+        Appointment.objects.using(using or router.db_for_read(Appointment))
+        .filter(tenant=tenant, dentist_id__in={dentist for dentist, _ in groups}, date__range=(min(days), max(days)))
+        .exclude(status__in=FREE_STATUSES)
+        .order_by()
+        .values_list('dentist_id', 'date', 'start_time', 'end_time', 'pk')
+    )
+    for dentist_id, day, start_time, end_time, pk in queryset:
+        if (dentist_id, day) in groups:
+            stored[dentist_id, day].append((to_minutes(start_time), to_minutes(end_time), pk, None))
+    series = AppointmentSeries.objects.using(queryset.db).filter(tenant=tenant)
+    if exclude_series is not None:
+        series = series.exclude(pk=exclude_series)
+    for row in series_occurrences(series, min(days), max(days), {dentist for dentist, _ in groups}):
+        if (row['dentist'], row['date']) in groups:
+            stored[row['dentist'], row['date']].append(
+                (to_minutes(row['start_time']), to_minutes(row['end_time']), None, row['series'])
+            )
+
+    conflicts = []
+    for key, intervals in groups.items():
+        intervals.sort()
+        booked = sorted(stored.get(key, ()), key=lambda interval: interval[:2])
+        latest = None   # (end, position) of the batch row ending last so far
+        cursor = 0      # First stored appointment that may still overlap
+        for start, end, position in intervals:
+            if latest is not None and start < latest[0]:
+                conflicts.append(Conflict(position, latest[1], None))
+            if latest is None or end > latest[0]:
+                latest = (end, position)
+            while cursor < len(booked) and booked[cursor][1] <= start:
+                cursor += 1
+            if cursor < len(booked) and booked[cursor][0] < end:
+                conflicts.append(Conflict(position, None, *booked[cursor][2:]))
+    conflicts.sort(key=lambda conflict: conflict.row)
+    return conflicts
+
+
+def ensure_series_available(tenant, series, today=None):
+    """
+    Raise AppointmentConflict if an occurrence of `series` (an
+    AppointmentSeries with the values being saved, saved or not) from today
+    on overlaps an appointment, its own materialized occurrences included,
+    or an occurrence of another series. Open-ended series are checked up to
+    SERIES_HORIZON ahead.
+    """
+    rule = series.recurrence
+    start = max(series.start_date, today or timezone.localdate())
+    end = start + SERIES_HORIZON
+    last_date = rule.last_date(series.start_date)
+    if last_date is not None:
+        end = min(end, last_date)
+    if end < start:
+        return
+    materialized = set()
+    if series.pk is not None:
+        # These dates are Appointment rows now, which find_conflicts() checks as such.
+        materialized = set(
+            Appointment.objects.filter(series=series.pk, original_date__range=(start, end))
+            .values_list('original_date', flat=True)
+        )
+    rows = [
+        {'dentist_id': series.dentist_id, 'date': day, 'start_time': series.start_time, 'end_time': series.end_time}
+        for day in rule.between(series.start_date, start, end) if day not in materialized
+    ]
+    conflicts = find_conflicts(tenant, rows, exclude_series=series.pk)
+    if conflicts:
+        conflicts_detected.inc()
+        raise AppointmentConflict(
+            "Some occurrences of the series overlap an appointment.",
+            conflicts=[
+                {'date': rows[conflict.row]['date'], 'appointment': conflict.appointment, 'series': conflict.series}
+                for conflict in conflicts
+            ],
+        )
+
+
+def bulk_book(tenant, appointments, batch_size=1000):
+    """
+    Insert unsaved Appointment instances for `tenant` all or nothing: raise
+    AppointmentConflict listing the conflicting row indexes if any row overlaps.
+    """
+    for appointment in appointments:
+        appointment.tenant = tenant
+    with booking_guard(tenant, [appointment.dentist_id for appointment in appointments]):
+        conflicts = find_conflicts(tenant, appointments, using=router.db_for_write(Appointment))
+        if conflicts:
+            conflicts_detected.inc(len({conflict.row for conflict in conflicts}))
+            raise AppointmentConflict(
+                "Some rows overlap another row or an existing appointment.",
+                conflicts=[conflict._asdict() for conflict in conflicts],
+            )
+        created = Appointment.objects.bulk_create(appointments, batch_size=batch_size)
+        # bulk_create() sends no post_save, so cached lists and ETags are invalidated here.
+        get_response_cache().bump_on_commit(tenant.pk, Appointment, using=router.db_for_write(Appointment))
+    return created
@@ -0,0 +1,36 @@
+"""
+Postgres DDL of the appointments exclusion constraint (see conflicts.py).
+
+Migrations do not create it: SchemaProvisioner.prepare_template() adds it to
+the provisioning template, which every new tenant schema is cloned from, and
+the appointment_constraints command to existing schemas. Kept free of model
+imports so the tenant app can use it at import time.
+"""
+EXCLUSION_CONSTRAINT = 'appointments_no_overlap'
+
+# Once per database. Always in public: extension objects otherwise go to the first
+# schema of the search_path, where the other tenant schemas would not find them.
+# btree_gist lets the GiST index hold the equality columns next to the range.
+BTREE_GIST = "CREATE EXTENSION IF NOT EXISTS btree_gist SCHEMA public"
+
+# Per schema holding an appointments table, idempotent. `slot` is computed by Postgres, so Django never writes it.
+CONSTRAINT_STATEMENTS = [
+    """
+    ALTER TABLE appointments ADD COLUMN IF NOT EXISTS slot tsrange
+    GENERATED ALWAYS AS (tsrange(date + start_time, date + end_time, '[)')) STORED
+    """,
+    f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = '{EXCLUSION_CONSTRAINT}' AND conrelid = 'appointments'::regclass
+        ) THEN
+            ALTER TABLE appointments ADD CONSTRAINT {EXCLUSION_CONSTRAINT}
+            EXCLUDE USING gist (tenant_id WITH =, dentist_id WITH =, slot WITH &&)
+            WHERE (status <> 'cancelled');
+        END IF;
+    END
+    $$
+    """,
+]
@@ -1,5 +1,6 @@
 from django.db import models
 from apps.tenant.models import Tenant
+from .recurrence import RecurrenceRule
 from apps.users.models import User
 
 class Appointment(models.Model):
@@ -19,6 +20,12 @@ class Appointment(models.Model):
     end_time = models.TimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     notes = models.TextField(blank=True)
+    # Set on occurrences of a series that were materialized to be changed:
+    # this row replaces the series' occurrence of `original_date`.
+    series = models.ForeignKey(
+        'AppointmentSeries', null=True, blank=True, on_delete=models.CASCADE, related_name='occurrences',
+    )
+    original_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -27,4 +34,152 @@ class Appointment(models.Model):
         ordering = ['-date', '-start_time']
         indexes = [
             models.Index(fields=['tenant', 'patient', 'dentist', 'status']),
+            models.Index(fields=['tenant', '-date', '-start_time', '-id']),  # Keyset pagination
+            # Covering indexes of the calendar reads (calendar.CALENDAR_FIELDS) and dentist availability.
+            models.Index(
+                fields=['tenant', 'dentist', 'date', 'start_time'],
+                include=['id', 'patient', 'end_time', 'status', 'series'], name='appointments_dentist_cal_idx',
+            ),
+            models.Index(
+                fields=['tenant', 'date', 'start_time'],
+                include=['id', 'dentist', 'patient', 'end_time', 'status', 'series'],
+                name='appointments_clinic_cal_idx',
+            ),
+        ]
+        constraints = [
+            # Overlaps are excluded by the `appointments_no_overlap` constraint (constraints.py).
+            models.CheckConstraint(
+                check=models.Q(start_time__lt=models.F('end_time')), name='appointment_start_before_end',
+            ),
+            models.UniqueConstraint(fields=['series', 'original_date'], name='appointment_series_occurrence'),
+        ]
+
+
+class AppointmentSeries(models.Model):
+    """
+    Recurring appointments (e.g. orthodontic follow-ups) stored as one row.
+
+    Occurrences are expanded from `rule` (an RRULE, see recurrence.py) for
+    the window being read and only become Appointment rows when one of them
+    is changed or cancelled (AppointmentSeriesViewSet.occurrence).
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_series')
+    dentist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dentist_series')
+    start_date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    rule = models.CharField(max_length=255, help_text="RRULE, e.g. FREQ=WEEKLY;INTERVAL=4;COUNT=12")
+    # Date of the last occurrence (None: open-ended), derived from the rule on save.
+    last_date = models.DateField(null=True, blank=True, editable=False)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'appointment_series'
+        ordering = ['start_date', 'start_time']
+        indexes = [
+            models.Index(fields=['tenant', 'dentist', 'start_date', 'last_date']),
+            models.Index(fields=['tenant', 'start_date', 'last_date']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(start_time__lt=models.F('end_time')), name='appointment_series_start_before_end',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} - {self.rule} from {self.start_date}"
+
+    @property
+    def recurrence(self):
+        return RecurrenceRule.parse(self.rule)
+
+    def save(self, *args, **kwargs):
+        self.last_date = self.recurrence.last_date(self.start_date)
+        super().save(*args, **kwargs)
+
+    def dates(self, start, end):
+        """
+        Occurrence dates from start to end inclusive, exceptions included.
+        """
+        if self.last_date is not None:
+            end = min(end, self.last_date)
+        return self.recurrence.between(self.start_date, start, end)
+
+
+class WorkingHours(models.Model):
+    """
+    A dentist's weekly opening interval; several per weekday for breaks.
+    """
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+    dentist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        db_table = 'working_hours'
+        ordering = ['dentist', 'weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['tenant', 'dentist', 'weekday']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(start_time__lt=models.F('end_time')), name='working_hours_start_before_end',
+            ),
         ]
+
+
+class ReminderDelivery(models.Model):
+    """
+    Ledger of appointment reminders (reminders.py), one row per visit and channel.
+
+    `key` identifies the visit (patient, dentist, date and time) rather than
+    the row, so a series occurrence that gets materialized is not reminded
+    twice, while a moved appointment gets a new reminder. `claim` marks the
+    rows a scheduler run is sending, so concurrent runs never send one twice.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
+    key = models.CharField(max_length=100)
+    channel = models.CharField(max_length=10)
+    appointment = models.ForeignKey(Appointment, null=True, blank=True, on_delete=models.SET_NULL)
+    series = models.ForeignKey(AppointmentSeries, null=True, blank=True, on_delete=models.SET_NULL)
+    recipient = models.CharField(max_length=254)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claim = models.UUIDField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    provider_id = models.CharField(max_length=64, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'appointment_reminders'
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'key'], name='appointment_reminder_key'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'claim']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
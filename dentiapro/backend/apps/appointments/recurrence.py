@@ -0,0 +1,138 @@
+"""
+Recurrence rules of appointment series, a subset of RFC 5545 RRULE:
+
+    FREQ=DAILY|WEEKLY|MONTHLY[;INTERVAL=n][;BYDAY=MO,TH (weekly only)][;COUNT=n|;UNTIL=YYYYMMDD]
+
+between() computes the first occurrence of a window arithmetically instead of
+enumerating the series from its start, so expanding any window of a series,
+however long, costs only the occurrences in that window. COUNT is turned
+into the date of the last occurrence once, when the series is saved.
+"""
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_COUNT = 1000
+
+
+class RecurrenceRule(namedtuple('RecurrenceRule', ['freq', 'interval', 'byday', 'count', 'until'])):
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse an RRULE value; raises ValueError on rules outside the supported subset.
+        """
+        parts = {}
+        for part in text.strip().upper().split(';'):
+            name, sep, value = part.partition('=')
+            if not sep or not value or name in parts:
+                raise ValueError(f"Malformed rule part: {part!r}.")
+            parts[name] = value
+
+        unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL'}
+        if unknown:
+            raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unknown))}.")
+        freq = parts.get('FREQ')
+        if freq not in FREQUENCIES:
+            raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}.")
+        interval = cls._positive(parts, 'INTERVAL', 1)
+        byday = ()
+        if 'BYDAY' in parts:
+            if freq != 'WEEKLY':
+                raise ValueError("BYDAY is only supported with FREQ=WEEKLY.")
+            try:
+                byday = tuple(sorted({WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')}))
+            except ValueError:
+                raise ValueError(f"BYDAY takes weekdays among {', '.join(WEEKDAYS)}.")
+        if 'COUNT' in parts and 'UNTIL' in parts:
+            raise ValueError("COUNT and UNTIL are mutually exclusive.")
+        count = cls._positive(parts, 'COUNT', None)
+        if count is not None and count > MAX_COUNT:
+            raise ValueError(f"COUNT is limited to {MAX_COUNT}; use UNTIL or an open-ended series.")
+        until = None
+        if 'UNTIL' in parts:
+            try:
+                until = datetime.strptime(parts['UNTIL'][:8], '%Y%m%d').date()
+            except ValueError:
+                raise ValueError("UNTIL must be a date: YYYYMMDD.")
+        return cls(freq, interval, byday, count, until)
+
+    @staticmethod
+    def _positive(parts, name, default):
+        if name not in parts:
+            return default
+        if not parts[name].isdigit() or int(parts[name]) < 1:
+            raise ValueError(f"{name} must be a positive integer.")
+        return int(parts[name])
+
+    def __str__(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.byday:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.byday))
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f'UNTIL={self.until:%Y%m%d}')
+        return ';'.join(parts)
+
+    def between(self, dtstart, start, end):
+        """
+        Occurrence dates of a series starting on `dtstart` from start to end
+        inclusive, in order. COUNT and UNTIL are not applied: clip `end` to
+        last_date() first.
+        """
+        start = max(start, dtstart)
+        if end < start:
+            return
+        if self.freq == 'DAILY':
+            step = timedelta(days=self.interval)
+            day = dtstart + step * -(-(start - dtstart).days // self.interval)
+            while day <= end:
+                yield day
+                day += step
+        elif self.freq == 'WEEKLY':
+            weekdays = self.byday or (dtstart.weekday(),)
+            first_monday = dtstart - timedelta(days=dtstart.weekday())
+            week = (start - first_monday).days // 7
+            monday = first_monday + timedelta(weeks=week - week % self.interval)
+            while monday <= end:
+                for weekday in weekdays:
+                    day = monday + timedelta(days=weekday)
+                    if start <= day <= end:
+                        yield day
+                monday += timedelta(weeks=self.interval)
+        else:
+            months = (start.year - dtstart.year) * 12 + start.month - dtstart.month
+            months -= months % self.interval
+            while True:
+                year, month = divmod(dtstart.month - 1 + months, 12)
+                year, month = dtstart.year + year, month + 1
+                if date(year, month, 1) > end:
+                    break
+                # Like RFC 5545, months without that day (e.g. the 31st) are skipped.
+                if dtstart.day <= monthrange(year, month)[1]:
+                    day = date(year, month, dtstart.day)
+                    if start <= day <= end:
+                        yield day
+                months += self.interval
+
+    def last_date(self, dtstart):
+        """
+        Date of the last occurrence, or None for an open-ended series.
+        """
+        if self.until is not None:
+            return self.until
+        if self.count is None:
+            return None
+        last = None
+        try:
+            for last in islice(self.between(dtstart, dtstart, date.max), self.count):
+                pass
+        except (OverflowError, ValueError):
+            raise ValueError("The series would run past the year 9999.")
+        return last
@@ -0,0 +1,395 @@
+"""
+Appointment reminders, sent by `manage.py send_reminders` (run it from cron
+every few minutes).
+
+For each tenant, ReminderScheduler selects the appointments starting within
+LEAD_TIME with one query on the (tenant, date, start_time) index, adds the
+occurrences of appointment series, and claims them in the ReminderDelivery
+ledger: the ledger's (tenant, key) uniqueness and the claim are the
+idempotency keys, so overlapping or concurrent runs never send a reminder
+twice and failed ones are retried by the next run, up to MAX_ATTEMPTS.
+
+Claimed reminders are cut into batches of BATCH_SIZE per tenant and channel
+and fed to CONCURRENCY async workers through a bounded queue, so the
+database work of the next tenants overlaps with the sending. Each worker
+opens one transport per channel on its first batch and keeps it (an SMTP
+session, an HTTP connection pool) until the run ends.
+"""
+import asyncio
+import logging
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.tenant.schema import activate_tenant
+from apps.tenant.sharding import shard_for, use_shard
+from apps.users.models import User
+from core import metrics
+from .calendar import series_occurrences
+from .models import Appointment, AppointmentSeries, ReminderDelivery
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REMINDERS = {
+    'ENABLED': True,
+    'LEAD_TIME': 24 * 3600,     # Seconds: appointments starting sooner than this are reminded
+    'CHANNELS': {               # Channel -> transport class; a channel is used when the patient has the contact
+        'sms': 'apps.appointments.reminders.TwilioTransport',
+        'email': 'apps.appointments.reminders.EmailTransport',
+    },
+    'CONCURRENCY': 20,          # Workers sending batches at the same time
+    'BATCH_SIZE': 50,           # Reminders per transport call
+    'MAX_ATTEMPTS': 3,
+    'CLAIM_TIMEOUT': 600,       # Seconds after which reminders claimed by a run that died are claimed again
+}
+
+# Appointments that still take place.
+REMINDED_STATUSES = ('scheduled', 'confirmed')
+
+Reminder = namedtuple('Reminder', ['delivery', 'to', 'subject', 'body'])
+
+
+class Transport:
+    """
+    Sends batches of reminders over one channel. A worker calls open()
+    before its first batch and close() at the end of the run.
+    """
+
+    async def open(self):
+        pass
+
+    async def send(self, reminders):
+        """
+        Return one (provider id, error) pair per reminder; error is None on success.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class FakeTransport(Transport):
+    """
+    Keeps what it sends in FakeTransport.outbox, for tests and benchmarks.
+    `latency` seconds are spent per batch, as a network round trip would;
+    reminders to a recipient in `failing` fail.
+    """
+    outbox = []
+    latency = 0.0
+    failing = set()
+    opened = 0
+
+    async def open(self):
+        type(self).opened += 1
+
+    async def send(self, reminders):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        results = []
+        for reminder in reminders:
+            if reminder.to in self.failing:
+                results.append((None, f"{reminder.to} is unreachable"))
+            else:
+                self.outbox.append(reminder)
+                results.append((f'fake-{len(self.outbox)}', None))
+        return results
+
+
+class EmailTransport(Transport):
+    """
+    Django's email backend; a batch goes through one send_messages() call on a connection kept open.
+    """
+
+    async def open(self):
+        self.connection = get_connection(fail_silently=False)
+        await sync_to_async(self.connection.open, thread_sensitive=False)()
+
+    async def send(self, reminders):
+        messages = [EmailMessage(reminder.subject, reminder.body, to=[reminder.to]) for reminder in reminders]
+        try:
+            await sync_to_async(self.connection.send_messages, thread_sensitive=False)(messages)
+        except Exception as exc:
+            return [(None, str(exc))] * len(reminders)
+        return [('', None)] * len(reminders)
+
+    async def close(self):
+        await sync_to_async(self.connection.close, thread_sensitive=False)()
+
+
+class TwilioTransport(Transport):
+    """
+    Twilio SMS (settings.TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER).
+    The messages of a batch are posted concurrently over one aiohttp session.
+    """
+
+    async def open(self):
+        from twilio.http.async_http_client import AsyncTwilioHttpClient
+        from twilio.rest import Client
+
+        self.http_client = AsyncTwilioHttpClient()
+        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=self.http_client)
+
+    async def send(self, reminders):
+        responses = await asyncio.gather(*(
+            self.client.messages.create_async(to=reminder.to, from_=settings.TWILIO_FROM_NUMBER, body=reminder.body)
+            for reminder in reminders
+        ), return_exceptions=True)
+        return [
+            (None, str(response)) if isinstance(response, Exception) else (response.sid, None)
+            for response in responses
+        ]
+
+    async def close(self):
+        await self.http_client.close()
+
+
+def reminder_key(patient_id, dentist_id, day, start_time, channel):
+    return f'{patient_id}-{dentist_id}-{day:%Y%m%d}{start_time:%H%M}-{channel}'
+
+
+def window_q(start, end):
+    """
+    Filter on (date, start_time) for appointments starting after `start` and up to `end` (naive datetimes).
+    """
+    if start.date() == end.date():
+        return Q(date=start.date(), start_time__gt=start.time(), start_time__lte=end.time())
+    return (
+        Q(date=start.date(), start_time__gt=start.time())
+        | Q(date__gt=start.date(), date__lt=end.date())
+        | Q(date=end.date(), start_time__lte=end.time())
+    )
+
+
+class ReminderScheduler:
+    """
+    Selects, claims and sends the reminders that are due.
+    """
+
+    def __init__(self, channels=None, lead_time=24 * 3600, concurrency=20, batch_size=50, max_attempts=3,
+                 claim_timeout=600, enabled=True):
+        channels = DEFAULT_REMINDERS['CHANNELS'] if channels is None else channels
+        self.transports = {
+            channel: import_string(transport) if isinstance(transport, str) else transport
+            for channel, transport in channels.items()
+        }
+        self.lead_time = timedelta(seconds=lead_time)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.claim_timeout = timedelta(seconds=claim_timeout)
+        self.enabled = enabled
+
+        self.due_count = metrics.counter('reminders_due', 'Reminders selected by the scheduler')
+        self.sent = metrics.counter('reminders_sent', 'Reminders delivered to a transport')
+        self.failed = metrics.counter('reminders_failed', 'Reminder deliveries that failed')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_REMINDERS, **getattr(settings, 'REMINDERS', {})}
+        return cls(
+            channels=options['CHANNELS'],
+            lead_time=options['LEAD_TIME'],
+            concurrency=options['CONCURRENCY'],
+            batch_size=options['BATCH_SIZE'],
+            max_attempts=options['MAX_ATTEMPTS'],
+            claim_timeout=options['CLAIM_TIMEOUT'],
+            enabled=options['ENABLED'],
+        )
+
+    def run(self, tenants, now=None):
+        """
+        Send the reminders due for `tenants`; returns counts of what happened.
+        """
+        if not self.enabled:
+            return {'tenants': 0, 'due': 0, 'sent': 0, 'failed': 0}
+        # async_to_sync keeps the ORM calls of the workers on this thread and its connections.
+        return async_to_sync(self.dispatch)(list(tenants), now or timezone.now())
+
+    async def dispatch(self, tenants, now):
+        stats = {'tenants': len(tenants), 'due': 0, 'sent': 0, 'failed': 0}
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self.worker(queue, stats, now)) for _ in range(self.concurrency)]
+        try:
+            prepare = sync_to_async(self.prepare)
+            for tenant in tenants:
+                batches = await prepare(tenant, now)
+                stats['due'] += sum(len(batch) for _, _, batch in batches)
+                for batch in batches:
+                    await queue.put(batch)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        return stats
+
+    async def worker(self, queue, stats, now):
+        transports = {}
+        record = sync_to_async(self.record)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                tenant, channel, reminders = batch
+                try:
+                    if channel not in transports:
+                        transport = self.transports[channel]()
+                        await transport.open()
+                        transports[channel] = transport
+                    results = await transports[channel].send(reminders)
+                except Exception as exc:
+                    logger.exception("Sending %d %s reminders failed.", len(reminders), channel)
+                    results = [(None, str(exc) or type(exc).__name__)] * len(reminders)
+                try:
+                    sent = await record(tenant, reminders, results, now)
+                except Exception:
+                    # The claims expire after CLAIM_TIMEOUT; reminders that did go out may then be sent again.
+                    logger.exception("Recording %d %s reminders failed.", len(reminders), channel)
+                    continue
+                stats['sent'] += sent
+                stats['failed'] += len(reminders) - sent
+        finally:
+            for transport in transports.values():
+                try:
+                    await transport.close()
+                except Exception:
+                    logger.exception("Closing a reminder transport failed.")
+
+    def prepare(self, tenant, now):
+        """
+        Claim the tenant's due reminders; returns [(tenant, channel, [Reminder])] batches.
+        """
+        alias = shard_for(tenant)
+        activate_tenant(tenant, using=alias)
+        with use_shard(alias):
+            candidates = self.due(tenant, now)
+            claimed = self.claim(tenant, candidates, now)
+        self.due_count.inc(len(claimed))
+        batches = []
+        for channel in self.transports:
+            reminders = [reminder for reminder in claimed if reminder.delivery.channel == channel]
+            for start in range(0, len(reminders), self.batch_size):
+                batches.append((tenant, channel, reminders[start:start + self.batch_size]))
+        return batches
+
+    def due(self, tenant, now):
+        """
+        Unsaved Reminders of the tenant's visits starting within the lead time, one per channel.
+        """
+        start = timezone.localtime(now).replace(tzinfo=None)
+        end = start + self.lead_time
+        visits = list(
+            Appointment.objects
+            .filter(window_q(start, end), tenant=tenant, status__in=REMINDED_STATUSES)
+            .order_by()
+            .values(
+                'id', 'series', 'patient', 'dentist', 'date', 'start_time', 'patient__first_name',
+                'patient__email', 'patient__phone', 'dentist__last_name',
+            )
+        )
+        occurrences = [
+            row for row in series_occurrences(AppointmentSeries.objects.filter(tenant=tenant), start.date(), end.date())
+            if start < datetime.combine(row['date'], row['start_time']) <= end
+        ]
+        if occurrences:
+            people = User.objects.filter(
+                pk__in={row['patient'] for row in occurrences} | {row['dentist'] for row in occurrences}
+            ).in_bulk()
+            for row in occurrences:
+                patient, dentist = people.get(row['patient']), people.get(row['dentist'])
+                visits.append({
+                    **row, 'patient__first_name': getattr(patient, 'first_name', ''),
+                    'patient__email': getattr(patient, 'email', ''), 'patient__phone': getattr(patient, 'phone', ''),
+                    'dentist__last_name': getattr(dentist, 'last_name', ''),
+                })
+
+        reminders = []
+        for visit in visits:
+            contacts = {'sms': visit['patient__phone'], 'email': visit['patient__email']}
+            for channel in self.transports:
+                if not contacts.get(channel):
+                    continue
+                delivery = ReminderDelivery(
+                    tenant=tenant, channel=channel, recipient=contacts[channel],
+                    key=reminder_key(visit['patient'], visit['dentist'], visit['date'], visit['start_time'], channel),
+                    appointment_id=visit['id'], series_id=visit['series'],
+                )
+                reminders.append(Reminder(delivery, contacts[channel], *self.message(tenant, visit)))
+        return reminders
+
+    def message(self, tenant, visit):
+        """
+        (subject, body) of the reminder of `visit`.
+        """
+        greeting = ' '.join(filter(None, ['Hello', visit['patient__first_name']]))
+        dentist = f" with Dr {visit['dentist__last_name']}" if visit['dentist__last_name'] else ''
+        body = (
+            f"{greeting}, this is a reminder of your appointment{dentist} at {tenant.name} "
+            f"on {visit['date']:%d/%m/%Y} at {visit['start_time']:%H:%M}."
+        )
+        return f"Appointment reminder - {tenant.name}", body
+
+    def claim(self, tenant, reminders, now):
+        """
+        Record the reminders in the ledger and return those this run may send:
+        not sent yet, under MAX_ATTEMPTS and not claimed by a live run.
+        """
+        if not reminders:
+            return []
+        by_key = {reminder.delivery.key: reminder for reminder in reminders}
+        known = set(ReminderDelivery.objects.filter(tenant=tenant, key__in=by_key).values_list('key', flat=True))
+        ReminderDelivery.objects.bulk_create(
+            [reminder.delivery for key, reminder in by_key.items() if key not in known], ignore_conflicts=True,
+        )
+        claim = uuid.uuid4()
+        claimed = (
+            ReminderDelivery.objects
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - self.claim_timeout))
+            .filter(tenant=tenant, key__in=by_key, status__in=('pending', 'failed'), attempts__lt=self.max_attempts)
+            .update(claim=claim, claimed_at=now)
+        )
+        if not claimed:
+            return []
+        return [
+            by_key[delivery.key]._replace(delivery=delivery)
+            for delivery in ReminderDelivery.objects.filter(tenant=tenant, claim=claim)
+        ]
+
+    def record(self, tenant, reminders, results, now):
+        """
+        Store the outcome of a sent batch and release its claim; returns the number sent.
+        """
+        alias = shard_for(tenant)
+        activate_tenant(tenant, using=alias)
+        # Rows of a batch only differ by provider id or error: one UPDATE per distinct value rather
+        # than a bulk_update, whose CASE per row and column costs more than the whole batch. Providers
+        # that return message ids (SMS) make that an UPDATE per sent row; email is a single one.
+        sent, failed = {}, {}
+        for reminder, (provider_id, error) in zip(reminders, results):
+            reminder.delivery.provider_id = provider_id or ''
+            if error:
+                failed.setdefault(error, []).append(reminder.delivery.pk)
+            else:
+                sent.setdefault(reminder.delivery.provider_id, []).append(reminder.delivery.pk)
+        with use_shard(alias):
+            deliveries = ReminderDelivery.objects.filter(tenant=tenant)
+            release = {'attempts': F('attempts') + 1, 'claim': None, 'claimed_at': None}
+            for provider_id, pks in sent.items():
+                deliveries.filter(pk__in=pks).update(
+                    status='sent', sent_at=now, error='', provider_id=provider_id, **release,
+                )
+            for error, pks in failed.items():
+                deliveries.filter(pk__in=pks).update(status='failed', error=error, **release)
+        successes = sum(len(pks) for pks in sent.values())
+        failures = sum(len(pks) for pks in failed.values())
+        self.sent.inc(successes)
+        self.failed.inc(failures)
+        return successes
+
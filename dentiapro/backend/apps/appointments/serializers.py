@@ -1,11 +1,15 @@
 from rest_framework import serializers
-from .models import Appointment
+from .models import Appointment, AppointmentSeries
+from .recurrence import RecurrenceRule
 
 class AppointmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
-        fields = ['id', 'tenant', 'patient', 'dentist', 'date', 'start_time', 'end_time', 'status', 'notes', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = [
+            'id', 'tenant', 'patient', 'dentist', 'date', 'start_time', 'end_time', 'status', 'notes',
+            'series', 'original_date', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['created_at', 'updated_at', 'series', 'original_date']
         extra_kwargs = {
             'status': {'required': True},
         }
@@ -25,9 +29,85 @@ class AppointmentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Appointment time must be in the future.")
         return value
 
+    def validate(self, data):
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time is not None and end_time is not None and end_time <= start_time:
+            raise serializers.ValidationError({'end_time': "Must be after the start time."})
+        return data
+
     def validate_status(self, value):
         """Custom validation for appointment status."""
         valid_statuses = ['scheduled', 'confirmed', 'in_progress', 'completed', 'cancelled']
         if value not in valid_statuses:
             raise serializers.ValidationError(f"Invalid status. Valid statuses are {', '.join(valid_statuses)}.")
         return value
+
+
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AppointmentSeries
+        fields = [
+            'id', 'tenant', 'patient', 'dentist', 'start_date', 'start_time', 'end_time', 'rule', 'last_date', 'notes',
+            'created_at', 'updated_at',
+        ]
+        read_only_fields = ['tenant', 'last_date', 'created_at', 'updated_at']
+
+    def validate_rule(self, value):
+        try:
+            return str(RecurrenceRule.parse(value))
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+    def validate(self, data):
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if end_time <= start_time:
+            raise serializers.ValidationError({'end_time': "Must be after the start time."})
+        rule = data.get('rule', getattr(self.instance, 'rule', None))
+        start_date = data.get('start_date', getattr(self.instance, 'start_date', None))
+        try:
+            RecurrenceRule.parse(rule).last_date(start_date)
+        except ValueError as exc:
+            raise serializers.ValidationError({'rule': str(exc)})
+        return data
+
+
+class DateRangeQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the calendar: ?from=&to=[&dentist=1,2]
+    """
+    MAX_DAYS = 92
+
+    from_ = serializers.DateField()
+    to = serializers.DateField()
+    dentist = serializers.CharField(required=False, help_text="Comma-separated dentist ids.")
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields['from'] = fields.pop('from_')  # `from` is a keyword
+        return fields
+
+    def validate_dentist(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise serializers.ValidationError("Expected comma-separated dentist ids.")
+
+    def validate(self, data):
+        if data['to'] < data['from']:
+            raise serializers.ValidationError({'to': "Must not be before `from`."})
+        if (data['to'] - data['from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({'to': f"The window is limited to {self.MAX_DAYS} days."})
+        return data
+
+
+class AvailabilityQuerySerializer(DateRangeQuerySerializer):
+    """
+    Query parameters of the availability search: ?from=&to=&duration=[&step=][&dentist=1,2][&limit=]
+    """
+    duration = serializers.IntegerField(min_value=5, max_value=480, help_text="Minutes.")
+    step = serializers.IntegerField(
+        min_value=5, max_value=480, required=False, help_text="Minutes between slot starts (default: duration).",
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=5000, default=500)
@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AppointmentViewSet
+from .views import AppointmentSeriesViewSet, AppointmentViewSet
 
 router = DefaultRouter()
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
+router.register(r'appointment-series', AppointmentSeriesViewSet, basename='appointment-series')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,22 +1,179 @@
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, permissions
-from .models import Appointment
-from .serializers import AppointmentSerializer
-from core.utils import TenantViewSet
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from .availability import find_free_slots
+from .calendar import calendar_rows
+from .conflicts import booking_guard, ensure_available, ensure_series_available
+from .models import Appointment, AppointmentSeries
+from .serializers import (
+    AppointmentSerializer, AppointmentSeriesSerializer, AvailabilityQuerySerializer, DateRangeQuerySerializer,
+)
+from core.export import StreamingExportMixin
+from core.utils import AsyncTenantViewSet, TenantViewSet
 
-class AppointmentViewSet(TenantViewSet):
+
+def filter_by_role(queryset, user):
+    """
+    Patients only see their own appointments, dentists their own calendar.
+    """
+    if user.role == 'patient':
+        return queryset.filter(patient=user)
+    elif user.role == 'dentist':
+        return queryset.filter(dentist=user)
+    return queryset
+
+
+def check_availability(tenant, serializer):
+    """
+    Reject a booking overlapping another one of the dentist with a 409.
+    The exclusion constraint backs this up when two requests race.
+    """
+    instance = serializer.instance
+    values = {
+        name: serializer.validated_data.get(name, getattr(instance, name, None))
+        for name in ('dentist', 'date', 'start_time', 'end_time', 'status')
+    }
+    ensure_available(
+        tenant, values['dentist'].pk, values['date'], values['start_time'], values['end_time'],
+        exclude=getattr(instance, 'pk', None), status=values['status'],
+    )
+
+
+def booked_dentists(serializer):
+    """
+    Ids of the dentist a booking or series is being saved for, for booking_guard().
+    """
+    dentist = serializer.validated_data.get('dentist') or getattr(serializer.instance, 'dentist', None)
+    return [dentist.pk] if dentist is not None else []
+
+
+def check_series_availability(tenant, serializer):
+    """
+    Reject a series whose occurrences overlap other bookings with a 409.
+    Series are only checked when created or rescheduled: the exclusion
+    constraint cannot see their occurrences.
+    """
+    instance = serializer.instance
+    values = {
+        name: serializer.validated_data.get(name, getattr(instance, name, None))
+        for name in ('dentist', 'start_date', 'start_time', 'end_time', 'rule')
+    }
+    if instance is not None and all(value == getattr(instance, name) for name, value in values.items()):
+        return
+    ensure_series_available(tenant, AppointmentSeries(pk=getattr(instance, 'pk', None), tenant=tenant, **values))
+
+
+class AppointmentViewSet(StreamingExportMixin, AsyncTenantViewSet):
+    queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_pagination = True
+    fast_list = True
+    cache_responses = True
+    replica_actions = ('list', 'retrieve', 'export', 'calendar')
 
     def get_queryset(self):
         """
         Return appointments filtered by the tenant of the authenticated user,
         and filter based on the user's role (patient, dentist, etc.).
         """
-        queryset = super().get_queryset()
-        
-        # Role-based filtering
-        if self.request.user.role == 'patient':
-            return queryset.filter(patient=self.request.user)
-        elif self.request.user.role == 'dentist':
-            return queryset.filter(dentist=self.request.user)
-        return queryset
+        return filter_by_role(super().get_queryset(), self.request.user)
+
+    def perform_create(self, serializer):
+        with booking_guard(self.request.tenant, booked_dentists(serializer)):
+            check_availability(self.request.tenant, serializer)
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with booking_guard(self.request.tenant, booked_dentists(serializer)):
+            check_availability(self.request.tenant, serializer)
+            super().perform_update(serializer)
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request, *args, **kwargs):
+        """
+        Free slots of `duration` minutes per dentist between `from` and `to`,
+        in chronological order; slots already past are left out.
+        """
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        dentist_ids = params.get('dentist')
+        if request.user.role == 'dentist':
+            dentist_ids = [request.user.pk]
+        slots = find_free_slots(
+            request.tenant, params['from'], params['to'], params['duration'], step=params.get('step'),
+            dentist_ids=dentist_ids, earliest=timezone.localtime().replace(tzinfo=None), limit=params['limit'],
+        )
+        return Response([
+            {'dentist': slot.dentist_id, 'date': slot.date, 'start_time': slot.start_time, 'end_time': slot.end_time}
+            for slot in slots
+        ])
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request, *args, **kwargs):
+        """
+        Appointments between `from` and `to` in time order, of the given
+        dentists or the whole clinic (within what the user's role may see).
+        Occurrences of series that were not materialized have no id.
+        """
+        params = DateRangeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        series = filter_by_role(AppointmentSeries.objects.filter(tenant=request.tenant), request.user)
+        return Response(calendar_rows(self.get_queryset(), series, params['from'], params['to'], params.get('dentist')))
+
+
+class AppointmentSeriesViewSet(TenantViewSet):
+    """
+    Recurring appointments. Occurrences are read through the appointments
+    calendar; changing one materializes it as an appointment.
+    """
+    queryset = AppointmentSeries.objects.all()
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return filter_by_role(super().get_queryset(), self.request.user)
+
+    def perform_create(self, serializer):
+        with booking_guard(self.request.tenant, booked_dentists(serializer)):
+            check_series_availability(self.request.tenant, serializer)
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with booking_guard(self.request.tenant, booked_dentists(serializer)):
+            check_series_availability(self.request.tenant, serializer)
+            super().perform_update(serializer)
+
+    @action(detail=True, methods=['patch'], url_path=r'occurrences/(?P<occurrence_date>[0-9]{4}-[0-9]{2}-[0-9]{2})')
+    def occurrence(self, request, occurrence_date, *args, **kwargs):
+        """
+        Change (e.g. move or cancel) the occurrence of `occurrence_date`.
+        The first change stores it as an appointment; the response is that
+        appointment, which can then be changed like any other.
+        """
+        series = self.get_object()
+        day = parse_date(occurrence_date)
+        if day is None or day not in series.dates(day, day):
+            raise NotFound("The series has no occurrence on that date.")
+        # Moving the occurrence to another dentist checks (and so locks) that one's bookings too. All
+        # locks are taken at once, in id order, so the id comes from the request before validation.
+        dentist_ids = [series.dentist_id]
+        if str(request.data.get('dentist', '')).isdigit():
+            dentist_ids.append(int(request.data['dentist']))
+        with booking_guard(request.tenant, dentist_ids):
+            appointment, _ = Appointment.objects.get_or_create(series=series, original_date=day, defaults={
+                'tenant': series.tenant, 'patient': series.patient, 'dentist': series.dentist, 'date': day,
+                'start_time': series.start_time, 'end_time': series.end_time, 'notes': series.notes,
+            })
+            serializer = AppointmentSerializer(
+                appointment, data=request.data, partial=True, context=self.get_serializer_context(),
+            )
+            serializer.is_valid(raise_exception=True)
+            check_availability(request.tenant, serializer)
+            serializer.save()
+        return Response(serializer.data)
@@ -25,4 +25,7 @@ class Invoice(models.Model):
 
     class Meta:
         db_table = 'invoices'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', '-created_at', '-id']),  # Keyset pagination
+        ]
\ No newline at end of file
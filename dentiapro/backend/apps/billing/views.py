@@ -1,11 +1,15 @@
 from rest_framework import viewsets, permissions
 from .models import Invoice
 from .serializers import InvoiceSerializer
-from core.utils import TenantViewSet
+from core.export import StreamingExportMixin
+from core.utils import AuditMixin, TenantViewSet
 
-class InvoiceViewSet(TenantViewSet):
+class InvoiceViewSet(AuditMixin, StreamingExportMixin, TenantViewSet):
+    queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_pagination = True
+    fast_list = True
 
     def get_queryset(self):
         """
@@ -6,9 +6,13 @@ from core.utils import TenantViewSet
 class InventoryItemViewSet(TenantViewSet):
     serializer_class = InventoryItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cache_responses = True
+    response_cache_per_user = False
+    response_cache_dependencies = (Category,)
+    fast_list = True
 
     def get_queryset(self):
-        return InventoryItem.objects.filter(tenant=self.request.tenant).select_related('category')
+        return InventoryItem.objects.filter(tenant=self.request.tenant)
 
     def perform_create(self, serializer):
         serializer.save(tenant=self.request.tenant)
@@ -16,6 +20,8 @@ class InventoryItemViewSet(TenantViewSet):
 class CategoryViewSet(TenantViewSet):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    cache_responses = True
+    response_cache_per_user = False
 
     def get_queryset(self):
         return Category.objects.filter(tenant=self.request.tenant)
@@ -16,6 +16,9 @@ class MedicalRecord(models.Model):
     class Meta:
         db_table = 'medical_records'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', '-created_at', '-id']),  # Keyset pagination
+        ]
         verbose_name = 'Medical Record'
         verbose_name_plural = 'Medical Records'
 
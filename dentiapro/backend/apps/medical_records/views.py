@@ -1,12 +1,17 @@
 from rest_framework import viewsets, permissions
 from .models import MedicalRecord
 from .serializers import MedicalRecordSerializer
-from core.utils import TenantViewSet
+from apps.users.models import User
+from core.export import StreamingExportMixin
+from core.utils import AuditMixin, AsyncTenantViewSet
 
 
-class MedicalRecordViewSet(TenantViewSet):
+class MedicalRecordViewSet(AuditMixin, StreamingExportMixin, AsyncTenantViewSet):
+    queryset = MedicalRecord.objects.all()
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_pagination = True
+    response_cache_dependencies = (User,)  # patient/dentist are rendered by name
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -26,3 +31,4 @@ class MedicalRecordViewSet(TenantViewSet):
     def perform_create(self, serializer):
         """Set tenant and validate roles during creation"""
         serializer.save(tenant=self.request.user.tenant)
+        self.audit_rows([serializer.instance])
@@ -1,11 +1,14 @@
 from rest_framework import viewsets, permissions
 from .models import Prescription
 from .serializers import PrescriptionSerializer
+from apps.users.models import User
 from core.utils import TenantViewSet
 
 class PrescriptionViewSet(TenantViewSet):
+    queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    response_cache_dependencies = (User,)  # patient/dentist are rendered by name
 
     def get_queryset(self):
         """
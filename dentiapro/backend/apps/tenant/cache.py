@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core import metrics
+from .models import Tenant
+from .schema import public_schema
+
+DEFAULT_TENANT_CACHE = {
+    'MAX_SIZE': 1024,       # Entries kept in the per-process LRU
+    'TTL': 300,             # Seconds an entry stays valid in the per-process LRU
+    'SHARED_ALIAS': None,   # Optional CACHES alias used as a shared tier across workers
+    'SHARED_TTL': 3600,     # Seconds an entry stays valid in the shared tier
+}
+
+
+class TenantCache:
+    """
+    Two-tier cache for resolved tenants.
+
+    The first tier is a per-process LRU with a TTL, the second an optional
+    shared Django cache so a freshly started worker does not have to go to
+    Postgres for every tenant. Entries are dropped from both tiers by the
+    post_save/post_delete receivers in `apps.tenant.signals`.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, shared_alias=None, shared_ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._keys_by_tenant = {}
+        self._lock = threading.Lock()
+
+        self.hits = metrics.counter('tenant_cache_hits', 'Tenant lookups served from the process cache')
+        self.shared_hits = metrics.counter('tenant_cache_shared_hits', 'Tenant lookups served from the shared cache')
+        self.misses = metrics.counter('tenant_cache_misses', 'Tenant lookups that went to the database')
+        self.invalidations = metrics.counter('tenant_cache_invalidations', 'Tenant cache invalidations')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_TENANT_CACHE, **getattr(settings, 'TENANT_CACHE', {})}
+        return cls(
+            max_size=options['MAX_SIZE'],
+            ttl=options['TTL'],
+            shared_alias=options['SHARED_ALIAS'],
+            shared_ttl=options['SHARED_TTL'],
+        )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    @staticmethod
+    def make_key(kind, value):
+        return f'tenant:{kind}:{value}'
+
+    def get_tenant(self, tenant_id):
+        """
+        Return the tenant with the given primary key.
+        Raises Tenant.DoesNotExist if there is no such tenant.
+        """
+        def load():
+            with public_schema():
+                return Tenant.objects.get(id=tenant_id)
+        return self.get_or_load('id', tenant_id, load)
+
+    def get_or_load(self, kind, value, loader):
+        """
+        Return the tenant cached under (kind, value), calling `loader` on a miss.
+        Loader exceptions (e.g. Tenant.DoesNotExist) propagate and nothing is cached.
+        """
+        key = self.make_key(kind, value)
+
+        tenant = self._get_local(key)
+        if tenant is not None:
+            self.hits.inc()
+            return tenant
+
+        shared = self.shared
+        if shared is not None:
+            tenant = shared.get(key)
+            if tenant is not None:
+                self.shared_hits.inc()
+                self._set_local(key, tenant)
+                return tenant
+
+        self.misses.inc()
+        tenant = loader()
+        self.set(kind, value, tenant)
+        return tenant
+
+    def set(self, kind, value, tenant):
+        key = self.make_key(kind, value)
+        self._set_local(key, tenant)
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, tenant, self.shared_ttl)
+
+    def invalidate(self, tenant_id):
+        """
+        Drop every entry resolving to `tenant_id` from both tiers.
+        """
+        with self._lock:
+            keys = self._keys_by_tenant.pop(tenant_id, set())
+            for key in keys:
+                self._entries.pop(key, None)
+        keys.add(self.make_key('id', tenant_id))
+
+        shared = self.shared
+        if shared is not None:
+            shared.delete_many(list(keys))
+        self.invalidations.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tenant.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'size': size,
+            'hits': self.hits.value,
+            'shared_hits': self.shared_hits.value,
+            'misses': self.misses.value,
+            'invalidations': self.invalidations.value,
+        }
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            tenant, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key, tenant)
+                return None
+            self._entries.move_to_end(key)
+            return tenant
+
+    def _set_local(self, key, tenant):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._drop(key, previous[0])
+            self._entries[key] = (tenant, time.monotonic() + self.ttl)
+            self._keys_by_tenant.setdefault(tenant.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                oldest_key, (oldest, _) = self._entries.popitem(last=False)
+                self._forget(oldest_key, oldest)
+
+    def _drop(self, key, tenant):
+        self._entries.pop(key, None)
+        self._forget(key, tenant)
+
+    def _forget(self, key, tenant):
+        keys = self._keys_by_tenant.get(tenant.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tenant[tenant.pk]
+
+
+_tenant_cache = None
+_tenant_cache_lock = threading.Lock()
+
+
+def get_tenant_cache():
+    """
+    Return the process-wide TenantCache, built from settings.TENANT_CACHE on first use.
+    """
+    global _tenant_cache
+    if _tenant_cache is None:
+        with _tenant_cache_lock:
+            if _tenant_cache is None:
+                _tenant_cache = TenantCache.from_settings()
+    return _tenant_cache
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, transaction
+
+from apps.appointments.constraints import BTREE_GIST, CONSTRAINT_STATEMENTS, EXCLUSION_CONSTRAINT
+from apps.tenant.schema import activate_public, activate_schema, public_schema
+from .migrate_tenants import checkpoint_key, get_schemas
+
+FIND_OVERLAPS = """
+SELECT a.tenant_id, a.dentist_id, a.id, b.id
+FROM appointments a
+JOIN appointments b ON b.tenant_id = a.tenant_id AND b.dentist_id = a.dentist_id AND b.date = a.date
+    AND b.id > a.id AND b.start_time < a.end_time AND b.end_time > a.start_time
+WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+ORDER BY a.tenant_id, a.dentist_id, a.id
+LIMIT 20
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the `slot` range column and the exclusion constraint that stops two active appointments "
+        "of a dentist from overlapping, in the provisioning template and every tenant schema of every "
+        "shard. Idempotent. Schemas with overlapping appointments are listed and left without the "
+        "constraint until those are resolved. Postgres only; elsewhere only the application check applies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help="Only this shard (default: every shard).")
+        parser.add_argument(
+            '--schema', action='append', dest='schemas', metavar='SCHEMA',
+            help="Only this schema (repeatable; default: the template and every tenant schema).",
+        )
+
+    def handle(self, *args, **options):
+        schemas = [
+            (alias, schema_name) for alias, schema_name in get_schemas()
+            if (not options['database'] or alias == options['database'])
+            and (not options['schemas'] or schema_name in options['schemas'])
+        ]
+        failures = {}
+        done = 0
+        for alias in dict.fromkeys(alias for alias, _ in schemas):
+            shard_schemas = [schema_name for schema_alias, schema_name in schemas if schema_alias == alias]
+            connection = connections[alias]
+            if connection.vendor != 'postgresql':
+                self.stdout.write(f"Skipped '{alias}': exclusion constraints need Postgres.")
+                continue
+            with public_schema(alias), connection.cursor() as cursor:
+                cursor.execute(BTREE_GIST)
+            try:
+                for schema_name in shard_schemas:
+                    overlaps = self.constrain(alias, schema_name)
+                    if overlaps:
+                        failures[checkpoint_key(alias, schema_name)] = overlaps
+                    else:
+                        done += 1
+                        if options['verbosity'] > 1:
+                            self.stdout.write(f"{checkpoint_key(alias, schema_name)}: constraint in place")
+            finally:
+                activate_public(alias)
+
+        if failures:
+            raise CommandError(
+                f"Constraint {EXCLUSION_CONSTRAINT} is in place in {done} schemas; in {len(failures)} others "
+                f"appointments overlap. Cancel or move them first, then run the command again:\n" + '\n'.join(
+                    f"  {key}, tenant {tenant}, dentist {dentist}: appointments {first} and {second}"
+                    for key, overlaps in failures.items() for tenant, dentist, first, second in overlaps
+                )
+            )
+        self.stdout.write(f"Constraint {EXCLUSION_CONSTRAINT} is in place in {done} schemas.")
+
+    def constrain(self, alias, schema_name):
+        """
+        Add the column and the constraint to one schema; returns the overlaps preventing it, if any.
+        """
+        connection = connections[alias]
+        activate_schema(schema_name, using=alias)
+        try:
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                for statement in CONSTRAINT_STATEMENTS:
+                    cursor.execute(statement)
+        except IntegrityError:
+            with connection.cursor() as cursor:
+                cursor.execute(FIND_OVERLAPS)
+                return cursor.fetchall()
+        return []
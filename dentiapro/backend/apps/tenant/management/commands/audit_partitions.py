@@ -0,0 +1,124 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from apps.tenant.models import AuditEvent
+from apps.tenant.schema import public_schema
+
+# Mirrors AuditEvent. Partitioned tables need the partition key in every
+# unique constraint, hence (id, occurred_at) and (event_id, occurred_at).
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS audit_events (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    event_id uuid NOT NULL,
+    occurred_at timestamptz NOT NULL,
+    tenant_id bigint NULL,
+    user_id bigint NULL,
+    action varchar(20) NOT NULL,
+    model varchar(100) NOT NULL,
+    object_ids jsonb NULL,
+    method varchar(10) NOT NULL,
+    path text NOT NULL,
+    status_code smallint NOT NULL CHECK (status_code >= 0),
+    ip inet NULL,
+    PRIMARY KEY (id, occurred_at),
+    UNIQUE (event_id, occurred_at)
+) PARTITION BY RANGE (occurred_at)
+"""
+CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS audit_events_tenant_model_idx ON audit_events (tenant_id, model, occurred_at)"
+)
+APPEND_ONLY = [
+    """
+    CREATE OR REPLACE FUNCTION audit_events_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'audit_events is append-only';
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS audit_events_append_only ON audit_events",
+    """
+    CREATE TRIGGER audit_events_append_only BEFORE UPDATE OR DELETE ON audit_events
+    FOR EACH ROW EXECUTE FUNCTION audit_events_append_only()
+    """,
+]
+
+# Earlier versions created a DEFAULT partition. Postgres refuses to create a
+# month's partition once the default holds rows of that month, so it is
+# folded into monthly partitions and dropped; partitions are created months
+# ahead instead. A batch for a month without a partition fails and is
+# spooled by the writer until the partition exists.
+DEFAULT_PARTITION = 'audit_events_default'
+
+
+def month_start(day, offset=0):
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(start):
+    return f'audit_events_{start:%Y_%m}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the append-only audit_events table, partitioned by month, and the partitions of the "
+        "current and coming months. Run it from a monthly cron job; it is idempotent, and partitions "
+        "are created a year ahead by default so late runs do no harm. On databases other than "
+        "Postgres a plain table is created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database alias (default: %(default)s).")
+        parser.add_argument(
+            '--months', type=int, default=12, help="Months to create partitions for, starting now (default: 12).",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        with public_schema(options['database']):
+            if connection.vendor != 'postgresql':
+                if AuditEvent._meta.db_table not in connection.introspection.table_names():
+                    with connection.schema_editor() as editor:
+                        editor.create_model(AuditEvent)
+                    self.stdout.write(f"Created {AuditEvent._meta.db_table} (not partitioned: not Postgres).")
+                return
+
+            with transaction.atomic(using=options['database']), connection.cursor() as cursor:
+                cursor.execute(CREATE_TABLE)
+                cursor.execute(CREATE_INDEX)
+                for statement in APPEND_ONLY:
+                    cursor.execute(statement)
+                self.drop_default_partition(cursor)
+                today = date.today()
+                for offset in range(options['months']):
+                    self.create_partition(cursor, month_start(today, offset))
+
+    def create_partition(self, cursor, start):
+        end = month_start(start, 1)
+        name = partition_name(start)
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF audit_events "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        self.stdout.write(f"Partition {name}: {start} to {end}")
+
+    def drop_default_partition(self, cursor):
+        """
+        Move the rows of the DEFAULT partition of earlier versions to monthly
+        partitions and drop it. Detached, it is a plain table: its rows are
+        inserted again through audit_events (the append-only trigger only
+        refuses updates and deletes).
+        """
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [DEFAULT_PARTITION])
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(f"ALTER TABLE audit_events DETACH PARTITION {DEFAULT_PARTITION}")
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', occurred_at)::date FROM {DEFAULT_PARTITION}")
+        for start, in cursor.fetchall():
+            self.create_partition(cursor, start)
+        cursor.execute(f"INSERT INTO audit_events SELECT * FROM {DEFAULT_PARTITION}")
+        moved = cursor.rowcount
+        cursor.execute(f"DROP TABLE {DEFAULT_PARTITION}")
+        self.stdout.write(f"Moved {moved} rows out of {DEFAULT_PARTITION} and dropped it.")
@@ -0,0 +1,135 @@
+import random
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.appointments.availability import AvailabilityIndex, merge, subtract, to_minutes, to_time
+
+# Monday to Friday, with a lunch break.
+WORKING_HOURS = ((dt_time(9), dt_time(12, 30)), (dt_time(13, 30), dt_time(18)))
+DURATIONS = (15, 30, 30, 45, 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time free-slot searches (apps.appointments.availability) over synthetic in-memory bookings: "
+        "the interval index against a scan of each dentist's whole booking history, for growing "
+        "histories. The database is not used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dentists', type=int, default=50, help="Dentists (default: %(default)s).")
+        parser.add_argument('--years', type=int, nargs='+', default=[1, 2, 5], help="Booking history lengths.")
+        parser.add_argument('--days', type=int, nargs='+', default=[7, 31], help="Search windows, in days.")
+        parser.add_argument('--duration', type=int, default=30, help="Slot length in minutes.")
+        parser.add_argument('--fill', type=float, default=0.7, help="Share of working time booked.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best one is kept.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['fill'] < 1:
+            raise CommandError("--fill must be in [0, 1).")
+        self.stdout.write(f"{options['dentists']} dentists, {options['fill']:.0%} booked")
+        self.stdout.write(
+            f"  {'years':>5}  {'bookings':>9}  {'days':>4}  {'slots':>6}  {'index':>10}  {'scan':>10}  {'speedup':>7}"
+        )
+        for years in options['years']:
+            today = date.today()
+            bookings = make_bookings(
+                options['dentists'], today - timedelta(days=365 * years), today, options['fill'],
+                random.Random(options['seed']),
+            )
+            for days in options['days']:
+                end = today + timedelta(days=days - 1)
+                window = [row for row in bookings if today <= row[1] <= end]
+
+                def indexed():
+                    # What the API does: load the window's bookings into an index and sweep it.
+                    index = make_index(options['dentists'], window)
+                    return index.free_slots(today, end, options['duration'])
+
+                slots = indexed()
+                if naive_slots(options['dentists'], bookings, today, end, options['duration']) != slots:
+                    raise CommandError("The index and the scan disagree.")
+                fast = best_of(options['repeat'], indexed)
+                slow = best_of(options['repeat'], lambda: naive_slots(
+                    options['dentists'], bookings, today, end, options['duration'],
+                ))
+                self.stdout.write(
+                    f"  {years:>5}  {len(bookings):>9}  {days:>4}  {len(slots):>6}  "
+                    f"{fast * 1000:>8.1f}ms  {slow * 1000:>8.1f}ms  {slow / fast:>6.1f}x"
+                )
+
+
+def make_bookings(dentists, start, end, fill, rng):
+    """
+    (dentist id, date, start time, end time) rows filling about `fill` of
+    every dentist's working hours, from start to end plus a booked-ahead month.
+    """
+    rows = []
+    day = start
+    while day <= end + timedelta(days=31):
+        if day.weekday() < 5:
+            for dentist_id in range(1, dentists + 1):
+                for opens, closes in WORKING_HOURS:
+                    cursor, closing = to_minutes(opens), to_minutes(closes)
+                    while True:
+                        length = rng.choice(DURATIONS)
+                        if cursor + length > closing:
+                            break
+                        if rng.random() < fill:
+                            rows.append((dentist_id, day, to_time(cursor), to_time(cursor + length)))
+                        cursor += length
+        day += timedelta(days=1)
+    return rows
+
+
+def make_index(dentists, bookings):
+    index = AvailabilityIndex()
+    for dentist_id in range(1, dentists + 1):
+        for weekday in range(5):
+            for opens, closes in WORKING_HOURS:
+                index.add_working_hours(dentist_id, weekday, opens, closes)
+    for row in bookings:
+        index.add_booking(*row)
+    return index
+
+
+def naive_slots(dentists, bookings, start, end, duration):
+    """
+    Reference search without an index: one pass over the whole booking history per day.
+    """
+    hours = [(to_minutes(opens), to_minutes(closes)) for opens, closes in WORKING_HOURS]
+    slots = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            booked = {}
+            for dentist_id, booked_on, start_time, end_time in bookings:
+                if booked_on == day:
+                    booked.setdefault(dentist_id, []).append((to_minutes(start_time), to_minutes(end_time)))
+            day_slots = []
+            for dentist_id in range(1, dentists + 1):
+                busy = merge(booked.get(dentist_id, ()))
+                for free_start, free_end in subtract(hours, busy):
+                    slot_start = -(-free_start // duration) * duration
+                    while slot_start + duration <= free_end:
+                        day_slots.append((slot_start, dentist_id))
+                        slot_start += duration
+            day_slots.sort()
+            slots.extend(
+                (dentist_id, day, to_time(slot_start), to_time(slot_start + duration))
+                for slot_start, dentist_id in day_slots
+            )
+        day += timedelta(days=1)
+    return slots
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
@@ -0,0 +1,130 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.appointments.calendar import calendar_queryset
+from apps.appointments.models import Appointment
+
+TABLE = 'bench_appointments'
+FIRST_DAY = date(2022, 1, 3)
+SLOTS_PER_DAY = 8
+
+# Appointment rows spread evenly over tenants, dentists and working days.
+FILL = f"""
+INSERT INTO {TABLE} (id, tenant_id, patient_id, dentist_id, date, start_time, end_time, status, notes,
+                     created_at, updated_at)
+SELECT g,
+       1 + g %% %(tenants)s,
+       1 + g %% 100000,
+       1 + g %% (%(tenants)s * %(dentists)s),
+       %(first_day)s::date + (g / (%(tenants)s * %(dentists)s) / {SLOTS_PER_DAY})::int,
+       time '08:00' + (g / (%(tenants)s * %(dentists)s) %% {SLOTS_PER_DAY}) * interval '1 hour',
+       time '08:45' + (g / (%(tenants)s * %(dentists)s) %% {SLOTS_PER_DAY}) * interval '1 hour',
+       CASE WHEN g %% 10 = 0 THEN 'cancelled' ELSE 'scheduled' END,
+       '', now(), now()
+FROM generate_series(%(start)s, %(stop)s) AS g
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an unlogged copy of the appointments table with synthetic rows and EXPLAIN ANALYZE the "
+        "calendar queries (apps.appointments.calendar) before and after creating the model's indexes. "
+        "Fails unless each query is answered from its covering index. Postgres only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database alias (default: %(default)s).")
+        parser.add_argument('--rows', type=int, default=10_000_000, help="Synthetic appointments.")
+        parser.add_argument('--tenants', type=int, default=200)
+        parser.add_argument('--dentists', type=int, default=10, help="Dentists per tenant.")
+        parser.add_argument('--keep', action='store_true', help=f"Keep the {TABLE} table afterwards.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError("The benchmark needs Postgres.")
+
+        dentist_count = options['tenants'] * options['dentists']
+        days = options['rows'] // dentist_count // SLOTS_PER_DAY
+        # A dentist's week and the clinic's day, in the middle of the history.
+        middle = FIRST_DAY + timedelta(days=days // 2)
+        queries = {
+            'dentist week': (
+                calendar_queryset(self.appointments(1), middle, middle + timedelta(days=6), [1 + options['tenants']]),
+                'appointments_dentist_cal_idx',
+            ),
+            'clinic day': (calendar_queryset(self.appointments(1), middle, middle), 'appointments_clinic_cal_idx'),
+        }
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(f"CREATE UNLOGGED TABLE {TABLE} (LIKE {Appointment._meta.db_table})")
+            cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+            # The index the table had before the calendar indexes.
+            cursor.execute(f"CREATE INDEX ON {TABLE} (tenant_id, patient_id, dentist_id, status)")
+            started = time.monotonic()
+            for start in range(1, options['rows'] + 1, 1_000_000):
+                cursor.execute(FILL, {
+                    'tenants': options['tenants'], 'dentists': options['dentists'], 'first_day': FIRST_DAY,
+                    'start': start, 'stop': min(start + 999_999, options['rows']),
+                })
+            cursor.execute(f"VACUUM ANALYZE {TABLE}")
+            self.stdout.write(f"{options['rows']} rows over {days} days in {time.monotonic() - started:.0f}s")
+
+            try:
+                self.stdout.write("Without the calendar indexes:")
+                for name, (queryset, _) in queries.items():
+                    self.report(name, self.explain(cursor, queryset))
+
+                started = time.monotonic()
+                with connection.schema_editor() as editor:
+                    for index in Appointment._meta.indexes:
+                        if index.name in {expected for _, expected in queries.values()}:
+                            cursor.execute(self.bench_sql(str(index.create_sql(Appointment, editor))))
+                cursor.execute(f"VACUUM ANALYZE {TABLE}")
+                self.stdout.write(f"With the calendar indexes (built in {time.monotonic() - started:.0f}s):")
+                for name, (queryset, expected) in queries.items():
+                    plan = self.explain(cursor, queryset)
+                    self.report(name, plan)
+                    scans = [node for node in plan_nodes(plan['Plan']) if 'Index Name' in node]
+                    if not any(node['Index Name'] == f'bench_{expected}' for node in scans):
+                        raise CommandError(f"{name}: the plan does not use {expected}.")
+                    if not all(node['Node Type'] == 'Index Only Scan' for node in scans):
+                        raise CommandError(f"{name}: not an index-only scan, the index does not cover the query.")
+            finally:
+                if not options['keep']:
+                    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def appointments(self, tenant_id):
+        return Appointment.objects.filter(tenant_id=tenant_id)
+
+    def bench_sql(self, sql):
+        table = Appointment._meta.db_table
+        return sql.replace(f'"{table}"', f'"{TABLE}"').replace(f'"{table}_', f'"bench_{table}_')
+
+    def explain(self, cursor, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {self.bench_sql(sql)}", params)
+        plan = cursor.fetchone()[0]
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+    def report(self, name, plan):
+        nodes = [
+            f"{node['Node Type']}" + (f" using {node['Index Name']}" if 'Index Name' in node else '')
+            for node in plan_nodes(plan['Plan']) if 'Scan' in node['Node Type']
+        ]
+        self.stdout.write(
+            f"  {name:<13} {plan['Execution Time']:>9.2f}ms  {plan['Plan']['Actual Rows']:>5} rows  "
+            f"{plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0):>7} buffers  "
+            f"{', '.join(nodes)}"
+        )
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
@@ -0,0 +1,115 @@
+import time
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+from core.fast_serializers import get_field_plan
+
+DEFAULT_SERIALIZERS = (
+    'apps.appointments.serializers.AppointmentSerializer',
+    'apps.inventory.serializers.InventoryItemSerializer',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list serialization through the ModelSerializer with the values()-based fast path "
+        "(core.fast_serializers) on synthetic in-memory rows, after checking both render the same bytes. "
+        "Only serialization is timed, not the query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--serializer', action='append', dest='serializers',
+            help="Dotted path of a ModelSerializer to benchmark (repeatable; default: appointments and inventory).",
+        )
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000], help="Row counts to time.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement; the best one is kept.")
+
+    def handle(self, *args, **options):
+        for path in options['serializers'] or DEFAULT_SERIALIZERS:
+            serializer_class = import_string(path)
+            plan = get_field_plan(serializer_class())
+            if plan is None:
+                raise CommandError(f"{path} has no fast plan (computed or unsupported fields).")
+            self.stdout.write(f"{serializer_class.__name__} ({len(plan.steps)} fields)")
+            self.stdout.write(f"  {'rows':>6}  {'serializer':>12}  {'fast path':>12}  {'speedup':>7}")
+
+            for count in options['rows']:
+                instances = [make_instance(serializer_class(), i) for i in range(count)]
+                rows = [as_row(instance, plan.columns) for instance in instances]
+                slow_bytes = JSONRenderer().render(serializer_class(instances, many=True).data)
+                if JSONRenderer().render(plan.render(rows)) != slow_bytes:
+                    raise CommandError(f"{path}: fast path output differs from the serializer's.")
+
+                slow = best_of(options['repeat'], lambda: serializer_class(instances, many=True).data)
+                fast = best_of(options['repeat'], lambda: plan.render(rows))
+                self.stdout.write(
+                    f"  {count:>6}  {slow * 1000:>10.1f}ms  {fast * 1000:>10.1f}ms  {slow / fast:>6.1f}x"
+                )
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def make_instance(serializer, i):
+    """
+    An unsaved instance of the serializer's model with a value in every
+    concrete field, and related instances for nested serializers.
+    """
+    model = serializer.Meta.model
+    instance = model()
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if field.is_relation:
+            setattr(instance, field.attname, i % 50 + 1)
+        elif field.choices:
+            setattr(instance, field.attname, field.choices[i % len(field.choices)][0])
+        elif isinstance(field, (models.AutoField, models.BigAutoField, models.IntegerField)):
+            setattr(instance, field.attname, i + 1)
+        elif isinstance(field, models.DecimalField):
+            setattr(instance, field.attname, Decimal(i % 1000) + Decimal('0.25'))
+        elif isinstance(field, models.FloatField):
+            setattr(instance, field.attname, i * 1.5)
+        elif isinstance(field, models.BooleanField):
+            setattr(instance, field.attname, i % 2 == 0)
+        elif isinstance(field, models.DateTimeField):
+            setattr(instance, field.attname, now - timedelta(minutes=i))
+        elif isinstance(field, models.DateField):
+            setattr(instance, field.attname, date.today() + timedelta(days=i % 365))
+        elif isinstance(field, models.TimeField):
+            setattr(instance, field.attname, dt_time(8 + i % 10, (i * 15) % 60))
+        elif isinstance(field, models.TextField):
+            setattr(instance, field.attname, f'Note {i} ' * 20)
+        elif isinstance(field, models.CharField):
+            setattr(instance, field.attname, f'{field.name} {i}'[:field.max_length])
+    for field in serializer._readable_fields:
+        if hasattr(field, 'Meta') and hasattr(field.Meta, 'model'):
+            setattr(instance, field.source, make_instance(field, i % 50))
+    return instance
+
+
+def as_row(instance, columns):
+    """
+    The values() row the database would return for `instance`.
+    """
+    row = {}
+    for column in columns:
+        *path, name = column.split('__')
+        value = instance
+        for related in path:
+            value = getattr(value, related)
+        row[column] = getattr(value, value._meta.get_field(name).attname)
+    return row
+
@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from apps.appointments.models import Appointment, ReminderDelivery
+from apps.appointments.reminders import FakeTransport, ReminderScheduler
+from apps.tenant.models import Tenant
+from apps.users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time reminder dispatch (apps.appointments.reminders) for synthetic tenants through the fake "
+        "transport, which spends --latency seconds per batch like a provider round trip, at growing "
+        "worker counts. Everything is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=1000, help="Tenants (default: %(default)s).")
+        parser.add_argument('--appointments', type=int, default=10, help="Due appointments per tenant.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50], help="Worker counts.")
+        parser.add_argument('--batch-size', type=int, default=50, help="Reminders per batch.")
+        parser.add_argument('--latency', type=float, default=0.05, help="Seconds per transport call.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                started = time.monotonic()
+                tenants = self.populate(options['tenants'], options['appointments'])
+                self.stdout.write(
+                    f"{len(tenants)} tenants, {options['appointments']} appointments each, "
+                    f"created in {time.monotonic() - started:.1f}s; {options['latency'] * 1000:.0f}ms per batch"
+                )
+                self.stdout.write(f"  {'workers':>7}  {'sent':>6}  {'time':>8}  {'reminders/s':>11}")
+                for concurrency in options['concurrency']:
+                    self.measure(tenants, concurrency, options['batch_size'], options['latency'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, count, appointments):
+        owner_model = Tenant._meta.get_field('owner').related_model
+        owner = owner_model.objects.create(username=f'bench-owner-{time.time_ns()}')
+        prefix = f'bench{time.time_ns()}'
+        tenants = Tenant.objects.bulk_create([
+            Tenant(
+                name=f'Clinic {i}', subdomain=f'{prefix}-{i}', schema_name=f'{prefix}_{i}', address='-',
+                phone='0500000000', email=f'{prefix}-{i}@example.com', owner=owner,
+            )
+            for i in range(count)
+        ])
+        if tenants[0].pk is None:  # Backends that do not return bulk-inserted keys
+            tenants = list(Tenant.objects.filter(subdomain__startswith=f'{prefix}-').order_by('pk'))
+
+        users = []
+        for tenant in tenants:
+            users.append(User(
+                username=f'{tenant.subdomain}-dentist', tenant=tenant, role='dentist', last_name='Bench',
+            ))
+            users.append(User(
+                username=f'{tenant.subdomain}-patient', tenant=tenant, role='patient', first_name='Pat',
+                email=f'patient@{tenant.subdomain}.example.com', phone='+212600000000',
+            ))
+        User.objects.bulk_create(users)
+        people = {
+            (user.tenant_id, user.role): user.pk
+            for user in User.objects.filter(tenant__in=tenants).only('pk', 'tenant', 'role')
+        }
+
+        # 15-minute visits spread over the next 23 hours, none running past midnight.
+        now = timezone.localtime().replace(tzinfo=None, second=0, microsecond=0)
+        step = timedelta(hours=23) / max(appointments, 1)
+        rows = []
+        for tenant in tenants:
+            for i in range(appointments):
+                starts = now + timedelta(minutes=30) + step * i
+                if (starts + timedelta(minutes=15)).date() != starts.date():
+                    starts = starts.replace(hour=0, minute=0) + timedelta(days=1)
+                rows.append(Appointment(
+                    tenant=tenant, patient_id=people[tenant.pk, 'patient'], dentist_id=people[tenant.pk, 'dentist'],
+                    date=starts.date(), start_time=starts.time(), end_time=(starts + timedelta(minutes=15)).time(),
+                ))
+        Appointment.objects.bulk_create(rows, batch_size=1000)
+        return tenants
+
+    def measure(self, tenants, concurrency, batch_size, latency):
+        ReminderDelivery.objects.filter(tenant__in=tenants).delete()
+        FakeTransport.outbox = []
+        FakeTransport.latency = latency
+        scheduler = ReminderScheduler(
+            channels={'sms': FakeTransport, 'email': FakeTransport}, concurrency=concurrency, batch_size=batch_size,
+        )
+        started = time.monotonic()
+        stats = scheduler.run(tenants)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"  {concurrency:>7}  {stats['sent']:>6}  {elapsed:>7.2f}s  {stats['sent'] / elapsed:>11.0f}")
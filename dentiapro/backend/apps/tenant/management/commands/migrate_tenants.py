@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import StringIO
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+
+from apps.tenant.models import Tenant
+from apps.tenant.provisioning import get_provisioner
+from apps.tenant.schema import get_public_schema_name, public_schema, run_migrations
+from apps.tenant.sharding import get_shard_aliases
+from core.db.pool import close_pools
+
+
+class Command(BaseCommand):
+    help = (
+        "Migrate the public schema of every shard, then every tenant schema (and the provisioning "
+        "templates) in parallel worker processes. Finished schemas are recorded in a checkpoint "
+        "file so that a failed run can be resumed with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Schemas migrated concurrently, each in its own process (default: CPU count).",
+        )
+        parser.add_argument(
+            '--checkpoint', default='migrate_tenants.checkpoint.json',
+            help="File recording the schemas already migrated (default: %(default)s).",
+        )
+        parser.add_argument('--resume', action='store_true', help="Skip the schemas recorded in the checkpoint.")
+        parser.add_argument('--skip-public', action='store_true', help="Do not migrate the public schema first.")
+        parser.add_argument('--fail-fast', action='store_true', help="Stop scheduling schemas after the first failure.")
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+        fingerprint = migrations_fingerprint()
+        checkpoint = Checkpoint(options['checkpoint'], fingerprint)
+        if options['resume']:
+            if checkpoint.load():
+                self.stdout.write(f"Resuming: {len(checkpoint.done)} schemas already migrated.")
+            else:
+                self.stdout.write("No usable checkpoint for the current migrations; starting from scratch.")
+
+        public_schema_name = get_public_schema_name()
+        public_keys = {checkpoint_key(alias, public_schema_name) for alias in get_shard_aliases()}
+        if not options['skip_public']:
+            for alias in get_shard_aliases():
+                key = checkpoint_key(alias, public_schema_name)
+                if key in checkpoint.done:
+                    continue
+                started = time.monotonic()
+                run_migrations(public_schema_name, using=alias, verbosity=verbosity)
+                checkpoint.mark_done(key, time.monotonic() - started)
+                self.stdout.write(f"Migrated public schema on '{alias}' in {checkpoint.done[key]:.2f}s")
+
+        schemas = [
+            (alias, schema_name) for alias, schema_name in self.get_schemas()
+            if checkpoint_key(alias, schema_name) not in checkpoint.done
+        ]
+        total = len(schemas)
+        failures = {}
+        finished = []
+        started = time.monotonic()
+
+        def report(result):
+            alias, schema_name, duration, error, output = result
+            key = checkpoint_key(alias, schema_name)
+            finished.append(key)
+            if error is None:
+                checkpoint.mark_done(key, duration)
+                self.stdout.write(f"[{len(finished)}/{total}] {key} {duration:.2f}s")
+            else:
+                failures[key] = error
+                self.stderr.write(f"FAILED {key} after {duration:.2f}s: {error}")
+                if output and verbosity > 1:
+                    self.stderr.write(output)
+            return error is None or not options['fail_fast']
+
+        if options['workers'] <= 1:
+            for alias, schema_name in schemas:
+                if not report(migrate_schema(alias, schema_name, verbosity)):
+                    break
+        else:
+            # Forked workers must not inherit open sockets. With the pooled backend
+            # close_all() only returns connections to the pool: close those too.
+            connections.close_all()
+            close_pools()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+                futures = [
+                    executor.submit(migrate_schema, alias, schema_name, verbosity) for alias, schema_name in schemas
+                ]
+                for future in as_completed(futures):
+                    if not report(future.result()):
+                        for pending in futures:
+                            pending.cancel()
+                        break
+
+        elapsed = time.monotonic() - started
+        summary = f"Migrated {len(finished) - len(failures)}/{total} tenant schemas in {elapsed:.2f}s"
+        durations = sorted(duration for key, duration in checkpoint.done.items() if key not in public_keys)
+        if durations:
+            summary += f" (slowest {durations[-1]:.2f}s)"
+        if failures:
+            raise CommandError(
+                f"{summary}; {len(failures)} failed ({', '.join(sorted(failures))}). "
+                f"Fix and re-run with --resume to continue from {checkpoint.path}."
+            )
+        checkpoint.discard()
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def get_schemas(self):
+        return get_schemas()
+
+
+class Checkpoint:
+    """
+    JSON file mapping each migrated schema to its duration, tied to the set of
+    migration leaf nodes it was written for.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.done = {}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('fingerprint') != self.fingerprint:
+            return False
+        self.done = data.get('done', {})
+        return True
+
+    def mark_done(self, schema_name, duration):
+        self.done[schema_name] = round(duration, 3)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'fingerprint': self.fingerprint, 'done': self.done}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def get_schemas():
+    """
+    (alias, schema_name) of every tenant schema and provisioning template.
+    """
+    with public_schema():
+        schemas = list(Tenant.objects.order_by('id').values_list('shard', 'schema_name'))
+    for alias in reversed(get_shard_aliases()):
+        provisioner = get_provisioner(alias)
+        if provisioner.schema_exists(provisioner.template_schema):
+            schemas.insert(0, (alias, provisioner.template_schema))
+    return schemas
+
+
+def checkpoint_key(alias, schema_name):
+    return f'{alias}.{schema_name}'
+
+
+def migrations_fingerprint():
+    leaf_nodes = sorted(MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes())
+    return hashlib.sha1(json.dumps(leaf_nodes).encode()).hexdigest()
+
+
+def init_worker():
+    # A no-op for forked workers; spawned ones start with an empty app registry.
+    django.setup()
+    # Whatever setup opened in this process; the parent's pools are never used here (get_pool() is per PID).
+    connections.close_all()
+    close_pools()
+
+
+def migrate_schema(alias, schema_name, verbosity=0):
+    """
+    Migrate one tenant schema and return (alias, schema_name, seconds, error or None, output).
+    """
+    output = StringIO()
+    started = time.monotonic()
+    try:
+        run_migrations(schema_name, using=alias, verbosity=verbosity, stdout=output, stderr=output)
+        error = None
+    except Exception as e:
+        error = f'{e.__class__.__name__}: {e}'
+    finally:
+        connections.close_all()
+    return alias, schema_name, time.monotonic() - started, error, output.getvalue()
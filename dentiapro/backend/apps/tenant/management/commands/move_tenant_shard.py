@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tenant.models import Tenant
+from apps.tenant.schema import public_schema
+from apps.tenant.shard_move import ShardMoveError, TenantShardMove
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a tenant's schema to another shard (DATABASES alias) while it keeps serving reads. "
+        "Writes are refused only while the last changes are copied over."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant', help="Schema name or id of the tenant to move.")
+        parser.add_argument('shard', help="Database alias to move the tenant to.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows copied per query (default: 5000).")
+        parser.add_argument(
+            '--propagation-delay', type=float,
+            help="Seconds to wait for every worker to see a change of the tenant (default: tenant cache TTL + 5s).",
+        )
+        parser.add_argument(
+            '--drop-source', action='store_true', help="Drop the schema on the old shard once the move is done.",
+        )
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['tenant']} if options['tenant'].isdigit() else {'schema_name': options['tenant']}
+        with public_schema():
+            try:
+                tenant = Tenant.objects.get(**lookup)
+            except Tenant.DoesNotExist:
+                raise CommandError(f"No tenant '{options['tenant']}'.")
+
+        move = TenantShardMove(
+            tenant, options['shard'],
+            chunk_size=options['chunk_size'],
+            propagation_delay=options['propagation_delay'],
+            log=self.stdout.write,
+        )
+        try:
+            move.run(drop_source=options['drop_source'])
+        except ShardMoveError as e:
+            raise CommandError(str(e))
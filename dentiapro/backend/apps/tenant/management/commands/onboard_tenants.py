@@ -0,0 +1,147 @@
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.tenant.provisioning import get_provisioner, is_valid_schema_name
+
+REQUIRED_COLUMNS = ('name', 'subdomain', 'address', 'phone', 'email')
+
+
+class Command(BaseCommand):
+    help = (
+        "Onboard tenants from a CSV file, cloning each schema from the template schema. "
+        "Columns: name, subdomain, address, phone, email, and optionally schema_name "
+        "(defaults to the subdomain), owner (owner's e-mail, defaults to --owner), shard "
+        "(database alias, defaults to --shard) and domains (separated by ';', the first one is primary)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path of the CSV file, with a header row.")
+        parser.add_argument('--workers', type=int, default=4, help="Tenants provisioned concurrently (default: 4).")
+        parser.add_argument('--owner', help="E-mail of the user owning tenants whose row has no owner.")
+        parser.add_argument(
+            '--shard', default=DEFAULT_DB_ALIAS,
+            help="Database alias for tenants whose row has no shard (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--refresh-template', action='store_true',
+            help="Re-run migrations on the template schema even if it looks up to date.",
+        )
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(options['csv_file'], options['shard'])
+        owners = self.resolve_owners(rows, options['owner'])
+
+        for alias in sorted({row['shard'] for row in rows}):
+            provisioner = get_provisioner(alias)
+            started = time.monotonic()
+            if provisioner.prepare_template(force=options['refresh_template']):
+                self.stdout.write(
+                    f"Migrated template schema '{provisioner.template_schema}' on '{alias}' "
+                    f"in {time.monotonic() - started:.2f}s"
+                )
+
+        jobs = [(get_provisioner(row['shard']), row, owners[row['owner']]) for row in rows]
+        results = []
+        started = time.monotonic()
+        if options['workers'] <= 1:
+            for job in jobs:
+                results.append(self.report(onboard(*job)))
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [executor.submit(onboard, *job, in_worker=True) for job in jobs]
+                for future in as_completed(futures):
+                    results.append(self.report(future.result()))
+        elapsed = time.monotonic() - started
+
+        durations = sorted(duration for _, duration, error in results if error is None)
+        failed = len(results) - len(durations)
+        summary = f"Onboarded {len(durations)}/{len(results)} tenants in {elapsed:.2f}s"
+        if durations:
+            summary += (
+                f" (per tenant: p50 {percentile(durations, 50):.3f}s, "
+                f"p95 {percentile(durations, 95):.3f}s, max {durations[-1]:.3f}s)"
+            )
+        if failed:
+            raise CommandError(f"{summary}; {failed} failed.")
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def read_rows(self, path, default_shard):
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+                if missing:
+                    raise CommandError(f"Missing CSV columns: {', '.join(missing)}")
+                rows = [{key: (value or '').strip() for key, value in row.items() if key} for row in reader]
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        schema_names = set()
+        for line, row in enumerate(rows, start=2):
+            row['schema_name'] = row.get('schema_name') or row['subdomain'].lower().replace('-', '_')
+            if not is_valid_schema_name(row['schema_name']):
+                raise CommandError(f"Line {line}: invalid schema name '{row['schema_name']}'.")
+            if row['schema_name'] in schema_names:
+                raise CommandError(f"Line {line}: duplicate schema name '{row['schema_name']}'.")
+            schema_names.add(row['schema_name'])
+            row['shard'] = row.get('shard') or default_shard
+            if row['shard'] not in connections.databases:
+                raise CommandError(f"Line {line}: unknown shard '{row['shard']}'.")
+        return rows
+
+    def resolve_owners(self, rows, default_owner):
+        for row in rows:
+            row['owner'] = row.get('owner') or default_owner
+            if not row['owner']:
+                raise CommandError(f"No owner for tenant '{row['name']}'; add an owner column or pass --owner.")
+
+        emails = {row['owner'] for row in rows}
+        owners = {user.email: user for user in get_user_model().objects.filter(email__in=emails)}
+        unknown = emails - owners.keys()
+        if unknown:
+            raise CommandError(f"Unknown owners: {', '.join(sorted(unknown))}")
+        return owners
+
+    def report(self, result):
+        row, duration, error = result
+        if error is None:
+            self.stdout.write(f"OK    {row['schema_name']:<40} {duration:.3f}s")
+        else:
+            self.stderr.write(f"FAIL  {row['schema_name']:<40} {duration:.3f}s  {error}")
+        return result
+
+
+def onboard(provisioner, row, owner, in_worker=False):
+    """
+    Provision one tenant and return (row, seconds, error or None).
+    """
+    started = time.monotonic()
+    try:
+        provisioner.create_tenant(
+            domains=[domain.strip() for domain in row.get('domains', '').split(';') if domain.strip()],
+            name=row['name'],
+            subdomain=row['subdomain'],
+            schema_name=row['schema_name'],
+            address=row['address'],
+            phone=row['phone'],
+            email=row['email'],
+            owner=owner,
+        )
+        error = None
+    except Exception as e:
+        error = e
+    finally:
+        if in_worker:
+            # Hand the worker's connection back (to the pool, with core.db.backend).
+            connections.close_all()
+    return row, time.monotonic() - started, error
+
+
+def percentile(values, percent):
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from apps.appointments.reminders import ReminderScheduler
+from apps.tenant.models import Tenant
+from apps.tenant.schema import public_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the appointment reminders that are due (see apps/appointments/reminders.py). Run it "
+        "every few minutes from cron; overlapping runs never send a reminder twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant', action='append', dest='tenants', metavar='SUBDOMAIN',
+            help="Only remind the patients of this tenant (repeatable; default: every active tenant).",
+        )
+        parser.add_argument('--concurrency', type=int, help="Sending workers (default: REMINDERS['CONCURRENCY']).")
+        parser.add_argument('--batch-size', type=int, help="Reminders per batch (default: REMINDERS['BATCH_SIZE']).")
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler.from_settings()
+        if options['concurrency']:
+            scheduler.concurrency = options['concurrency']
+        if options['batch_size']:
+            scheduler.batch_size = options['batch_size']
+
+        with public_schema():
+            tenants = Tenant.objects.filter(is_active=True).order_by('pk')
+            if options['tenants']:
+                tenants = tenants.filter(subdomain__in=options['tenants'])
+            tenants = list(tenants)
+        stats = scheduler.run(tenants)
+        self.stdout.write(
+            f"{stats['sent']} reminders sent and {stats['failed']} failed, out of {stats['due']} due "
+            f"for {stats['tenants']} tenants."
+        )
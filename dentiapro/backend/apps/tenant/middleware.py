@@ -1,26 +1,188 @@
 import logging
-from django.db import connection
-from django.http import HttpResponseForbidden
+import math
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponseForbidden, JsonResponse
+from .cache import get_tenant_cache
 from .models import Tenant
+from .quotas import get_tenant_quotas
+from .routing import get_domain_index
+from .schema import activate_public, activate_tenant
+from .sharding import set_current_shard, shard_for
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
 
 class TenantMiddleware:
+    """
+    Resolve the tenant from the X-Tenant-ID header, or failing that from the
+    Host header through the in-memory domain index.
+
+    The schema is not reset to public after a successful response: every
+    request activates the schema it needs on entry, and activate_* skips the
+    switch when the connection is already there, so back-to-back requests for
+    the same tenant issue no `SET search_path` at all. The connection is
+    reset to public when the view raises or answers with a server error.
+
+    The schema is activated on the tenant's shard, which also becomes the
+    current shard for TenantShardRouter. While a tenant is being moved to
+    another shard its writes are refused with a 503.
+
+    The middleware is both sync and async capable, so under ASGI the chain
+    does not fall back to a thread per middleware around async views.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
         self.logger = logging.getLogger(__name__)
+        self.tenant_cache = get_tenant_cache()
+        self.domain_index = get_domain_index()
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        response = self.enter(request)
+        if response is not None:
+            return response
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            activate_public(request.tenant_db)
+            raise
+        if response.status_code >= 500:
+            activate_public(request.tenant_db)
+        return response
+
+    async def __acall__(self, request):
+        # Connections are thread-local: the schema has to be activated in the
+        # thread that runs the view's ORM calls, which is the one that
+        # thread-sensitive sync_to_async uses for this request.
+        response = await sync_to_async(self.enter)(request)
+        if response is not None:
+            return response
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(activate_public)(request.tenant_db)
+            raise
+        if response.status_code >= 500:
+            await sync_to_async(activate_public)(request.tenant_db)
+        return response
+
+    def enter(self, request):
+        """
+        Resolve the request's tenant and activate its schema.
+        Returns a response to short-circuit with when the tenant is invalid.
+        """
+        request.tenant_db = DEFAULT_DB_ALIAS
         tenant_id = request.headers.get('X-Tenant-ID')
         if not tenant_id:
-            return self.get_response(request)
+            tenant_id = self.domain_index.lookup(request.get_host())
+            if tenant_id is None:
+                activate_public()
+                set_current_shard(None)
+                return None
 
         try:
-            tenant = Tenant.objects.get(id=tenant_id)
-            connection.set_tenant(tenant)
-            request.tenant = tenant
-        except Tenant.DoesNotExist:
+            tenant = self.tenant_cache.get_tenant(tenant_id)
+        except (Tenant.DoesNotExist, ValueError):
             self.logger.error(f"Tenant with ID {tenant_id} not found.")
             return HttpResponseForbidden("Invalid tenant")
 
-        response = self.get_response(request)
-        connection.set_schema_to_public()
+        alias = shard_for(tenant)
+        activate_tenant(tenant, using=alias)
+        set_current_shard(alias)
+        request.tenant = tenant
+        request.tenant_db = alias
+        if tenant.writes_frozen and request.method not in SAFE_METHODS:
+            response = JsonResponse({'detail': 'Tenant is being migrated; try again shortly.'}, status=503)
+            response['Retry-After'] = '30'
+            return response
+        return None
+
+
+class TenantQuotaMiddleware:
+    """
+    Enforce the per-tenant rate and concurrency limits from apps.tenant.quotas.
+
+    Goes right after TenantMiddleware so that requests over quota are turned
+    away with a 429 before sessions, authentication or the view touch the
+    database. Requests without a tenant are not limited. A streaming
+    response (e.g. an export) holds its concurrency slot until it is closed,
+    i.e. until its body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.logger = logging.getLogger(__name__)
+        self.quotas = get_tenant_quotas()
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        tenant = getattr(request, 'tenant', None)
+        if tenant is None or not self.quotas.enabled:
+            return self.get_response(request)
+
+        rejected = self.quotas.admit(tenant)
+        if rejected is not None:
+            return self.too_many_requests(tenant, *rejected)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.quotas.release(tenant)
+            raise
+        if response.streaming:
+            response._resource_closers.append(lambda: self.quotas.release(tenant))
+        else:
+            self.quotas.release(tenant)
+        return response
+
+    async def __acall__(self, request):
+        tenant = getattr(request, 'tenant', None)
+        if tenant is None or not self.quotas.enabled:
+            return await self.get_response(request)
+
+        # The shared store talks to the cache backend; keep that off the event loop.
+        shared = self.quotas.store.is_shared
+        if shared:
+            rejected = await sync_to_async(self.quotas.admit)(tenant)
+        else:
+            rejected = self.quotas.admit(tenant)
+        if rejected is not None:
+            return self.too_many_requests(tenant, *rejected)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await self.arelease(tenant, shared)
+            raise
+        if response.streaming:
+            # Closers run in a worker thread under ASGI.
+            response._resource_closers.append(lambda: self.quotas.release(tenant))
+        else:
+            await self.arelease(tenant, shared)
+        return response
+
+    async def arelease(self, tenant, shared):
+        if shared:
+            await sync_to_async(self.quotas.release)(tenant)
+        else:
+            self.quotas.release(tenant)
+
+    def too_many_requests(self, tenant, reason, retry_after):
+        self.logger.warning(f"Tenant {tenant.pk} over its {reason} quota.")
+        detail = 'Request rate limit exceeded.' if reason == 'rate' else 'Too many concurrent requests.'
+        response = JsonResponse({'detail': detail}, status=429)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
         return response
@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 class Tenant(models.Model):
     name = models.CharField(max_length=100)
     subdomain = models.CharField(max_length=100, unique=True)
+    schema_name = models.CharField(max_length=63, unique=True)  # Postgres schema holding the tenant's data
     address = models.TextField()
     phone = models.CharField(max_length=20)
     email = models.EmailField(unique=True)  # Ensure unique emails for tenants
@@ -12,6 +13,15 @@ class Tenant(models.Model):
     owner = models.ForeignKey(get_user_model(), on_delete=models.PROTECT, related_name='owned_tenants')
     is_active = models.BooleanField(default=True)
 
+    # Shard map (see apps/tenant/sharding.py): DATABASES alias holding the tenant's schema
+    shard = models.CharField(max_length=63, default='default', db_index=True)
+    writes_frozen = models.BooleanField(default=False)  # Set while the tenant is moved between shards
+
+    # Request quotas (see apps/tenant/quotas.py); empty means the TENANT_QUOTAS default, 0 means unlimited.
+    rate_limit_per_second = models.FloatField(null=True, blank=True)
+    rate_limit_burst = models.PositiveIntegerField(null=True, blank=True)
+    max_concurrent_requests = models.PositiveIntegerField(null=True, blank=True)
+
     class Meta:
         db_table = 'tenants'
         ordering = ['-created_at']
@@ -35,3 +45,35 @@ class Domain(models.Model):
 
     def __str__(self):
         return self.domain
+
+
+class AuditEvent(models.Model):
+    """
+    Who read or changed which rows, written in batches by core.audit.
+
+    The table is append-only and partitioned by month on Postgres; it is
+    created by `manage.py audit_partitions`, not by migrations.
+    """
+    event_id = models.UUIDField(unique=True)  # Deduplicates events written more than once (at-least-once delivery)
+    occurred_at = models.DateTimeField()
+    tenant_id = models.BigIntegerField(null=True)
+    user_id = models.BigIntegerField(null=True)
+    action = models.CharField(max_length=20)  # ViewSet action: list, retrieve, create, update, destroy, ...
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_ids = models.JSONField(null=True)
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    status_code = models.PositiveSmallIntegerField()
+    ip = models.GenericIPAddressField(null=True)
+
+    class Meta:
+        db_table = 'audit_events'
+        managed = False
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Audit events are append-only.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Audit events are append-only.")
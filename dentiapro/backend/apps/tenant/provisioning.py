@@ -0,0 +1,310 @@
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+from apps.appointments.constraints import BTREE_GIST, CONSTRAINT_STATEMENTS
+from core import metrics
+from .models import Domain, Tenant
+from .schema import activate_public, activate_schema, public_schema, run_migrations
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT_PROVISIONING = {
+    'TEMPLATE_SCHEMA': 'tenant_template',   # Pre-migrated schema that new tenant schemas are cloned from
+}
+
+SCHEMA_NAME_RE = re.compile(r'^[a-z_][a-z0-9_]{0,62}$')
+
+# Copies every table of `source_schema` into a new `dest_schema`: columns,
+# defaults, identity columns, CHECK/primary/unique/exclusion constraints,
+# indexes (under their original names, so later migrations that drop them by
+# name still work), rows (django_migrations in practice) and foreign keys.
+# The function runs with an empty search_path so that every name coming out
+# of pg_get_*def() is schema-qualified and can be rewritten.
+CLONE_SCHEMA_SQL = r"""
+CREATE OR REPLACE FUNCTION clone_schema(source_schema text, dest_schema text)
+RETURNS void
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+    src text := quote_ident(source_schema) || '.';
+    dst text := quote_ident(dest_schema) || '.';
+    rec record;
+BEGIN
+    EXECUTE format('CREATE SCHEMA %I', dest_schema);
+
+    -- Sequences not backing an identity column (serial columns, explicit sequences).
+    FOR rec IN
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = source_schema AND c.relkind = 'S'
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_depend d
+              WHERE d.objid = c.oid AND d.classid = 'pg_class'::regclass AND d.deptype = 'i'
+          )
+    LOOP
+        EXECUTE format('CREATE SEQUENCE %I.%I', dest_schema, rec.relname);
+    END LOOP;
+
+    -- Generated columns (appointments.slot) are computed again on insert and
+    -- cannot be given a value, so rows are copied by explicit column lists.
+    FOR rec IN
+        SELECT c.relname, string_agg(quote_ident(a.attname), ', ' ORDER BY a.attnum) AS columns
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped AND a.attgenerated = ''
+        WHERE n.nspname = source_schema AND c.relkind = 'r'
+        GROUP BY c.relname
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I.%I (LIKE %I.%I INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED '
+            'INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)',
+            dest_schema, rec.relname, source_schema, rec.relname
+        );
+        EXECUTE format(
+            'INSERT INTO %I.%I (%s) OVERRIDING SYSTEM VALUE SELECT %s FROM %I.%I',
+            dest_schema, rec.relname, rec.columns, rec.columns, source_schema, rec.relname
+        );
+    END LOOP;
+
+    -- Serial defaults still point at the template's sequences.
+    FOR rec IN
+        SELECT c.relname, a.attname, pg_get_expr(ad.adbin, ad.adrelid) AS expr
+        FROM pg_attrdef ad
+        JOIN pg_class c ON c.oid = ad.adrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = ad.adrelid AND a.attnum = ad.adnum
+        WHERE n.nspname = source_schema AND c.relkind = 'r'
+          AND pg_get_expr(ad.adbin, ad.adrelid) LIKE '%nextval(%'
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I.%I ALTER COLUMN %I SET DEFAULT %s',
+            dest_schema, rec.relname, rec.attname, replace(rec.expr, src, dst)
+        );
+    END LOOP;
+
+    -- Move every sequence past the rows that were copied.
+    FOR rec IN
+        SELECT c.relname, a.attname, pg_get_serial_sequence(format('%I.%I', dest_schema, c.relname), a.attname) AS seq
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = dest_schema AND c.relkind = 'r' AND a.attnum > 0 AND NOT a.attisdropped
+    LOOP
+        IF rec.seq IS NOT NULL THEN
+            EXECUTE format(
+                'SELECT setval(%L, max(%I)) FROM %I.%I HAVING max(%I) IS NOT NULL',
+                rec.seq, rec.attname, dest_schema, rec.relname, rec.attname
+            );
+        END IF;
+    END LOOP;
+
+    -- Primary key, unique and exclusion constraints keep their names (and
+    -- those of their indexes); CHECK constraints came with the table.
+    FOR rec IN
+        SELECT c.relname, con.conname, pg_get_constraintdef(con.oid) AS def
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = source_schema AND con.contype IN ('p', 'u', 'x')
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I.%I ADD CONSTRAINT %I %s',
+            dest_schema, rec.relname, rec.conname, replace(rec.def, src, dst)
+        );
+    END LOOP;
+
+    FOR rec IN
+        SELECT pg_get_indexdef(i.indexrelid) AS def
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = source_schema AND c.relkind = 'r'
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)
+    LOOP
+        EXECUTE replace(rec.def, ' ON ' || src, ' ON ' || dst);
+    END LOOP;
+
+    -- Foreign keys last, once all rows are in. References to shared tables in
+    -- the public schema are left as they are.
+    FOR rec IN
+        SELECT c.relname, con.conname, pg_get_constraintdef(con.oid) AS def
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = source_schema AND con.contype = 'f'
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %I.%I ADD CONSTRAINT %I %s',
+            dest_schema, rec.relname, rec.conname, replace(rec.def, 'REFERENCES ' || src, 'REFERENCES ' || dst)
+        );
+    END LOOP;
+END;
+$$;
+"""
+
+
+class ProvisioningError(Exception):
+    """
+    Raised when a tenant schema cannot be provisioned.
+    """
+
+
+def is_valid_schema_name(name):
+    return bool(SCHEMA_NAME_RE.match(name or '')) and not name.startswith('pg_')
+
+
+class SchemaProvisioner:
+    """
+    Creates tenant schemas by cloning a pre-migrated template schema.
+
+    Migrating a new schema from scratch replays every migration of every
+    tenant app; cloning the template is a handful of DDL statements per table
+    inside a single transaction, so its cost does not grow with the migration
+    history. The template is migrated like any tenant schema and has to be
+    brought up to date after new migrations (prepare_template() does that, and
+    is a no-op when it already is).
+    """
+
+    def __init__(self, template_schema='tenant_template', using=DEFAULT_DB_ALIAS):
+        if not is_valid_schema_name(template_schema):
+            raise ProvisioningError(f"Invalid template schema name '{template_schema}'.")
+        self.template_schema = template_schema
+        self.using = using
+        self._install_lock = threading.Lock()
+        self._installed = False
+
+        self.provisioned = metrics.counter('tenant_schemas_provisioned', 'Tenant schemas cloned from the template')
+        self.failures = metrics.counter('tenant_provisioning_failures', 'Tenant schemas that failed to provision')
+
+    @classmethod
+    def from_settings(cls, using=DEFAULT_DB_ALIAS):
+        options = {**DEFAULT_TENANT_PROVISIONING, **getattr(settings, 'TENANT_PROVISIONING', {})}
+        return cls(template_schema=options['TEMPLATE_SCHEMA'], using=using)
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def schema_exists(self, schema_name):
+        with public_schema(self.using), self.connection.cursor() as cursor:
+            cursor.execute('SELECT EXISTS(SELECT 1 FROM pg_namespace WHERE nspname = %s)', [schema_name])
+            return cursor.fetchone()[0]
+
+    def template_is_current(self):
+        """
+        True when the template schema exists and has every migration applied.
+        """
+        if not self.schema_exists(self.template_schema):
+            return False
+        activate_schema(self.template_schema, using=self.using)
+        try:
+            executor = MigrationExecutor(self.connection)
+            return not executor.migration_plan(executor.loader.graph.leaf_nodes())
+        finally:
+            activate_public(self.using)
+
+    def prepare_template(self, force=False):
+        """
+        Create the template schema if needed, migrate it to the latest state
+        and add the constraints migrations do not create. Returns True when
+        migrations had to run.
+        """
+        if not force and self.template_is_current():
+            self.add_constraints()
+            self.install()
+            return False
+        started = time.monotonic()
+        with public_schema(self.using), self.connection.cursor() as cursor:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.template_schema}"')
+        run_migrations(self.template_schema, using=self.using, verbosity=0)
+        self.add_constraints()
+        self.install()
+        logger.info("Migrated template schema '%s' in %.2fs", self.template_schema, time.monotonic() - started)
+        return True
+
+    def add_constraints(self):
+        """
+        Add the constraints that migrations do not create (the appointments
+        exclusion constraint) to the template, so clones carry them. Idempotent.
+        """
+        activate_schema(self.template_schema, using=self.using)
+        try:
+            with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+                cursor.execute(BTREE_GIST)
+                for statement in CONSTRAINT_STATEMENTS:
+                    cursor.execute(statement)
+        finally:
+            activate_public(self.using)
+
+    def install(self):
+        """
+        (Re)create the clone_schema() function in the public schema.
+        """
+        with self._install_lock:
+            if self._installed:
+                return
+            with public_schema(self.using), self.connection.cursor() as cursor:
+                cursor.execute(CLONE_SCHEMA_SQL)
+            # Inside a transaction that may still roll back, only trust it once committed.
+            transaction.on_commit(self._mark_installed, using=self.using)
+
+    def _mark_installed(self):
+        self._installed = True
+
+    def provision(self, schema_name):
+        """
+        Clone the template into a new schema called `schema_name`.
+        Runs in the caller's transaction when there is one.
+        """
+        if not is_valid_schema_name(schema_name):
+            raise ProvisioningError(f"Invalid schema name '{schema_name}'.")
+        self.install()
+        with public_schema(self.using), self.connection.cursor() as cursor:
+            cursor.execute('SELECT clone_schema(%s, %s)', [self.template_schema, schema_name])
+        self.provisioned.inc()
+
+    def create_tenant(self, domains=(), **fields):
+        """
+        Create a Tenant row, its schema and its domains in one transaction, so
+        a failure leaves neither a tenant without a schema nor a stray schema.
+
+        The Tenant and Domain rows always go to the default database; the
+        schema is created on this provisioner's database, which becomes the
+        tenant's shard.
+        """
+        try:
+            with public_schema(), transaction.atomic(), transaction.atomic(using=self.using):
+                tenant = Tenant.objects.create(shard=self.using, **fields)
+                self.provision(tenant.schema_name)
+                for index, domain in enumerate(domains):
+                    Domain.objects.create(tenant=tenant, domain=domain, is_primary=index == 0)
+        except Exception:
+            self.failures.inc()
+            raise
+        return tenant
+
+
+_provisioners = {}
+_provisioners_lock = threading.Lock()
+
+
+def get_provisioner(using=DEFAULT_DB_ALIAS):
+    """
+    Return the process-wide SchemaProvisioner for the database `using`, built
+    from settings.TENANT_PROVISIONING on first use.
+    """
+    provisioner = _provisioners.get(using)
+    if provisioner is None:
+        with _provisioners_lock:
+            provisioner = _provisioners.get(using)
+            if provisioner is None:
+                provisioner = _provisioners[using] = SchemaProvisioner.from_settings(using)
+    return provisioner
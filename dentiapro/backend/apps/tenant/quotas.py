@@ -0,0 +1,219 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core import metrics
+
+DEFAULT_TENANT_QUOTAS = {
+    'ENABLED': True,
+    'RATE': 50,                 # Requests per second a tenant may sustain (token refill rate)
+    'BURST': 100,               # Bucket size: requests a tenant may fire at once after being idle
+    'MAX_CONCURRENT': 20,       # Requests a tenant may have in flight at the same time
+    'STORE': 'local',           # 'local' (per process) or 'cache' (shared across workers)
+    'CACHE_ALIAS': 'default',   # CACHES alias used by the 'cache' store
+    'CONCURRENCY_TTL': 300,     # Seconds after which a shared in-flight counter is reset (crashed workers)
+}
+
+
+class TenantLimits:
+    __slots__ = ('rate', 'burst', 'max_concurrent')
+
+    def __init__(self, rate, burst, max_concurrent):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+
+    @classmethod
+    def for_tenant(cls, tenant, defaults):
+        """
+        Per-tenant overrides from the Tenant row, falling back to `defaults`.
+        A limit of 0 disables that check for the tenant.
+        """
+        def pick(field, default):
+            value = getattr(tenant, field, None)
+            return default if value is None else value
+        return cls(
+            rate=pick('rate_limit_per_second', defaults['RATE']),
+            burst=pick('rate_limit_burst', defaults['BURST']),
+            max_concurrent=pick('max_concurrent_requests', defaults['MAX_CONCURRENT']),
+        )
+
+
+class LocalQuotaStore:
+    """
+    Token buckets and in-flight counters held in this process. Limits are
+    enforced per worker, so the effective limit is multiplied by the number of
+    workers; use the cache store when that matters.
+    """
+    is_shared = False
+
+    def __init__(self):
+        self._buckets = {}      # tenant_id -> [tokens, updated_at]
+        self._in_flight = {}    # tenant_id -> requests
+        self._lock = threading.Lock()
+
+    def consume(self, tenant_id, rate, burst):
+        """
+        Take a token from the tenant's bucket. Returns 0 when the request is
+        allowed, otherwise the seconds until a token is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(tenant_id, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[tenant_id] = (tokens - 1, now)
+                return 0
+            self._buckets[tenant_id] = (tokens, now)
+        return (1 - tokens) / rate
+
+    def acquire(self, tenant_id, limit):
+        with self._lock:
+            in_flight = self._in_flight.get(tenant_id, 0)
+            if in_flight >= limit:
+                return False
+            self._in_flight[tenant_id] = in_flight + 1
+            return True
+
+    def release(self, tenant_id):
+        with self._lock:
+            in_flight = self._in_flight.get(tenant_id, 0) - 1
+            if in_flight > 0:
+                self._in_flight[tenant_id] = in_flight
+            else:
+                self._in_flight.pop(tenant_id, None)
+
+
+class CacheQuotaStore:
+    """
+    Counters kept in a shared Django cache (Redis in production) so limits
+    hold across workers and hosts.
+
+    The cache API only offers atomic add/incr, so the token bucket is
+    approximated by a fixed window of burst/rate seconds allowing `burst`
+    requests: the same average rate, and at most `burst` requests at once.
+    """
+    is_shared = True
+
+    def __init__(self, alias='default', concurrency_ttl=300):
+        self.alias = alias
+        self.concurrency_ttl = concurrency_ttl
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consume(self, tenant_id, rate, burst):
+        window = max(1, math.ceil(burst / rate))
+        now = time.time()
+        window_start = int(now // window) * window
+        key = f'tenant_quota:{tenant_id}:rate:{window_start}'
+        self.cache.add(key, 0, window + 1)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:  # Expired between add() and incr()
+            self.cache.add(key, 1, window + 1)
+            count = 1
+        if count <= burst:
+            return 0
+        return window_start + window - now
+
+    def acquire(self, tenant_id, limit):
+        key = f'tenant_quota:{tenant_id}:in_flight'
+        self.cache.add(key, 0, self.concurrency_ttl)
+        try:
+            in_flight = self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 1, self.concurrency_ttl)
+            in_flight = 1
+        # The TTL only clears slots leaked by crashed workers: it must not run
+        # out while requests are in flight, whose releases would then go missing.
+        self.cache.touch(key, self.concurrency_ttl)
+        if in_flight > limit:
+            self._decr(key)
+            return False
+        return True
+
+    def release(self, tenant_id):
+        self._decr(f'tenant_quota:{tenant_id}:in_flight')
+
+    def _decr(self, key):
+        try:
+            in_flight = self.cache.decr(key)
+        except ValueError:  # Counter was reset by its TTL meanwhile
+            return
+        if in_flight < 0:
+            # Released a slot taken before the reset: back to zero, keeping concurrent changes.
+            self.cache.incr(key, -in_flight)
+
+
+class TenantQuotas:
+    """
+    Per-tenant request rate and concurrency limits, enforced by
+    TenantQuotaMiddleware. Defaults come from settings.TENANT_QUOTAS and can be
+    overridden per tenant through the rate_limit_* and max_concurrent_requests
+    fields of the Tenant model.
+    """
+
+    def __init__(self, store, defaults=None):
+        self.store = store
+        self.defaults = {**DEFAULT_TENANT_QUOTAS, **(defaults or {})}
+        self.rate_limited = metrics.counter('tenant_quota_rate_limited', 'Requests rejected by a tenant rate limit')
+        self.concurrency_limited = metrics.counter(
+            'tenant_quota_concurrency_limited', 'Requests rejected by a tenant concurrency limit'
+        )
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_TENANT_QUOTAS, **getattr(settings, 'TENANT_QUOTAS', {})}
+        if options['STORE'] == 'cache':
+            store = CacheQuotaStore(options['CACHE_ALIAS'], options['CONCURRENCY_TTL'])
+        elif options['STORE'] == 'local':
+            store = LocalQuotaStore()
+        else:
+            raise ValueError(f"Unknown TENANT_QUOTAS['STORE'] {options['STORE']!r}; use 'local' or 'cache'.")
+        return cls(store, options)
+
+    @property
+    def enabled(self):
+        return self.defaults['ENABLED']
+
+    def admit(self, tenant):
+        """
+        Admit a request for `tenant`. Returns None when it may proceed (and
+        then it must be passed to release()), otherwise a (reason, retry_after)
+        pair.
+        """
+        limits = TenantLimits.for_tenant(tenant, self.defaults)
+        if limits.rate > 0:
+            retry_after = self.store.consume(tenant.pk, limits.rate, max(limits.burst, 1))
+            if retry_after:
+                self.rate_limited.inc()
+                return 'rate', retry_after
+        if limits.max_concurrent > 0 and not self.store.acquire(tenant.pk, limits.max_concurrent):
+            self.concurrency_limited.inc()
+            return 'concurrency', 1
+        return None
+
+    def release(self, tenant):
+        if TenantLimits.for_tenant(tenant, self.defaults).max_concurrent > 0:
+            self.store.release(tenant.pk)
+
+
+_quotas = None
+_quotas_lock = threading.Lock()
+
+
+def get_tenant_quotas():
+    """
+    Return the process-wide TenantQuotas, built from settings.TENANT_QUOTAS on first use.
+    """
+    global _quotas
+    if _quotas is None:
+        with _quotas_lock:
+            if _quotas is None:
+                _quotas = TenantQuotas.from_settings()
+    return _quotas
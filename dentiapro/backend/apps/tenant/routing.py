@@ -0,0 +1,228 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Domain, Tenant
+from .schema import public_schema
+
+DEFAULT_TENANT_ROUTING = {
+    'BASE_DOMAIN': None,        # e.g. 'dentiapro.com' so that 'clinic.dentiapro.com' resolves Tenant.subdomain
+    'REBUILD_INTERVAL': 300,    # Seconds before the index is fully rebuilt to pick up changes made by other workers
+}
+
+
+def normalize_host(host):
+    """
+    Lowercase a Host header value and strip the port, trailing dot and leading 'www.'.
+    """
+    host = host.strip().lower()
+    if host.startswith('['):  # IPv6 literal, never a tenant domain
+        return host
+    host = host.rsplit(':', 1)[0].rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+class DomainTables:
+    """
+    One generation of a DomainIndex's dictionaries. A published generation is
+    never changed: updates are made to a copy that then replaces it.
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.wildcard = {}
+        self.subdomains = {}
+        self.domain_keys = {}          # Domain.pk -> ('exact' or 'wildcard', key)
+        self.domains_by_tenant = {}    # Tenant.pk -> {Domain.pk}
+        self.tenant_subdomain = {}     # Tenant.pk -> subdomain
+
+    def copy(self):
+        tables = DomainTables()
+        tables.exact = dict(self.exact)
+        tables.wildcard = dict(self.wildcard)
+        tables.subdomains = dict(self.subdomains)
+        tables.domain_keys = dict(self.domain_keys)
+        tables.domains_by_tenant = {tenant_id: set(ids) for tenant_id, ids in self.domains_by_tenant.items()}
+        tables.tenant_subdomain = dict(self.tenant_subdomain)
+        return tables
+
+    def add_subdomain(self, tenant_id, subdomain):
+        self.tenant_subdomain[tenant_id] = subdomain
+        if subdomain:
+            self.subdomains[subdomain.lower()] = tenant_id
+
+    def add_domain(self, domain_id, domain, tenant_id):
+        domain = normalize_host(domain)
+        if domain.startswith('*.'):
+            table, key = 'wildcard', domain[2:]
+        else:
+            table, key = 'exact', domain
+        getattr(self, table)[key] = tenant_id
+        self.domain_keys[domain_id] = (table, key)
+        self.domains_by_tenant.setdefault(tenant_id, set()).add(domain_id)
+
+    def remove_domain(self, domain_id):
+        entry = self.domain_keys.pop(domain_id, None)
+        if entry is None:
+            return
+        table, key = entry
+        tenant_id = getattr(self, table).pop(key, None)
+        domain_ids = self.domains_by_tenant.get(tenant_id)
+        if domain_ids is not None:
+            domain_ids.discard(domain_id)
+
+    def remove_tenant(self, tenant_id):
+        for domain_id in list(self.domains_by_tenant.pop(tenant_id, ())):
+            self.remove_domain(domain_id)
+        subdomain = self.tenant_subdomain.pop(tenant_id, None)
+        if subdomain and self.subdomains.get(subdomain.lower()) == tenant_id:
+            del self.subdomains[subdomain.lower()]
+
+
+class DomainIndex:
+    """
+    In-memory map from request host to tenant id.
+
+    Three dictionaries are kept so that a lookup is a constant number of
+    dict probes regardless of how many domains exist:
+
+    - exact domains from the `domains` table ('smile-clinic.ma'),
+    - wildcard domains stored as '*.<suffix>' and matched one label deep,
+    - `Tenant.subdomain` labels under settings.TENANT_ROUTING['BASE_DOMAIN'].
+
+    The index is built lazily on first use and then kept current by the
+    signal receivers in `apps.tenant.signals`; a periodic full rebuild picks
+    up rows changed by other processes. Rebuilds and updates prepare new
+    DomainTables and publish them with a single assignment, so lookups,
+    which take no lock, never see an index in the middle of a change.
+    """
+
+    def __init__(self, base_domain=None, rebuild_interval=300):
+        self.base_domain = normalize_host(base_domain) if base_domain else None
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._tables = DomainTables()
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_TENANT_ROUTING, **getattr(settings, 'TENANT_ROUTING', {})}
+        return cls(base_domain=options['BASE_DOMAIN'], rebuild_interval=options['REBUILD_INTERVAL'])
+
+    def lookup(self, host):
+        """
+        Return the id of the tenant serving `host`, or None.
+        """
+        self._ensure_fresh()
+        tables = self._tables
+        host = normalize_host(host)
+
+        tenant_id = tables.exact.get(host)
+        if tenant_id is not None:
+            return tenant_id
+
+        label, _, parent = host.partition('.')
+        if self.base_domain and parent == self.base_domain:
+            tenant_id = tables.subdomains.get(label)
+            if tenant_id is not None:
+                return tenant_id
+
+        return tables.wildcard.get(parent) if parent else None
+
+    def rebuild(self):
+        """
+        Reload the whole index from the database (two queries).
+        """
+        with public_schema():
+            active_tenants = dict(Tenant.objects.filter(is_active=True).values_list('id', 'subdomain'))
+            domains = list(
+                Domain.objects.filter(tenant__is_active=True).values_list('id', 'domain', 'tenant_id')
+            )
+
+        tables = DomainTables()
+        for tenant_id, subdomain in active_tenants.items():
+            tables.add_subdomain(tenant_id, subdomain)
+        for domain_id, domain, tenant_id in domains:
+            tables.add_domain(domain_id, domain, tenant_id)
+        with self._lock:
+            self._tables = tables
+            self._built_at = time.monotonic()
+
+    def update_domain(self, domain):
+        """
+        Insert or move a single Domain row.
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            tables = self._tables.copy()
+            tables.remove_domain(domain.pk)
+            if domain.tenant_id in tables.tenant_subdomain:
+                tables.add_domain(domain.pk, domain.domain, domain.tenant_id)
+            self._tables = tables
+
+    def remove_domain(self, domain_id):
+        with self._lock:
+            if self._built_at is not None:
+                tables = self._tables.copy()
+                tables.remove_domain(domain_id)
+                self._tables = tables
+
+    def update_tenant(self, tenant):
+        """
+        Re-index a tenant after its subdomain or active flag changed.
+        """
+        if self._built_at is None:
+            return
+        domains = []
+        if tenant.is_active:
+            with public_schema():
+                domains = list(Domain.objects.filter(tenant=tenant).values_list('id', 'domain'))
+        with self._lock:
+            if self._built_at is None:
+                return
+            tables = self._tables.copy()
+            tables.remove_tenant(tenant.pk)
+            if tenant.is_active:
+                tables.add_subdomain(tenant.pk, tenant.subdomain)
+                for domain_id, domain in domains:
+                    tables.add_domain(domain_id, domain, tenant.pk)
+            self._tables = tables
+
+    def remove_tenant(self, tenant_id):
+        with self._lock:
+            if self._built_at is not None:
+                tables = self._tables.copy()
+                tables.remove_tenant(tenant_id)
+                self._tables = tables
+
+    def __len__(self):
+        tables = self._tables
+        return len(tables.exact) + len(tables.wildcard) + len(tables.subdomains)
+
+    def _ensure_fresh(self):
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at < self.rebuild_interval:
+            return
+        with self._lock:
+            if self._built_at == built_at:
+                self.rebuild()
+
+
+_domain_index = None
+_domain_index_lock = threading.Lock()
+
+
+def get_domain_index():
+    """
+    Return the process-wide DomainIndex, built from settings.TENANT_ROUTING on first use.
+    """
+    global _domain_index
+    if _domain_index is None:
+        with _domain_index_lock:
+            if _domain_index is None:
+                _domain_index = DomainIndex.from_settings()
+    return _domain_index
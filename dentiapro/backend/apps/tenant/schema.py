@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import metrics
+
+switches_executed = metrics.counter(
+    'tenant_schema_switches_executed', 'search_path switches that required a SET on the connection'
+)
+switches_elided = metrics.counter(
+    'tenant_schema_switches_elided', 'search_path switches skipped because the schema was already active'
+)
+
+
+def get_public_schema_name():
+    return getattr(settings, 'PUBLIC_SCHEMA_NAME', 'public')
+
+
+def activate_schema(schema_name, include_public=True, using=DEFAULT_DB_ALIAS):
+    """
+    Point the connection's search_path at `schema_name` unless it already is.
+
+    The tenant backend re-issues `SET search_path` on the next cursor after
+    every set_schema() call, so a switch to the schema that is already active
+    is skipped entirely. If the connection was closed or rolled back since,
+    the backend still sets the path lazily on the next cursor. Returns True
+    when a switch was needed.
+    """
+    connection = connections[using]
+    if not hasattr(connection, 'set_schema'):  # Backend without schema support (e.g. plain sqlite in tooling)
+        return False
+    if connection.schema_name == schema_name and connection.include_public_schema == include_public:
+        switches_elided.inc()
+        return False
+    connection.set_schema(schema_name, include_public)
+    switches_executed.inc()
+    return True
+
+
+def activate_tenant(tenant, using=DEFAULT_DB_ALIAS):
+    switched = activate_schema(tenant.schema_name, using=using)
+    if hasattr(connections[using], 'set_schema'):
+        connections[using].tenant = tenant
+    return switched
+
+
+def activate_public(using=DEFAULT_DB_ALIAS):
+    return activate_schema(get_public_schema_name(), using=using)
+
+
+@contextmanager
+def public_schema(using=DEFAULT_DB_ALIAS):
+    """
+    Run the block on the public schema and restore the previous schema afterwards.
+    Shared tables (tenants, domains) also exist in every tenant schema, so
+    lookups of tenant metadata must always run here.
+    """
+    connection = connections[using]
+    previous = getattr(connection, 'tenant', None)
+    activate_public(using)
+    try:
+        yield
+    finally:
+        if previous is not None and getattr(previous, 'schema_name', None) != get_public_schema_name():
+            activate_tenant(previous, using)
+
+
+def run_migrations(schema_name, using=DEFAULT_DB_ALIAS, **options):
+    """
+    Run `migrate` for one schema of one database.
+
+    migrate_schemas only knows the default connection; this works on any alias
+    using the tenant backend (TenantShardRouter.allow_migrate() picks the apps
+    from the schema active on that connection).
+    """
+    activate_schema(schema_name, using=using)
+    try:
+        call_command('migrate', database=using, interactive=False, **options)
+    finally:
+        activate_public(using)
@@ -21,7 +21,7 @@ class DomainSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 class TenantDetailSerializer(serializers.ModelSerializer):
-    domains = DomainSerializer(many=True, read_only=True, source='domain_set')
+    domains = DomainSerializer(many=True, read_only=True)
 
     class Meta:
         model = Tenant
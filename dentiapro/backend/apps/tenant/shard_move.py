@@ -0,0 +1,291 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from psycopg2.extras import execute_values
+
+from .cache import DEFAULT_TENANT_CACHE
+from .provisioning import get_provisioner
+from .schema import public_schema
+
+logger = logging.getLogger(__name__)
+
+# Tables the template clone already fills in on the target.
+SKIPPED_TABLES = ('django_migrations',)
+
+
+class ShardMoveError(Exception):
+    """
+    Raised when a tenant cannot be moved to another shard.
+    """
+
+
+def quote(*names):
+    return '.'.join('"{}"'.format(name.replace('"', '""')) for name in names)
+
+
+class TenantShardMove:
+    """
+    Move a tenant's schema to another shard while it keeps serving requests.
+
+    1. The schema is created on the target by cloning the template there.
+    2. Every table is copied in primary-key chunks from one REPEATABLE READ
+       snapshot of the source, in a single target transaction (Django's
+       foreign keys are deferrable, so table order does not matter). The
+       clinic's users (apps.users) are tenant tables and move with it; rows
+       of shared tables the tenant's rows point at (content types,
+       django.contrib.auth users, ...) are mirrored into the target's public
+       schema.
+    3. Writes are frozen (Tenant.writes_frozen) and we wait until every worker
+       has dropped its cached copy of the tenant.
+    4. Every row whose checksum differs between the two sides is copied
+       again and rows deleted meanwhile are deleted on the target. Checksums
+       see every change, QuerySet.update() and raw SQL included, which do
+       not bump updated_at. Per-table checksums are then compared.
+    5. The shard map is flipped and writes are unfrozen in the same save.
+
+    Reads are served throughout, writes are refused (503) only during steps
+    3 and 4. On failure before the flip, the target schema is dropped and the
+    tenant unfrozen.
+    """
+
+    def __init__(self, tenant, target, chunk_size=5000, propagation_delay=None, log=None):
+        self.tenant = tenant
+        self.source = tenant.shard
+        self.target = target
+        self.schema_name = tenant.schema_name
+        self.chunk_size = chunk_size
+        if propagation_delay is None:
+            cache_options = {**DEFAULT_TENANT_CACHE, **getattr(settings, 'TENANT_CACHE', {})}
+            propagation_delay = cache_options['TTL'] + 5
+        self.propagation_delay = propagation_delay
+        self.log = log or logger.info
+
+    def run(self, drop_source=False):
+        if self.target == self.source:
+            raise ShardMoveError(f"Tenant '{self.schema_name}' is already on '{self.target}'.")
+        if self.target not in connections.databases:
+            raise ShardMoveError(f"Unknown shard '{self.target}'.")
+
+        started = time.monotonic()
+        provisioner = get_provisioner(self.target)
+        if provisioner.schema_exists(self.schema_name):
+            raise ShardMoveError(f"Schema '{self.schema_name}' already exists on '{self.target}'.")
+        provisioner.prepare_template()
+        provisioner.provision(self.schema_name)
+        self.log(f"Created schema '{self.schema_name}' on '{self.target}'")
+
+        try:
+            self.bulk_copy()
+            self.set_frozen(True)
+            self.log(f"Writes frozen; waiting {self.propagation_delay}s for workers to notice")
+            time.sleep(self.propagation_delay)
+            frozen_at = time.monotonic()
+            self.catch_up()
+            self.verify()
+            with public_schema():
+                self.tenant.shard = self.target
+                self.tenant.writes_frozen = False
+                self.tenant.save(update_fields=['shard', 'writes_frozen', 'updated_at'])
+        except BaseException:
+            self.log("Move failed; dropping the copy on the target and unfreezing writes")
+            self.drop_schema(self.target)
+            self.set_frozen(False)
+            raise
+        self.log(
+            f"Moved '{self.schema_name}' from '{self.source}' to '{self.target}' in "
+            f"{time.monotonic() - started:.1f}s (writes frozen for {time.monotonic() - frozen_at:.1f}s "
+            f"after a {self.propagation_delay}s notice period)"
+        )
+
+        if drop_source:
+            # Workers that have not seen the flip yet still read from the source.
+            time.sleep(self.propagation_delay)
+            self.drop_schema(self.source)
+            self.log(f"Dropped schema '{self.schema_name}' on '{self.source}'")
+
+    def bulk_copy(self):
+        """
+        Copy every table from a consistent snapshot.
+        """
+        source, target = connections[self.source], connections[self.target]
+        with source.cursor() as src:
+            # Read-only snapshot, opened by hand: Django does not manage isolation levels per transaction.
+            src.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            try:
+                with transaction.atomic(using=self.target), target.cursor() as dst:
+                    for table in self.tables(src):
+                        copied = self.copy_rows(src, dst, table)
+                        self.log(f"  {table}: {copied} rows")
+                    self.mirror_shared_rows(src, dst)
+                    self.reset_sequences(dst)
+            finally:
+                src.execute('COMMIT')
+
+    def catch_up(self):
+        """
+        Copy again the rows whose checksum differs from the target's (or that
+        it lacks) and delete the rows the source no longer has.
+        """
+        source, target = connections[self.source], connections[self.target]
+        # Writes are frozen, so the source does not need a snapshot here.
+        with transaction.atomic(using=self.target):
+            with source.cursor() as src, target.cursor() as dst:
+                for table in self.tables(src):
+                    pk = self.primary_key(src, table)
+                    source_rows, target_rows = self.row_checksums(src, table, pk), self.row_checksums(dst, table, pk)
+                    changed = [key for key, checksum in source_rows.items() if target_rows.get(key) != checksum]
+                    deleted = [key for key in target_rows if key not in source_rows]
+                    for start in range(0, len(changed), self.chunk_size):
+                        keys = changed[start:start + self.chunk_size]
+                        self.copy_rows(src, dst, table, (f'{quote(pk)} = ANY(%s)', [keys]))
+                    for start in range(0, len(deleted), self.chunk_size):
+                        dst.execute(
+                            f'DELETE FROM {quote(self.schema_name, table)} WHERE {quote(pk)} = ANY(%s)',
+                            [deleted[start:start + self.chunk_size]],
+                        )
+                    if changed or deleted:
+                        self.log(f"  {table}: {len(changed)} rows copied again, {len(deleted)} deleted")
+                self.mirror_shared_rows(src, dst)
+                self.reset_sequences(dst)
+
+    def verify(self):
+        """
+        Compare the row count and a checksum of every row of each table.
+        """
+        with connections[self.source].cursor() as src, connections[self.target].cursor() as dst:
+            for table in self.tables(src):
+                pk = self.primary_key(src, table)
+                results = []
+                for cursor in (src, dst):
+                    cursor.execute(
+                        f"SELECT count(*), md5(string_agg(md5(ROW(t.*)::text), '' ORDER BY {quote(pk)})) "
+                        f"FROM {quote(self.schema_name, table)} AS t"
+                    )
+                    results.append(cursor.fetchone())
+                (source_count, source_checksum), (target_count, target_checksum) = results
+                if source_count != target_count:
+                    raise ShardMoveError(
+                        f"Row counts differ for {table}: {source_count} on source, {target_count} on target."
+                    )
+                if source_checksum != target_checksum:
+                    raise ShardMoveError(f"Rows of {table} differ between source and target.")
+
+    def row_checksums(self, cursor, table, pk):
+        """
+        {primary key: md5 of the row's text representation} for `table`.
+        """
+        # ROW(t.*), not t: a column named t would shadow the row.
+        cursor.execute(f'SELECT {quote(pk)}, md5(ROW(t.*)::text) FROM {quote(self.schema_name, table)} AS t')
+        return dict(cursor.fetchall())
+
+    def tables(self, cursor):
+        cursor.execute(
+            "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = %s AND c.relkind = 'r' ORDER BY c.relname",
+            [self.schema_name],
+        )
+        return [table for table, in cursor.fetchall() if table not in SKIPPED_TABLES]
+
+    def columns(self, cursor, table, schema_name=None):
+        cursor.execute(
+            # Generated columns are computed by the target and cannot be inserted.
+            "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+            "AND attgenerated = '' ORDER BY attnum",
+            [quote(schema_name or self.schema_name, table)],
+        )
+        return [column for column, in cursor.fetchall()]
+
+    def primary_key(self, cursor, table, schema_name=None):
+        cursor.execute(
+            "SELECT a.attname FROM pg_index i "
+            "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+            "WHERE i.indrelid = %s::regclass AND i.indisprimary",
+            [quote(schema_name or self.schema_name, table)],
+        )
+        columns = [column for column, in cursor.fetchall()]
+        if len(columns) != 1:
+            raise ShardMoveError(f"Table {table} has no single-column primary key.")
+        return columns[0]
+
+    def copy_rows(self, src, dst, table, where=None, schema_name=None):
+        """
+        Upsert the rows of `table` (matching `where`) into the target, in
+        primary-key order and chunks of `chunk_size`. Returns the row count.
+        """
+        schema_name = schema_name or self.schema_name
+        columns = self.columns(src, table, schema_name)
+        pk = self.primary_key(src, table, schema_name)
+        column_list = ', '.join(quote(column) for column in columns)
+        updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in columns if column != pk)
+        insert = (
+            f'INSERT INTO {quote(schema_name, table)} ({column_list}) OVERRIDING SYSTEM VALUE VALUES %s '
+            f'ON CONFLICT ({quote(pk)}) DO ' + (f'UPDATE SET {updates}' if updates else 'NOTHING')
+        )
+        condition, params = where or ('TRUE', [])
+        pk_index = columns.index(pk)
+
+        copied, last_pk = 0, None
+        while True:
+            keyset = '' if last_pk is None else f' AND {quote(pk)} > %s'
+            src.execute(
+                f'SELECT {column_list} FROM {quote(schema_name, table)} WHERE {condition}{keyset} '
+                f'ORDER BY {quote(pk)} LIMIT {int(self.chunk_size)}',
+                params + ([] if last_pk is None else [last_pk]),
+            )
+            rows = src.fetchall()
+            if not rows:
+                return copied
+            execute_values(dst.cursor, insert, rows, page_size=len(rows))
+            copied += len(rows)
+            last_pk = rows[-1][pk_index]
+
+    def mirror_shared_rows(self, src, dst):
+        """
+        Copy the rows of tables outside the tenant schema (e.g. public.auth_user)
+        that the tenant's rows reference, so the target's foreign keys hold
+        even if replication of the shared tables lags behind.
+        """
+        src.execute(
+            "SELECT c.relname, a.attname, rn.nspname, rc.relname, ra.attname "
+            "FROM pg_constraint con "
+            "JOIN pg_class c ON c.oid = con.conrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "JOIN pg_class rc ON rc.oid = con.confrelid JOIN pg_namespace rn ON rn.oid = rc.relnamespace "
+            "JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = con.conkey[1] "
+            "JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = con.confkey[1] "
+            "WHERE con.contype = 'f' AND n.nspname = %s AND rn.nspname <> n.nspname",
+            [self.schema_name],
+        )
+        for table, column, ref_schema, ref_table, ref_column in src.fetchall():
+            src.execute(
+                f'SELECT DISTINCT {quote(column)} FROM {quote(self.schema_name, table)} '
+                f'WHERE {quote(column)} IS NOT NULL'
+            )
+            keys = [key for key, in src.fetchall()]
+            if keys:
+                self.copy_rows(src, dst, ref_table, (f'{quote(ref_column)} = ANY(%s)', [keys]), schema_name=ref_schema)
+
+    def reset_sequences(self, dst):
+        dst.execute(
+            "SELECT c.relname, a.attname, pg_get_serial_sequence(format('%%I.%%I', n.nspname, c.relname), a.attname) "
+            "FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = %s AND c.relkind = 'r' AND a.attnum > 0 AND NOT a.attisdropped",
+            [self.schema_name],
+        )
+        for table, column, sequence in dst.fetchall():
+            if sequence:
+                dst.execute(
+                    f'SELECT setval(%s, max({quote(column)})) FROM {quote(self.schema_name, table)} '
+                    f'HAVING max({quote(column)}) IS NOT NULL',
+                    [sequence],
+                )
+
+    def set_frozen(self, frozen):
+        with public_schema():
+            self.tenant.writes_frozen = frozen
+            self.tenant.save(update_fields=['writes_frozen', 'updated_at'])
+
+    def drop_schema(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {quote(self.schema_name)} CASCADE')
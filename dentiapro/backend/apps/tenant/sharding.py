@@ -0,0 +1,143 @@
+"""
+Tenant sharding across several Postgres databases.
+
+The shard map is the `shard` column of the shared Tenant table: it names the
+DATABASES alias holding the tenant's schema. TenantMiddleware activates the
+tenant's schema on that alias and records it as the current shard, and
+TenantShardRouter sends queries for tenant-app models there. Shared apps
+(tenants, domains, users, ...) always live on the default database.
+
+Replicas (DATABASES entries with 'REPLICA_OF') serve the reads of their
+primary inside allow_replica_reads(); see core.db.replicas.
+
+Every shard has its own public schema with the shared tables, migrated by
+`manage.py migrate_tenants`. Tenant tables have foreign keys to shared ones
+(e.g. appointments to users) and are joined with them by select_related, so
+those shared tables have to be replicated from the default database to each
+shard's public schema (Postgres logical replication).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.db.replicas import get_replica_set, replica_reads_allowed
+from .schema import activate_schema, get_public_schema_name
+
+_current_shard = ContextVar('tenant_shard', default=None)
+
+
+def get_current_shard():
+    """
+    Return the database alias of the tenant being served, or None outside a tenant request.
+    """
+    return _current_shard.get()
+
+
+def set_current_shard(alias):
+    return _current_shard.set(alias)
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Route tenant-app queries in the block to `alias`.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def shard_for(tenant):
+    alias = getattr(tenant, 'shard', None) or DEFAULT_DB_ALIAS
+    if alias not in connections.databases:
+        raise ImproperlyConfigured(f"Tenant {tenant.pk} is on shard '{alias}', which is not in DATABASES.")
+    return alias
+
+
+def get_shard_aliases():
+    """
+    Aliases of the (primary) databases that hold tenant schemas.
+    """
+    return [
+        alias for alias in connections
+        if hasattr(connections[alias], 'set_schema') and not connections.databases[alias].get('REPLICA_OF')
+    ]
+
+
+def _app_labels(app_names):
+    return {name.rsplit('.', 1)[-1] for name in app_names}
+
+
+@lru_cache(maxsize=None)
+def _tenant_only_labels():
+    return frozenset(
+        _app_labels(getattr(settings, 'TENANT_APPS', ())) - _app_labels(getattr(settings, 'SHARED_APPS', ()))
+    )
+
+
+def is_tenant_model(model):
+    """
+    True for models of apps that only exist in tenant schemas.
+    """
+    return model._meta.app_label in _tenant_only_labels()
+
+
+class TenantShardRouter:
+    """
+    Send tenant-app models to the current tenant's shard and shared apps to
+    the default database, or to a replica of either when replica reads are
+    allowed (see core.db.replicas).
+
+    Also replaces TenantSyncRouter's allow_migrate(), which only looks at the
+    schema of the default connection: here the shared/tenant decision is made
+    from the schema active on the connection being migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        primary = self.primary_for(model, hints)
+        if primary is not None and replica_reads_allowed():
+            replica = get_replica_set().pick(primary)
+            if replica is not None:
+                source = connections[primary]
+                if hasattr(source, 'set_schema'):
+                    # The replica connection has to be on the same schema as the primary.
+                    activate_schema(source.schema_name, source.include_public_schema, using=replica)
+                return replica
+        return primary
+
+    def db_for_write(self, model, **hints):
+        return self.primary_for(model, hints)
+
+    def primary_for(self, model, hints):
+        instance = hints.get('instance')
+        if not is_tenant_model(model):
+            return DEFAULT_DB_ALIAS
+        if instance is not None and is_tenant_model(type(instance)) and instance._state.db:
+            # Rows read from a replica are written back to its primary.
+            return get_replica_set().primary_of(instance._state.db)
+        return get_current_shard()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shared rows are replicated to every shard, so tenant rows may point at them.
+        if not is_tenant_model(type(obj1)) or not is_tenant_model(type(obj2)):
+            return True
+        replicas = get_replica_set()
+        return replicas.primary_of(obj1._state.db) == replicas.primary_of(obj2._state.db)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        connection = connections[db]
+        if not hasattr(connection, 'set_schema'):
+            return None
+        if get_replica_set().is_replica(db):
+            return False
+        if connection.schema_name == get_public_schema_name():
+            allowed = _app_labels(settings.SHARED_APPS)
+        else:
+            allowed = _app_labels(settings.TENANT_APPS)
+        return None if app_label in allowed else False
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.response_cache import get_response_cache
+from .cache import get_tenant_cache
+from .models import Domain, Tenant
+from .routing import get_domain_index
+
+
+@receiver(post_save, sender=Tenant)
+def tenant_saved(sender, instance, **kwargs):
+    """Drop the cached copy of a tenant and re-index its subdomain."""
+    get_tenant_cache().invalidate(instance.pk)
+    get_domain_index().update_tenant(instance)
+
+
+@receiver(post_delete, sender=Tenant)
+def tenant_deleted(sender, instance, **kwargs):
+    get_tenant_cache().invalidate(instance.pk)
+    get_domain_index().remove_tenant(instance.pk)
+
+
+@receiver(post_save, sender=Domain)
+def domain_saved(sender, instance, **kwargs):
+    """Drop every cached lookup of the domain's tenant and move the domain in the index."""
+    get_tenant_cache().invalidate(instance.tenant_id)
+    get_domain_index().update_domain(instance)
+
+
+@receiver(post_delete, sender=Domain)
+def domain_deleted(sender, instance, **kwargs):
+    get_tenant_cache().invalidate(instance.tenant_id)
+    get_domain_index().remove_domain(instance.pk)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def tenant_row_changed(sender, instance, **kwargs):
+    """
+    Invalidate the tenant's cached API responses and list ETags built from
+    this model, once the write is committed.
+    """
+    tenant_id = getattr(instance, 'tenant_id', None)
+    if tenant_id is not None:
+        get_response_cache().bump_on_commit(tenant_id, sender, using=instance._state.db)
@@ -1,7 +1,28 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from io import StringIO
+from asgiref.sync import async_to_sync
 from django.test import TestCase
 from .models import Tenant, Domain
 from django.utils import timezone
 from django.db import IntegrityError
+from .cache import TenantCache
+from .routing import DomainIndex, normalize_host
+from .schema import activate_schema, switches_elided, switches_executed
+from unittest import mock
+from django.test import RequestFactory, override_settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from .middleware import TenantMiddleware, TenantQuotaMiddleware
+from .quotas import CacheQuotaStore, LocalQuotaStore, TenantQuotas
+from .sharding import TenantShardRouter, _tenant_only_labels, get_current_shard, set_current_shard, use_shard
+from .provisioning import SchemaProvisioner
+from django.core.management import CommandError, call_command
+from django.contrib.auth import get_user_model
+from django.db import connections
+from core.db.replicas import ReplicaSet, allow_replica_reads
 
 class TenantModelTest(TestCase):
     def setUp(self):
@@ -33,3 +54,424 @@ class TenantModelTest(TestCase):
                 schema_name='duplicate_tenant',
                 email=self.tenant.email  # This should raise an error
             )
+
+class TenantCacheTest(TestCase):
+    def setUp(self):
+        self.cache = TenantCache(max_size=2, ttl=60)
+        self.loads = []
+
+    def load(self, tenant_id):
+        def loader():
+            self.loads.append(tenant_id)
+            return Tenant(id=tenant_id, name=f'Tenant {tenant_id}')
+        return loader
+
+    def test_steady_state_lookups_hit_the_cache(self):
+        hits, misses = self.cache.hits.value, self.cache.misses.value
+        for _ in range(5):
+            tenant = self.cache.get_or_load('id', 1, self.load(1))
+        self.assertEqual(tenant.name, 'Tenant 1')
+        self.assertEqual(self.loads, [1])
+        self.assertEqual(self.cache.hits.value - hits, 4)
+        self.assertEqual(self.cache.misses.value - misses, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.cache.get_or_load('id', 2, self.load(2))
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.cache.get_or_load('id', 3, self.load(3))
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.cache.get_or_load('id', 2, self.load(2))
+        self.assertEqual(self.loads, [1, 2, 3, 2])
+
+    def test_expired_entries_are_reloaded(self):
+        self.cache.ttl = 0
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.assertEqual(self.loads, [1, 1])
+
+    def test_invalidate_drops_every_key_of_the_tenant(self):
+        self.cache.get_or_load('id', 1, self.load(1))
+        self.cache.get_or_load('host', 'clinic.example.com', self.load(1))
+        self.cache.invalidate(1)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_missing_tenant_is_not_cached(self):
+        def loader():
+            raise Tenant.DoesNotExist
+        with self.assertRaises(Tenant.DoesNotExist):
+            self.cache.get_or_load('id', 99, loader)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+class DomainIndexTest(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='owner', email='owner@example.com', password='testpass123')
+        self.tenant = Tenant.objects.create(
+            name='Smile Clinic', subdomain='smile', schema_name='smile', address='1 Main St', phone='0600000000',
+            email='smile@example.com', owner=self.owner,
+        )
+        self.other = Tenant.objects.create(
+            name='Other Clinic', subdomain='other', schema_name='other', address='2 Main St', phone='0600000001',
+            email='other@example.com', owner=self.owner,
+        )
+        Domain.objects.create(domain='smile-clinic.ma', tenant=self.tenant, is_primary=True)
+        Domain.objects.create(domain='*.groupe-other.ma', tenant=self.other)
+        self.index = DomainIndex(base_domain='dentiapro.com')
+
+    def test_normalize_host(self):
+        self.assertEqual(normalize_host('WWW.Smile-Clinic.ma:8000'), 'smile-clinic.ma')
+        self.assertEqual(normalize_host('smile-clinic.ma.'), 'smile-clinic.ma')
+
+    def test_lookup_exact_subdomain_and_wildcard(self):
+        self.assertEqual(self.index.lookup('smile-clinic.ma'), self.tenant.id)
+        self.assertEqual(self.index.lookup('smile.dentiapro.com'), self.tenant.id)
+        self.assertEqual(self.index.lookup('casa.groupe-other.ma'), self.other.id)
+        self.assertIsNone(self.index.lookup('a.b.groupe-other.ma'))
+        self.assertIsNone(self.index.lookup('unknown.example.com'))
+
+    def test_lookups_do_not_query_once_built(self):
+        self.index.lookup('smile-clinic.ma')
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.index.lookup('smile-clinic.ma')
+                self.index.lookup('other.dentiapro.com')
+
+    def test_incremental_updates(self):
+        self.index.lookup('smile-clinic.ma')
+        domain = Domain.objects.get(domain='smile-clinic.ma')
+        domain.tenant = self.other
+        self.index.update_domain(domain)
+        self.assertEqual(self.index.lookup('smile-clinic.ma'), self.other.id)
+
+        self.index.remove_domain(domain.pk)
+        self.assertIsNone(self.index.lookup('smile-clinic.ma'))
+
+        self.other.is_active = False
+        self.index.update_tenant(self.other)
+        self.assertIsNone(self.index.lookup('other.dentiapro.com'))
+        self.assertIsNone(self.index.lookup('casa.groupe-other.ma'))
+
+    def test_updates_publish_new_tables(self):
+        self.index.lookup('smile-clinic.ma')
+        published = self.index._tables
+        self.tenant.subdomain = 'sourire'
+        self.index.update_tenant(self.tenant)
+        # A lookup still reading the previous generation sees it whole.
+        self.assertEqual(published.subdomains, {'smile': self.tenant.id, 'other': self.other.id})
+        self.assertEqual(published.exact, {'smile-clinic.ma': self.tenant.id})
+        self.assertEqual(self.index.lookup('sourire.dentiapro.com'), self.tenant.id)
+        self.assertIsNone(self.index.lookup('smile.dentiapro.com'))
+        self.assertEqual(self.index.lookup('smile-clinic.ma'), self.tenant.id)
+
+class SchemaSwitchTest(TestCase):
+    def setUp(self):
+        self.connection = mock.Mock(schema_name='public', include_public_schema=True)
+        self.connection.set_schema.side_effect = self.set_schema
+        patcher = mock.patch('apps.tenant.schema.connections', {'default': self.connection})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_schema(self, schema_name, include_public=True):
+        self.connection.schema_name = schema_name
+        self.connection.include_public_schema = include_public
+
+    def test_switch_to_active_schema_is_elided(self):
+        executed, elided = switches_executed.value, switches_elided.value
+        self.assertTrue(activate_schema('clinic_a'))
+        self.assertFalse(activate_schema('clinic_a'))
+        self.assertFalse(activate_schema('clinic_a'))
+        self.assertTrue(activate_schema('public'))
+        self.assertEqual(self.connection.set_schema.call_count, 2)
+        self.assertEqual(switches_executed.value - executed, 2)
+        self.assertEqual(switches_elided.value - elided, 2)
+
+class TenantMiddlewareTest(TestCase):
+    def setUp(self):
+        self.tenant = Tenant(id=1, name='Smile Clinic', schema_name='smile')
+        self.factory = RequestFactory()
+        for name in ('activate_tenant', 'activate_public'):
+            patcher = mock.patch(f'apps.tenant.middleware.{name}')
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def middleware(self, view):
+        middleware = TenantMiddleware(view)
+        middleware.tenant_cache = mock.Mock(get_tenant=mock.Mock(return_value=self.tenant))
+        return middleware
+
+    def test_schema_is_kept_after_successful_request(self):
+        response = self.middleware(lambda request: HttpResponse())(self.factory.get('/', HTTP_X_TENANT_ID='1'))
+        self.assertEqual(response.status_code, 200)
+        self.activate_tenant.assert_called_once_with(self.tenant, using='default')
+        self.activate_public.assert_not_called()
+
+    def test_schema_is_reset_when_view_raises(self):
+        def view(request):
+            raise RuntimeError('boom')
+        with self.assertRaises(RuntimeError):
+            self.middleware(view)(self.factory.get('/', HTTP_X_TENANT_ID='1'))
+        self.activate_public.assert_called_once_with('default')
+
+    def test_schema_is_reset_on_server_error(self):
+        self.middleware(lambda request: HttpResponse(status=500))(self.factory.get('/', HTTP_X_TENANT_ID='1'))
+        self.activate_public.assert_called_once_with('default')
+
+    def test_async_chain_activates_schema(self):
+        async def view(request):
+            return HttpResponse()
+        middleware = self.middleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(self.factory.get('/', HTTP_X_TENANT_ID='1'))
+        self.assertEqual(response.status_code, 200)
+        self.activate_tenant.assert_called_once_with(self.tenant, using='default')
+        self.activate_public.assert_not_called()
+
+    def test_frozen_tenant_refuses_writes(self):
+        self.tenant.writes_frozen = True
+        middleware = self.middleware(lambda request: HttpResponse())
+        self.assertEqual(middleware(self.factory.get('/', HTTP_X_TENANT_ID='1')).status_code, 200)
+        response = middleware(self.factory.post('/', HTTP_X_TENANT_ID='1'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_tenant_shard_becomes_current(self):
+        seen = []
+        self.middleware(lambda request: seen.append(get_current_shard()) or HttpResponse())(
+            self.factory.get('/', HTTP_X_TENANT_ID='1')
+        )
+        self.assertEqual(seen, ['default'])
+
+
+class OnboardTenantsCommandTest(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(username='owner', email='owner@example.com', password='testpass123')
+        Tenant.objects.create(
+            name='Taken Clinic', subdomain='taken', schema_name='taken', address='1 Main St', phone='0600000000',
+            email='taken@example.com', owner=get_user_model().objects.get(),
+        )
+        self.provisioner = SchemaProvisioner()
+        self.provisioner.prepare_template = mock.Mock(return_value=False)
+        self.provisioner.provision = mock.Mock()
+        patcher = mock.patch(
+            'apps.tenant.management.commands.onboard_tenants.get_provisioner', return_value=self.provisioner
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_csv(self, rows):
+        f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        self.addCleanup(os.unlink, f.name)
+        with f:
+            f.write('name,subdomain,address,phone,email,domains\n')
+            f.writelines(f'{row}\n' for row in rows)
+        return f.name
+
+    def test_onboards_rows_and_reports_failures(self):
+        path = self.write_csv([
+            'Smile Clinic,smile-casa,1 Main St,0600000001,smile@example.com,smile-clinic.ma;smile.ma',
+            'Duplicate Clinic,dup,2 Main St,0600000002,taken@example.com,',
+        ])
+        out, err = StringIO(), StringIO()
+        with self.assertRaisesMessage(CommandError, 'Onboarded 1/2 tenants'):
+            call_command('onboard_tenants', path, owner='owner@example.com', workers=1, stdout=out, stderr=err)
+
+        tenant = Tenant.objects.get(subdomain='smile-casa')
+        self.assertEqual(tenant.schema_name, 'smile_casa')
+        self.assertEqual(
+            list(tenant.domains.order_by('-is_primary').values_list('domain', flat=True)), ['smile-clinic.ma', 'smile.ma']
+        )
+        self.provisioner.provision.assert_any_call('smile_casa')
+        self.assertIn('OK    smile_casa', out.getvalue())
+        self.assertIn('FAIL  dup', err.getvalue())
+        self.assertFalse(Tenant.objects.filter(subdomain='dup').exists())
+
+    def test_rejects_invalid_schema_names(self):
+        path = self.write_csv(['Bad Clinic,pg_bad,1 Main St,0600000001,bad@example.com,'])
+        with self.assertRaisesMessage(CommandError, "invalid schema name 'pg_bad'"):
+            call_command('onboard_tenants', path, owner='owner@example.com', workers=1)
+        self.provisioner.provision.assert_not_called()
+
+
+class MigrateTenantsCommandTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.checkpoint = os.path.join(directory, 'checkpoint.json')
+        self.failing = set()
+        self.migrated = []
+        command = 'apps.tenant.management.commands.migrate_tenants'
+        for target, kwargs in (
+            (f'{command}.Command.get_schemas', {'return_value': [
+                ('default', 'tenant_template'), ('default', 'smile'), ('shard1', 'other'),
+            ]}),
+            (f'{command}.migrate_schema', {'side_effect': self.fake_migrate}),
+        ):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_migrate(self, alias, schema_name, verbosity=0):
+        self.migrated.append(schema_name)
+        error = 'boom' if schema_name in self.failing else None
+        return alias, schema_name, 0.01, error, ''
+
+    def run_command(self, **options):
+        call_command(
+            'migrate_tenants', workers=1, skip_public=True, checkpoint=self.checkpoint,
+            stdout=StringIO(), stderr=StringIO(), **options
+        )
+
+    def test_failed_run_resumes_from_checkpoint(self):
+        self.failing = {'smile'}
+        with self.assertRaisesMessage(CommandError, '1 failed (default.smile)'):
+            self.run_command()
+        self.assertEqual(self.migrated, ['tenant_template', 'smile', 'other'])
+
+        self.failing = set()
+        self.migrated = []
+        self.run_command(resume=True)
+        self.assertEqual(self.migrated, ['smile'])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_fail_fast_stops_scheduling(self):
+        self.failing = {'tenant_template'}
+        with self.assertRaises(CommandError):
+            self.run_command(fail_fast=True)
+        self.assertEqual(self.migrated, ['tenant_template'])
+
+
+class TenantQuotaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tenant = Tenant(id=1, name='Smile Clinic', schema_name='smile')
+        self.factory = RequestFactory()
+
+    def quotas(self, store=None, **defaults):
+        return TenantQuotas(store or LocalQuotaStore(), defaults)
+
+    def test_token_bucket_allows_burst_then_refills(self):
+        quotas = self.quotas(RATE=10, BURST=3, MAX_CONCURRENT=0)
+        with mock.patch('apps.tenant.quotas.time.monotonic', return_value=100.0):
+            self.assertEqual([quotas.admit(self.tenant) for _ in range(3)], [None] * 3)
+            reason, retry_after = quotas.admit(self.tenant)
+        self.assertEqual(reason, 'rate')
+        self.assertAlmostEqual(retry_after, 0.1)
+        with mock.patch('apps.tenant.quotas.time.monotonic', return_value=100.2):
+            self.assertIsNone(quotas.admit(self.tenant))
+
+    def test_per_tenant_overrides(self):
+        quotas = self.quotas(RATE=1, BURST=1, MAX_CONCURRENT=0)
+        self.tenant.rate_limit_per_second = 0  # Unlimited
+        self.assertEqual([quotas.admit(self.tenant) for _ in range(5)], [None] * 5)
+
+    def test_concurrency_limit_shared_through_cache(self):
+        quotas = self.quotas(CacheQuotaStore('default'), RATE=0, MAX_CONCURRENT=2)
+        self.assertIsNone(quotas.admit(self.tenant))
+        self.assertIsNone(quotas.admit(self.tenant))
+        self.assertEqual(quotas.admit(self.tenant), ('concurrency', 1))
+        quotas.release(self.tenant)
+        self.assertIsNone(quotas.admit(self.tenant))
+
+    def test_concurrency_counter_outlives_requests_and_never_goes_negative(self):
+        store = CacheQuotaStore('default', concurrency_ttl=60)
+        quotas = self.quotas(store, RATE=0, MAX_CONCURRENT=2)
+        with mock.patch.object(store.cache, 'touch', wraps=store.cache.touch) as touch:
+            self.assertIsNone(quotas.admit(self.tenant))
+            self.assertIsNone(quotas.admit(self.tenant))
+        self.assertEqual(touch.call_count, 2)  # TTL refreshed by every acquire
+
+        cache.delete(f'tenant_quota:{self.tenant.pk}:in_flight')  # Expired anyway (e.g. idle past the TTL)
+        self.assertIsNone(quotas.admit(self.tenant))
+        quotas.release(self.tenant)
+        quotas.release(self.tenant)  # Slots taken before the reset
+        quotas.release(self.tenant)
+        self.assertIsNone(quotas.admit(self.tenant))
+        self.assertIsNone(quotas.admit(self.tenant))
+        self.assertEqual(quotas.admit(self.tenant), ('concurrency', 1))
+
+    def test_cache_rate_window(self):
+        quotas = self.quotas(CacheQuotaStore('default'), RATE=2, BURST=2, MAX_CONCURRENT=0)
+        with mock.patch('apps.tenant.quotas.time.time', return_value=1000.5):
+            self.assertEqual([quotas.admit(self.tenant) for _ in range(2)], [None] * 2)
+            self.assertEqual(quotas.admit(self.tenant), ('rate', 0.5))
+
+    def test_middleware_answers_429_and_releases_slot(self):
+        quotas = self.quotas(RATE=0, MAX_CONCURRENT=1)
+        middleware = TenantQuotaMiddleware(lambda request: HttpResponse())
+        middleware.quotas = quotas
+        request = self.factory.get('/')
+        request.tenant = self.tenant
+
+        self.assertEqual(middleware(request).status_code, 200)  # Slot is released afterwards
+        quotas.admit(self.tenant)                               # Hold the only slot
+        response = middleware(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_streaming_response_holds_slot_until_closed(self):
+        quotas = self.quotas(RATE=0, MAX_CONCURRENT=1)
+        middleware = TenantQuotaMiddleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+        middleware.quotas = quotas
+        request = self.factory.get('/')
+        request.tenant = self.tenant
+
+        response = middleware(request)
+        self.assertEqual(middleware(request).status_code, 429)  # Body not sent yet
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertIsNone(quotas.admit(self.tenant))
+
+
+
+@override_settings(SHARED_APPS=('django.contrib.auth',), TENANT_APPS=('apps.tenant',))
+class TenantShardRouterTest(TestCase):
+    def setUp(self):
+        _tenant_only_labels.cache_clear()
+        self.addCleanup(_tenant_only_labels.cache_clear)
+        # Middleware tests leave their tenant's shard current.
+        self.addCleanup(set_current_shard, get_current_shard())
+        set_current_shard(None)
+        self.router = TenantShardRouter()
+        self.user = get_user_model()(username='owner')
+
+    def test_tenant_models_follow_current_shard(self):
+        self.assertIsNone(self.router.db_for_read(Tenant))
+        with use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(Tenant), 'shard1')
+            self.assertEqual(self.router.db_for_write(Tenant), 'shard1')
+            self.assertEqual(self.router.db_for_read(get_user_model()), 'default')
+
+    def test_instance_hint_wins_over_current_shard(self):
+        tenant = Tenant()
+        tenant._state.db = 'shard2'
+        with use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(Tenant, instance=tenant), 'shard2')
+            self.assertEqual(self.router.db_for_read(Tenant, instance=self.user), 'shard1')
+
+    def test_relations_to_shared_rows_are_allowed(self):
+        self.assertTrue(self.router.allow_relation(Tenant(), self.user))
+        self.assertTrue(self.router.allow_relation(Tenant(), Tenant()))
+
+    def test_replica_reads(self):
+        replica = {**connections.databases['default'], 'REPLICA_OF': 'default'}
+        with mock.patch.dict(connections.databases, {'default_ro': replica}), \
+                mock.patch('apps.tenant.sharding.get_replica_set', return_value=ReplicaSet()), \
+                mock.patch.object(ReplicaSet, 'lag', return_value=0), \
+                mock.patch.object(connections['default'], 'in_atomic_block', False), use_shard('default'):
+            self.assertEqual(self.router.db_for_read(Tenant), 'default')
+            with allow_replica_reads():
+                self.assertEqual(self.router.db_for_read(Tenant), 'default_ro')
+                self.assertEqual(self.router.db_for_write(Tenant), 'default')
+            tenant = Tenant()
+            tenant._state.db = 'default_ro'
+            self.assertEqual(self.router.db_for_write(Tenant, instance=tenant), 'default')
+            self.assertFalse(self.router.allow_migrate('default_ro', 'tenant'))
+
+    def test_allow_migrate_follows_schema_of_migrated_connection(self):
+        shard = mock.Mock(schema_name='smile')
+        with mock.patch('apps.tenant.sharding.connections', {'shard1': shard}):
+            self.assertIsNone(self.router.allow_migrate('shard1', 'tenant'))
+            self.assertFalse(self.router.allow_migrate('shard1', 'auth'))
+            shard.schema_name = 'public'
+            self.assertFalse(self.router.allow_migrate('shard1', 'tenant'))
+            self.assertIsNone(self.router.allow_migrate('shard1', 'auth'))
@@ -2,12 +2,12 @@ from rest_framework import viewsets, permissions
 from .models import Tenant, Domain
 from .serializers import TenantSerializer, DomainSerializer
 from core.utils import TenantViewSet
-from rest_framework.pagination import PageNumberPagination
+from core.pagination import EstimatedCountPagination
 
 class TenantViewSet(viewsets.ModelViewSet):
     serializer_class = TenantSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = EstimatedCountPagination
 
     def get_queryset(self):
         if self.request.user.is_superuser:
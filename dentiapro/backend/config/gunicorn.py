@@ -0,0 +1,13 @@
+"""
+Gunicorn settings: `gunicorn -c config/gunicorn.py config.wsgi:application`
+(or config.asgi:application with uvicorn workers).
+"""
+
+
+def post_worker_init(worker):
+    # Open the pooled database connections before the worker serves its first
+    # request. This runs in each worker once the application is loaded, so it
+    # holds with --preload too: connections opened in the master would be
+    # inherited by every forked worker.
+    from core.db.pool import prewarm_pools
+    prewarm_pools()
@@ -0,0 +1,62 @@
+"""
+Settings for the test suite: `python manage.py test --settings=config.settings.test`.
+
+Self-contained so the suite runs without Postgres, Redis or the tenant
+schema packages: an in-memory SQLite database, and tables created straight
+from the models (the local apps have no migrations). Postgres-only code paths
+(advisory locks, exclusion constraints, partitions, the pooled backend) are
+skipped or mocked by their tests and need a run against Postgres.
+"""
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+SECRET_KEY = 'django-insecure-test-key'
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['testserver']
+
+LOCAL_APPS = [
+    'apps.tenant',
+    'apps.users',
+    'apps.appointments',
+    'apps.medical_records',
+]
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+] + LOCAL_APPS
+
+MIGRATION_MODULES = {app.rsplit('.', 1)[-1]: None for app in LOCAL_APPS}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+# Tests needing versions shared across workers override CACHES with core.testing.SharedLocMemCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+RESPONSE_CACHE = {'ENABLED': False}
+
+USE_TZ = True
+TIME_ZONE = 'UTC'
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
+SILENCED_SYSTEM_CHECKS = [
+    'fields.E304',  # Request users are django.contrib.auth's, clinic staff and patients apps.users.User
+    'fields.E210',  # Pillow is not in the requirements; no test stores a profile picture
+    'models.W040',  # SQLite ignores INCLUDE columns of indexes
+]
@@ -0,0 +1,233 @@
+# backend/core/audit.py
+"""
+Audit trail of API reads and writes (core.utils.AuditMixin), written in batches.
+
+record() only appends the event to an in-process buffer. A background thread
+writes the buffer with bulk_create() every FLUSH_INTERVAL seconds, or as soon
+as BATCH_SIZE events are waiting, so requests never wait on an audit insert.
+
+Delivery is at least once:
+- a batch that fails to insert goes back to the buffer for the next flush;
+- events still buffered when the worker exits (atexit, i.e. any graceful
+  shutdown) are flushed, and spooled to SPOOL_DIR if that fails too, as is
+  the buffer once it outgrows MAX_BUFFER while the database is down;
+- the next writer replays spooled files before anything else.
+Every event carries a UUID and inserts ignore conflicts on it, so an event
+written twice is stored once.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from glob import glob
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIT_LOG = {
+    'ENABLED': True,
+    'MODEL': 'tenant.AuditEvent',
+    'DATABASE': 'default',
+    'BATCH_SIZE': 500,          # Events per INSERT; a full batch is flushed right away
+    'FLUSH_INTERVAL': 2.0,      # Seconds between background flushes; None flushes full batches inline
+    'MAX_BUFFER': 50000,        # Events kept in memory while inserts fail; beyond that they are spooled
+    'SPOOL_DIR': None,          # Directory for undeliverable events (default: <tempdir>/audit-spool)
+}
+
+
+class AuditLogWriter:
+    """
+    Buffered, batched writer of audit events.
+    """
+
+    def __init__(self, model='tenant.AuditEvent', using='default', batch_size=500, flush_interval=2.0,
+                 max_buffer=50000, spool_dir=None, enabled=True):
+        self.model_label = model
+        self.using = using
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), 'audit-spool')
+        self.enabled = enabled
+
+        self.buffer = deque()
+        self._lock = threading.Lock()          # Guards the buffer
+        self._flush_lock = threading.Lock()    # One flush at a time
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.recorded = metrics.counter('audit_events_recorded', 'Audit events recorded by API requests')
+        self.written = metrics.counter('audit_events_written', 'Audit events inserted into the audit table')
+        self.spooled = metrics.counter('audit_events_spooled', 'Audit events spooled to disk for a later replay')
+        self.failures = metrics.counter('audit_flush_failures', 'Audit batches that failed to insert')
+        self.buffered = metrics.gauge('audit_buffer_size', 'Audit events waiting to be written')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_AUDIT_LOG, **getattr(settings, 'AUDIT_LOG', {})}
+        return cls(
+            model=options['MODEL'],
+            using=options['DATABASE'],
+            batch_size=options['BATCH_SIZE'],
+            flush_interval=options['FLUSH_INTERVAL'],
+            max_buffer=options['MAX_BUFFER'],
+            spool_dir=options['SPOOL_DIR'],
+            enabled=options['ENABLED'],
+        )
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def record(self, **event):
+        """
+        Queue one event (AuditEvent field values); `event_id` and `occurred_at` are filled in.
+        """
+        if not self.enabled:
+            return
+        event.setdefault('event_id', uuid.uuid4())
+        event.setdefault('occurred_at', timezone.now())
+        with self._lock:
+            self.buffer.append(event)
+            size = len(self.buffer)
+        self.recorded.inc()
+        self.buffered.set(size)
+        if self.flush_interval is None:
+            if size >= self.batch_size:
+                self.flush()
+            return
+        self._ensure_started()
+        if size >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        self.replay_spool()
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        connections[self.using].close()
+
+    def flush(self):
+        """
+        Write everything buffered, batch by batch, and return the number of
+        events written. Stops at the first failing batch, which is put back.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                if not batch:
+                    break
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception("Writing %d audit events failed; keeping them for the next flush.", len(batch))
+                    self.failures.inc()
+                    with self._lock:
+                        self.buffer.extendleft(reversed(batch))
+                        overflowing = len(self.buffer) > self.max_buffer
+                    if overflowing:
+                        self.spool()
+                    break
+                written += len(batch)
+        self.buffered.set(len(self.buffer))
+        return written
+
+    def write(self, events):
+        model = self.model
+        model.objects.using(self.using).bulk_create([model(**event) for event in events], ignore_conflicts=True)
+        self.written.inc(len(events))
+
+    def close(self):
+        """
+        Stop the background thread and write what is left, spooling it if the database is unreachable.
+        """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=30)
+        self.flush()
+        if self.buffer:
+            self.spool()
+
+    def spool(self):
+        """
+        Move the buffered events to a new file in the spool directory.
+        """
+        with self._lock:
+            events = list(self.buffer)
+            self.buffer.clear()
+        if not events:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'audit-{os.getpid()}-{time.time_ns()}.jsonl')
+        with open(f'{path}.tmp', 'w') as spool_file:
+            for event in events:
+                # str() keeps the microseconds of occurred_at, which identify the event with its UUID.
+                spool_file.write(json.dumps(event, default=str) + '\n')
+        os.replace(f'{path}.tmp', path)
+        self.spooled.inc(len(events))
+        self.buffered.set(len(self.buffer))
+        logger.warning("Spooled %d audit events to %s.", len(events), path)
+
+    def replay_spool(self):
+        """
+        Write the events spooled by earlier writers, deleting each file once
+        it is written. Other workers may replay the same file concurrently;
+        the UUIDs make that harmless.
+        """
+        for path in sorted(glob(os.path.join(self.spool_dir, 'audit-*.jsonl'))):
+            try:
+                with open(path) as spool_file:
+                    events = [json.loads(line) for line in spool_file if line.strip()]
+            except FileNotFoundError:
+                continue
+            try:
+                for start in range(0, len(events), self.batch_size):
+                    self.write(events[start:start + self.batch_size])
+            except Exception:
+                logger.exception("Replaying %s failed; it will be retried by the next writer.", path)
+                return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    """
+    Return the process-wide AuditLogWriter, built from settings.AUDIT_LOG on first use.
+    """
+    global _audit_log
+    if _audit_log is None:
+        with _audit_log_lock:
+            if _audit_log is None:
+                _audit_log = AuditLogWriter.from_settings()
+    return _audit_log
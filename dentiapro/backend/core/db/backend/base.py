@@ -0,0 +1,91 @@
+# backend/core/db/backend/base.py
+"""
+Pooled, schema-aware PostgreSQL backend.
+
+Wraps the tenant backend named by settings.POOLED_ORIGINAL_BACKEND so that
+Django's per-request connect/close turns into a checkout/checkin against a
+process-wide ConnectionPool. Use it with CONN_MAX_AGE = 0 and configure the
+pool through the alias' 'POOL' dict (see core.db.pool.DEFAULT_POOL_OPTIONS).
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.db.utils import load_backend
+
+from core.db.pool import get_pool, pool_target
+
+original_backend = load_backend(
+    getattr(settings, 'POOLED_ORIGINAL_BACKEND', 'django_tenant_schemas.postgresql_backend')
+)
+
+
+class DatabaseWrapper(original_backend.DatabaseWrapper):
+
+    def get_pool(self):
+        name = self.alias
+        if self.settings_dict['NAME'] != connections.settings[self.alias]['NAME']:
+            # e.g. the 'postgres' database of _nodb_cursor(): a pool, and metrics, of its own.
+            name = f"{self.alias}_{self.settings_dict['NAME']}"
+        return get_pool(self.alias, self.settings_dict.get('POOL'), target=pool_target(self.settings_dict), name=name)
+
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool().checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        # The wrapped backend only sets this when it opens a physical connection.
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (
+            IsolationLevel(isolation_level) if isolation_level is not None else IsolationLevel.READ_COMMITTED
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool().checkin(self.connection)
+
+    def prewarm_pool(self):
+        self.get_pool().prewarm(lambda: super(DatabaseWrapper, self).get_new_connection(self.get_connection_params()))
+
+    def _cursor(self, name=None):
+        """
+        Reuse the search_path left on a pooled connection when it already
+        matches, instead of issuing `SET search_path` after every checkout.
+        """
+        info = self.get_pool().info(self.connection) if self.connection is not None else None
+        wanted = self._search_path()
+        if info is not None and not self.search_path_set and info.search_path == wanted:
+            self.search_path_set = True
+
+        cursor = super()._cursor(name=name)
+
+        info = self.get_pool().info(self.connection)
+        if info is not None:
+            info.search_path = wanted if self.search_path_set else None
+        return cursor
+
+    def rollback(self):
+        super().rollback()
+        self._forget_search_path()
+
+    def _savepoint_rollback(self, sid):
+        # A SET issued inside the savepoint is undone with it.
+        super()._savepoint_rollback(sid)
+        self.search_path_set = False
+        self._forget_search_path()
+
+    def _forget_search_path(self):
+        if self.connection is not None:
+            info = self.get_pool().info(self.connection)
+            if info is not None:
+                info.search_path = None
+
+    def _search_path(self):
+        public_schema_name = getattr(settings, 'PUBLIC_SCHEMA_NAME', 'public')
+        if self.schema_name == public_schema_name:
+            search_paths = [public_schema_name]
+        elif self.include_public_schema:
+            search_paths = [self.schema_name, public_schema_name]
+        else:
+            search_paths = [self.schema_name]
+        return ','.join(search_paths + list(getattr(settings, 'PG_EXTRA_SEARCH_PATHS', [])))
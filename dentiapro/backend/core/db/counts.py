@@ -0,0 +1,118 @@
+# backend/core/db/counts.py
+"""
+Row counts from the Postgres planner for large tables.
+
+COUNT(*) visits every matching row. At or above ESTIMATED_COUNTS['THRESHOLD']
+rows, paginators report the planner's estimate instead: pg_class.reltuples
+for a whole table, the row estimate of EXPLAIN for a filtered queryset. Small
+result sets, and databases other than Postgres, get exact counts.
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+DEFAULT_ESTIMATED_COUNTS = {
+    'ENABLED': True,
+    'THRESHOLD': 10000,     # Estimates below this are replaced by an exact COUNT(*)
+}
+
+
+def get_count_options():
+    return {**DEFAULT_ESTIMATED_COUNTS, **getattr(settings, 'ESTIMATED_COUNTS', {})}
+
+
+def estimate_count(queryset):
+    """
+    The planner's estimate of queryset.count(), or None when there is none
+    (not Postgres, sliced or combined queryset, table never analyzed).
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    if connection.vendor != 'postgresql' or query.is_sliced or query.combinator:
+        return None
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct:
+            # to_regclass() resolves through search_path, i.e. the tenant's schema.
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the first VACUUM/ANALYZE (0 before Postgres 14).
+            return int(row[0]) if row is not None and row[0] > 0 else None
+        sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset, threshold=None):
+    """
+    (count, is_estimate): the planner's estimate when it is at least
+    `threshold` rows (ESTIMATED_COUNTS['THRESHOLD'] by default), else COUNT(*).
+    """
+    options = get_count_options()
+    if options['ENABLED']:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= (options['THRESHOLD'] if threshold is None else threshold):
+            return estimate, True
+    return queryset.count(), False
+
+
+class EstimatedPage(Page):
+    """
+    Page of an estimated count: whether a next page exists is known from
+    the rows fetched, not from the count.
+    """
+
+    def __init__(self, object_list, number, paginator, has_more):
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+    def end_index(self):
+        return self.start_index() + len(self) - 1 if len(self) else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count is estimated for large querysets; `count_is_estimate`
+    tells which one it is.
+
+    An estimate is only reported, never used to navigate: pages are sliced
+    by fetching one row more than a page, so rows past a low estimate can
+    still be reached and a high estimate gives an empty page, not a crash.
+    """
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.count_is_estimate = approximate_count(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)  # Computes the count, and so count_is_estimate
+        except EmptyPage:
+            # Past the estimated last page: page() finds out whether rows are left.
+            if not self.count_is_estimate or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        return EstimatedPage(rows[:self.per_page], number, self, has_more=len(rows) > self.per_page)
@@ -0,0 +1,343 @@
+# backend/core/db/pool.py
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_OPTIONS = {
+    'MIN_SIZE': 0,                  # Connections opened by prewarm() and kept through idle trimming
+    'MAX_SIZE': 10,                 # Hard cap on physical connections per process
+    'TIMEOUT': 10,                  # Seconds a checkout waits for a free connection before failing
+    'MAX_LIFETIME': 1800,           # Seconds after which a connection is closed instead of reused
+    'MAX_IDLE': 300,                # Seconds an idle connection above MIN_SIZE is kept
+    'HEALTH_CHECK_INTERVAL': 30,    # Idle seconds after which a connection is pinged before reuse
+}
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no connection became free within the checkout timeout.
+    """
+
+
+class PooledConnectionInfo:
+    __slots__ = ('created_at', 'last_used_at', 'search_path')
+
+    def __init__(self, now):
+        self.created_at = now
+        self.last_used_at = now
+        self.search_path = None     # search_path last SET on the physical connection
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections for one database alias.
+
+    Connections are handed out LIFO so that a small hot set stays warm while
+    the rest age out through MAX_IDLE. Physical connections are recycled once
+    they are older than MAX_LIFETIME, and pinged before reuse when they have
+    been idle for longer than HEALTH_CHECK_INTERVAL.
+    """
+
+    def __init__(self, alias, min_size=0, max_size=10, timeout=10, max_lifetime=1800,
+                 max_idle=300, health_check_interval=30, name=None):
+        self.alias = alias
+        self.name = name or alias
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+
+        self._idle = deque()
+        self._info = {}     # id(connection) -> PooledConnectionInfo
+        self._size = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+        prefix = f'db_pool_{self.name}'
+        self.size_gauge = metrics.gauge(f'{prefix}_size', 'Physical connections held by the pool')
+        self.in_use_gauge = metrics.gauge(f'{prefix}_in_use', 'Connections currently checked out')
+        self.waiting_gauge = metrics.gauge(f'{prefix}_waiting', 'Threads waiting for a free connection')
+        self.checkouts = metrics.counter(f'{prefix}_checkouts', 'Connections handed out')
+        self.waits = metrics.counter(f'{prefix}_waits', 'Checkouts that had to wait because the pool was saturated')
+        self.timeouts = metrics.counter(f'{prefix}_timeouts', 'Checkouts that gave up waiting')
+        self.created = metrics.counter(f'{prefix}_connections_created', 'Physical connections opened')
+        self.recycled = metrics.counter(f'{prefix}_connections_recycled', 'Connections closed for age or idleness')
+        self.health_check_failures = metrics.counter(f'{prefix}_health_check_failures', 'Connections that failed a ping')
+
+    @classmethod
+    def from_options(cls, alias, options, name=None):
+        options = {**DEFAULT_POOL_OPTIONS, **(options or {})}
+        return cls(
+            alias,
+            name=name,
+            min_size=options['MIN_SIZE'],
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            max_lifetime=options['MAX_LIFETIME'],
+            max_idle=options['MAX_IDLE'],
+            health_check_interval=options['HEALTH_CHECK_INTERVAL'],
+        )
+
+    def checkout(self, connect):
+        """
+        Return a usable connection, opening one with `connect()` if the pool
+        has room. Blocks up to `timeout` seconds when the pool is saturated.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self._condition:
+                connection = self._pop_idle()
+                if connection is None and self._size < self.max_size:
+                    self._size += 1
+                    self._update_gauges()
+                    break
+                if connection is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts.inc()
+                        raise PoolTimeout(
+                            f"Connection pool '{self.name}' exhausted: {self.max_size} connections "
+                            f"in use for more than {self.timeout}s."
+                        )
+                    if not waited:
+                        waited = True
+                        self.waits.inc()
+                    self._waiting += 1
+                    self._update_gauges()
+                    self._condition.wait(remaining)
+                    self._waiting -= 1
+                    self._update_gauges()
+                    continue
+
+            # Pinging happens outside the lock; a dead connection is dropped and we try again.
+            if self._is_healthy(connection):
+                self.checkouts.inc()
+                return connection
+            self.health_check_failures.inc()
+            self._discard(connection)
+
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._update_gauges()
+                self._condition.notify()
+            raise
+        self.created.inc()
+        with self._condition:
+            self._info[id(connection)] = PooledConnectionInfo(time.monotonic())
+            self._update_gauges()
+        self.checkouts.inc()
+        return connection
+
+    def checkin(self, connection):
+        """
+        Return a connection to the pool. Connections that are closed, in a
+        failed transaction, or past MAX_LIFETIME are closed instead.
+        """
+        info = self._info.get(id(connection))
+        if info is None or getattr(connection, 'closed', False):
+            self._discard(connection)
+            return
+        if not self._reset(connection):
+            self._discard(connection)
+            return
+
+        now = time.monotonic()
+        if now - info.created_at > self.max_lifetime:
+            self.recycled.inc()
+            self._discard(connection)
+            return
+
+        info.last_used_at = now
+        with self._condition:
+            self._idle.append(connection)
+            self._trim_idle(now)
+            self._update_gauges()
+            self._condition.notify()
+
+    def info(self, connection):
+        return self._info.get(id(connection))
+
+    def prewarm(self, connect):
+        """
+        Open connections until MIN_SIZE are idle in the pool.
+        """
+        opened = []
+        try:
+            while len(self._idle) + len(opened) < self.min_size:
+                opened.append(self.checkout(connect))
+        finally:
+            for connection in opened:
+                self.checkin(connection)
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts.value,
+                'waits': self.waits.value,
+                'timeouts': self.timeouts.value,
+            }
+
+    def _pop_idle(self):
+        now = time.monotonic()
+        while self._idle:
+            connection = self._idle.pop()
+            info = self._info.get(id(connection))
+            if info is not None and now - info.created_at <= self.max_lifetime:
+                return connection
+            self.recycled.inc()
+            self._forget(connection)
+            self._close_quietly(connection)
+        return None
+
+    def _trim_idle(self, now):
+        # Oldest idle connections sit at the left end of the deque.
+        while len(self._idle) > self.min_size:
+            info = self._info.get(id(self._idle[0]))
+            if info is not None and now - info.last_used_at <= self.max_idle:
+                break
+            connection = self._idle.popleft()
+            self.recycled.inc()
+            self._forget(connection)
+            self._close_quietly(connection)
+
+    def _is_healthy(self, connection):
+        if getattr(connection, 'closed', False):
+            return False
+        info = self._info.get(id(connection))
+        if info is None or time.monotonic() - info.last_used_at < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _reset(self, connection):
+        """
+        Roll back whatever the last user left open so the next one starts clean.
+        """
+        info = self._info.get(id(connection))
+        try:
+            status = connection.get_transaction_status()
+            if status != 0:  # psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                # A SET search_path run in the transaction is rolled back with it:
+                # the next checkout must not take the recorded one for granted.
+                if info is not None:
+                    info.search_path = None
+                connection.rollback()
+            elif not connection.autocommit:
+                connection.rollback()
+        except Exception:
+            if info is not None:
+                info.search_path = None
+            return False
+        return True
+
+    def _discard(self, connection):
+        with self._condition:
+            self._forget(connection)
+            self._condition.notify()
+        self._close_quietly(connection)
+
+    def _forget(self, connection):
+        # Caller holds the condition lock.
+        if self._info.pop(id(connection), None) is not None:
+            self._size -= 1
+        self._update_gauges()
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            logger.debug("Error closing pooled connection for '%s'", self.name, exc_info=True)
+
+    def _update_gauges(self):
+        self.size_gauge.set(self._size)
+        self.in_use_gauge.set(self._size - len(self._idle))
+        self.waiting_gauge.set(self._waiting)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_target(settings_dict):
+    """
+    What connections made with `settings_dict` reach: (host, port, database, user).
+    """
+    return tuple(str(settings_dict.get(key) or '') for key in ('HOST', 'PORT', 'NAME', 'USER'))
+
+
+def get_pool(alias, options=None, target=(), name=None):
+    """
+    Return the process-wide pool for `alias` connecting to `target` (see
+    pool_target()). `name` (default: the alias) prefixes its metrics.
+
+    Pools are keyed by target as well as alias: the same alias also connects
+    to the 'postgres' database (Django's _nodb_cursor), and test runs switch
+    it to the test database. They are keyed by PID too: a worker forked from
+    a master that already opened connections must not share its sockets.
+    """
+    key, pid = (alias, *target), os.getpid()
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == pid:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != pid:
+            pool = _pools[key] = ConnectionPool.from_options(alias, options, name=name)
+    return pool
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        if pool.pid == os.getpid():
+            pool.close()
+
+
+def prewarm_pools():
+    """
+    Open MIN_SIZE connections for every database using the pooled backend.
+    Called once per worker process after it has loaded the application (the
+    post_worker_init hook of config/gunicorn.py), never in a master that
+    forks workers, whose sockets they would all inherit.
+    """
+    from django.db import connections
+
+    for alias in connections:
+        connection = connections[alias]
+        if hasattr(connection, 'prewarm_pool'):
+            connection.prewarm_pool()
+
+
+atexit.register(close_pools)
@@ -0,0 +1,194 @@
+# backend/core/db/replicas.py
+"""
+Read replicas.
+
+A database is a replica of another when its DATABASES entry has
+'REPLICA_OF': '<primary alias>'. Reads are only sent to replicas inside
+allow_replica_reads() (TenantViewSet does that for list/retrieve), never
+inside a transaction on the primary, never for a user who wrote to the
+tenant within the last STICKY_SECONDS, and never to a replica lagging more
+than MAX_LAG. Those sticky markers must be seen by every worker: CACHE_ALIAS
+has to name a shared cache (Redis, database, ...) once replicas are set up.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+
+from core import metrics
+
+DEFAULT_REPLICA_OPTIONS = {
+    'MAX_LAG': 5,               # Seconds of replay lag above which a replica is skipped
+    'LAG_CHECK_INTERVAL': 2,    # Seconds a measured lag is reused before asking the replica again
+    'STICKY_SECONDS': 15,       # Seconds a user's reads stay on the primary after a write
+    'CACHE_ALIAS': 'default',   # CACHES alias holding the sticky markers (must be shared across workers)
+}
+
+# Cache backends whose entries other worker processes cannot see.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_reads_allowed():
+    return _replica_reads.get()
+
+
+def set_replica_reads(allowed):
+    _replica_reads.set(allowed)
+
+
+@contextmanager
+def allow_replica_reads(allowed=True):
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaSet:
+    """
+    Knows the replicas of every primary, their replay lag and which users
+    must read from the primary for now.
+    """
+
+    def __init__(self, max_lag=5, lag_check_interval=2, sticky_seconds=15, cache_alias='default'):
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.sticky_seconds = sticky_seconds
+        self.cache_alias = cache_alias
+        self._replicas = None
+        self._lags = {}     # alias -> (lag seconds or None when unreachable, measured_at)
+        self._lock = threading.Lock()
+
+        self.replica_reads = metrics.counter('db_replica_reads', 'Reads routed to a replica')
+        self.lagging = metrics.counter('db_replica_lagging', 'Reads kept on the primary because replicas lagged')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_REPLICA_OPTIONS, **getattr(settings, 'DATABASE_REPLICAS', {})}
+        return cls(
+            max_lag=options['MAX_LAG'],
+            lag_check_interval=options['LAG_CHECK_INTERVAL'],
+            sticky_seconds=options['STICKY_SECONDS'],
+            cache_alias=options['CACHE_ALIAS'],
+        )
+
+    @property
+    def replicas(self):
+        if self._replicas is None:
+            replicas = {}
+            for alias, settings_dict in connections.databases.items():
+                if settings_dict.get('REPLICA_OF'):
+                    replicas.setdefault(settings_dict['REPLICA_OF'], []).append(alias)
+            self._replicas = replicas
+        return self._replicas
+
+    def replicas_of(self, alias):
+        return self.replicas.get(alias, [])
+
+    def is_replica(self, alias):
+        return bool(connections.databases.get(alias, {}).get('REPLICA_OF'))
+
+    def primary_of(self, alias):
+        return connections.databases.get(alias, {}).get('REPLICA_OF') or alias
+
+    def pick(self, primary):
+        """
+        Return a replica of `primary` fit to serve a read, or None.
+        """
+        replicas = self.replicas_of(primary)
+        if not replicas or connections[primary].in_atomic_block:
+            return None
+        healthy = [alias for alias in replicas if self.is_fresh(alias)]
+        if not healthy:
+            self.lagging.inc()
+            return None
+        self.replica_reads.inc()
+        return random.choice(healthy) if len(healthy) > 1 else healthy[0]
+
+    def is_fresh(self, alias):
+        lag = self.lag(alias)
+        return lag is not None and lag <= self.max_lag
+
+    def lag(self, alias):
+        """
+        Replay lag of `alias` in seconds, or None when it cannot be reached.
+        Measured at most once per LAG_CHECK_INTERVAL per process; other
+        threads keep using the previous value while one thread measures.
+        """
+        cached = self._lags.get(alias)
+        if cached is not None and time.monotonic() - cached[1] < self.lag_check_interval:
+            return cached[0]
+        if not self._lock.acquire(blocking=False):
+            return cached[0] if cached is not None else None
+        try:
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(LAG_SQL)
+                    lag = float(cursor.fetchone()[0])
+            except DatabaseError:
+                lag = None
+            self._lags[alias] = (lag, time.monotonic())
+        finally:
+            self._lock.release()
+        return lag
+
+    @property
+    def sticky_cache(self):
+        backend = settings.CACHES.get(self.cache_alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            raise ImproperlyConfigured(
+                f"Read replicas need a cache shared by every worker for their sticky markers; "
+                f"CACHES['{self.cache_alias}'] uses {backend}. Set DATABASE_REPLICAS['CACHE_ALIAS']."
+            )
+        return caches[self.cache_alias]
+
+    def sticky_key(self, tenant_id, user_id):
+        return f'replica_sticky:{tenant_id}:{user_id}'
+
+    def mark_sticky(self, user, tenant=None):
+        """
+        Keep `user`'s reads of `tenant` on the primary for the next STICKY_SECONDS.
+        """
+        if self.replicas and getattr(user, 'is_authenticated', False):
+            self.sticky_cache.set(self.sticky_key(getattr(tenant, 'pk', None), user.pk), 1, self.sticky_seconds)
+
+    def is_sticky(self, user, tenant=None):
+        if not getattr(user, 'is_authenticated', False):
+            return False
+        return self.sticky_cache.get(self.sticky_key(getattr(tenant, 'pk', None), user.pk)) is not None
+
+
+_replica_set = None
+_replica_set_lock = threading.Lock()
+
+
+def get_replica_set():
+    """
+    Return the process-wide ReplicaSet, built from settings.DATABASE_REPLICAS on first use.
+    """
+    global _replica_set
+    if _replica_set is None:
+        with _replica_set_lock:
+            if _replica_set is None:
+                _replica_set = ReplicaSet.from_settings()
+    return _replica_set
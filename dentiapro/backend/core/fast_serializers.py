@@ -0,0 +1,191 @@
+# backend/core/fast_serializers.py
+"""
+Fast list serialization from .values() rows.
+
+ModelSerializer builds a model instance per row and walks every field's
+get_attribute()/to_representation() through the generic machinery. For
+serializers made only of plain model fields (and nested model serializers of
+forward foreign keys), a FieldPlan compiled once per serializer maps each
+output key straight to a values() column and the field's
+to_representation(), which produces exactly the same data.
+
+Serializers the plan cannot reproduce exactly (method fields, properties,
+source='*', files, custom to_representation(), many=True nesting, ...) get
+no plan and keep going through the serializer.
+"""
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework import relations, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation() only depends on the value and the field's own options.
+PLAIN_FIELDS = (
+    drf_fields.BooleanField, drf_fields.CharField, drf_fields.ChoiceField, drf_fields.DateField,
+    drf_fields.DateTimeField, drf_fields.DecimalField, drf_fields.DurationField, drf_fields.FloatField,
+    drf_fields.IntegerField, drf_fields.JSONField, drf_fields.ReadOnlyField, drf_fields.TimeField,
+    drf_fields.UUIDField,
+)
+UNSUPPORTED_FIELDS = (drf_fields.FileField, drf_fields.SerializerMethodField, drf_fields.HiddenField)
+
+
+def _identity(value):
+    return value
+
+
+class IsoDateTime:
+    """
+    DateTimeField.to_representation() for ISO 8601 output. Looking up the
+    current timezone dominates the generic version, so it is done once per
+    render() instead of once per value.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    @classmethod
+    def applies_to(cls, field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return isinstance(field, drf_fields.DateTimeField) and output_format and output_format.lower() == ISO_8601
+
+    def bind(self):
+        field = self.field
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if isinstance(value, str) or value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+
+class FieldPlan:
+    """
+    Precompiled (output key, values() column, converter) steps for one serializer.
+    """
+
+    def __init__(self, columns, steps):
+        self.columns = columns      # values() paths to fetch
+        self.steps = steps          # (key, column, to_representation, IsoDateTime or nested FieldPlan)
+
+    @classmethod
+    def compile(cls, serializer, prefix=''):
+        """
+        Return the plan for `serializer`, or None when it cannot be reproduced exactly.
+        """
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            return None
+        model = serializer.Meta.model
+        columns, steps = [], []
+        for field in serializer._readable_fields:
+            if isinstance(field, UNSUPPORTED_FIELDS) or len(field.source_attrs) != 1:
+                return None
+            try:
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.many_to_many:
+                return None
+            column = f'{prefix}{model_field.name}'
+
+            if isinstance(field, serializers.ModelSerializer):
+                if not model_field.is_relation:
+                    return None
+                nested = cls.compile(field, prefix=f'{column}__')
+                if nested is None:
+                    return None
+                columns.append(column)
+                columns.extend(nested.columns)
+                steps.append((field.field_name, column, nested))
+            elif isinstance(field, relations.PrimaryKeyRelatedField):
+                if not model_field.is_relation:
+                    return None
+                columns.append(column)
+                convert = field.pk_field.to_representation if field.pk_field is not None else _identity
+                steps.append((field.field_name, column, convert))
+            elif isinstance(field, PLAIN_FIELDS) and not isinstance(field, serializers.BaseSerializer):
+                if model_field.is_relation:
+                    return None
+                columns.append(column)
+                convert = IsoDateTime(field) if IsoDateTime.applies_to(field) else field.to_representation
+                steps.append((field.field_name, column, convert))
+            else:
+                return None
+        return cls(columns, steps)
+
+    def bind(self):
+        """
+        Steps with per-render state resolved: (key, column, convert, nested steps or None).
+        """
+        bound = []
+        for key, column, convert in self.steps:
+            if isinstance(convert, FieldPlan):
+                bound.append((key, column, None, convert.bind()))
+            elif isinstance(convert, IsoDateTime):
+                bound.append((key, column, convert.bind(), None))
+            else:
+                bound.append((key, column, convert, None))
+        return bound
+
+    def render(self, rows):
+        steps = self.bind()
+        return [render_row(steps, row) for row in rows]
+
+    def values(self, queryset, extra=()):
+        """
+        The queryset as values() rows with every column the plan needs, plus `extra`.
+        """
+        columns = list(dict.fromkeys([*self.columns, *extra]))
+        return queryset.values(*columns)
+
+
+def render_row(steps, row):
+    data = {}
+    for key, column, convert, nested in steps:
+        value = row[column]
+        if value is None:
+            data[key] = None
+        elif nested is not None:
+            data[key] = render_row(nested, row)
+        else:
+            data[key] = convert(value)
+    return data
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_field_plan(serializer):
+    """
+    Cached FieldPlan for a serializer instance, keyed by its class and the
+    fields it renders (sparse fieldsets trim them), or None.
+    """
+    key = (type(serializer), tuple(field.field_name for field in serializer._readable_fields))
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+    plan = FieldPlan.compile(serializer)
+    with _plans_lock:
+        _plans[key] = plan
+    return plan
+
+
+def ordering_columns(queryset):
+    """
+    values() columns the paginators read from each row (ordering and primary key).
+    """
+    opts = queryset.model._meta
+    columns = [opts.pk.attname]
+    for item in queryset.query.order_by or opts.ordering:
+        if isinstance(item, str) and item != '?':
+            name = item.lstrip('-')
+            columns.append(opts.pk.attname if name == 'pk' else name)
+    return columns
+
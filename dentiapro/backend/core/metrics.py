@@ -0,0 +1,95 @@
+# backend/core/metrics.py
+import threading
+
+try:
+    from prometheus_client import Counter as PrometheusCounter, Gauge as PrometheusGauge
+except ImportError:  # prometheus_client is only installed in the full image
+    PrometheusCounter = PrometheusGauge = None
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """
+    Thread-safe in-process counter, mirrored to Prometheus when available.
+    """
+    prometheus_class = PrometheusCounter
+
+    def __init__(self, name, description=''):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+        self._prometheus = self.prometheus_class(name, description or name) if self.prometheus_class else None
+
+    @property
+    def value(self):
+        return self._value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+        if self._prometheus is not None:
+            self._prometheus.inc(amount)
+
+    def reset(self):
+        """
+        Reset the in-process value (Prometheus counters are monotonic and are left alone).
+        """
+        with self._lock:
+            self._value = 0
+
+
+class Gauge(Counter):
+    """
+    Thread-safe in-process gauge, mirrored to Prometheus when available.
+    """
+    prometheus_class = PrometheusGauge
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+        if self._prometheus is not None:
+            self._prometheus.set(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+            value = self._value
+        if self._prometheus is not None:
+            self._prometheus.set(value)
+
+
+def _get_or_create(metric_class, name, description):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = metric_class(name, description)
+        return metric
+
+
+def counter(name, description=''):
+    """
+    Return the process-wide counter registered under `name`, creating it if needed.
+    """
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name, description=''):
+    """
+    Return the process-wide gauge registered under `name`, creating it if needed.
+    """
+    return _get_or_create(Gauge, name, description)
+
+
+def snapshot(prefix=''):
+    """
+    Return the current value of every registered metric whose name starts with `prefix`.
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.value for metric in metrics if metric.name.startswith(prefix)}
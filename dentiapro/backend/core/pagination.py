@@ -0,0 +1,183 @@
+# backend/core/pagination.py
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from core.db.counts import EstimatedCountPaginator
+
+
+def encode_value(value):
+    # Not DjangoJSONEncoder: it drops the microseconds of datetimes, which would skip rows.
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the queryset's ordering (the model's Meta.ordering
+    unless a filter reordered it), with `id` appended as a tie-breaker.
+
+    A page is fetched with `WHERE (ordering) < (last row's values) ... LIMIT n`
+    instead of `OFFSET`, and there is no `COUNT(*)`, so every page costs the
+    same as the first one given an index on (tenant, ordering..., id).
+
+    The cursor is opaque to clients: follow the `next` and `previous` links.
+    Ordering fields must be non-null columns of the model itself.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request, queryset.model, ordering)
+
+        reverse = cursor is not None and cursor['reverse']
+        fetch_ordering = [(name, not descending) for name, descending in ordering] if reverse else ordering
+        queryset = queryset.order_by(*[('-' if descending else '') + name for name, descending in fetch_ordering])
+        if cursor is not None:
+            queryset = queryset.filter(self.after(fetch_ordering, cursor['values']))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_values = self.previous_values = None
+        if rows:
+            if has_more or reverse:
+                self.next_values = self.row_values(rows[-1], ordering)
+            if cursor is not None and (has_more or not reverse):
+                self.previous_values = self.row_values(rows[0], ordering)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """
+        [(field name, descending)] for the queryset's ordering plus the tie-breaker.
+        """
+        ordering = []
+        for item in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(item, str) or '__' in item or item == '?':
+                raise ImproperlyConfigured(
+                    f"KeysetPagination cannot order {queryset.model.__name__} by {item!r}; "
+                    f"use fields of the model itself."
+                )
+            name = item.lstrip('-')
+            ordering.append(('id' if name == 'pk' else name, item.startswith('-')))
+        if not any(name == self.tie_breaker for name, _ in ordering):
+            # Same direction as the last field, so one index covers the whole ordering.
+            ordering.append((self.tie_breaker, ordering[-1][1] if ordering else False))
+        return ordering
+
+    def after(self, ordering, values):
+        """
+        Rows strictly after `values` in `ordering`: the row comparison
+        (a, b, c) > (x, y, z) spelled out for per-field directions, plus a
+        redundant bound on the first field that lets the index range scan.
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(ordering, values):
+            condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equal &= Q(**{name: value})
+        first, descending = ordering[0]
+        return Q(**{f'{first}__{"lte" if descending else "gte"}': values[0]}) & condition
+
+    def row_values(self, row, ordering):
+        if isinstance(row, dict):  # values() rows of the fast list path (core.fast_serializers)
+            return [row[name] for name, _ in ordering]
+        return [getattr(row, row._meta.get_field(name).attname) for name, _ in ordering]
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            raw_values = data['v']
+            if len(raw_values) != len(ordering):
+                raise ValueError
+            values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(ordering, raw_values)]
+            return {'values': values, 'reverse': bool(data.get('r'))}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, values, reverse):
+        data = {'v': values}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, default=encode_value).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, reverse=True)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    PageNumberPagination whose `count` comes from the planner's estimate for
+    large result sets (core.db.counts) instead of COUNT(*) on every page.
+    `count_is_estimate` says which one the client got.
+    """
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_estimate', self.page.paginator.count_is_estimate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean', 'example': False}
+        return response_schema
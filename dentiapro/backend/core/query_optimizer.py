@@ -0,0 +1,226 @@
+# backend/core/query_optimizer.py
+"""
+select_related/prefetch_related/only() planning from a serializer's fields.
+
+A QueryPlan is compiled once per serializer (class and rendered fields) by
+following each field's `source` through the model: forward foreign keys and
+one-to-ones rendered by a nested serializer or a related field are joined
+with select_related(), reverse and many-to-many relations are prefetched with
+their own optimized queryset, and only() keeps the columns the fields read.
+
+Whenever a field reads something the plan cannot see (a method field, a
+property, source='*', a related object's __str__), every column of the model
+involved is loaded, so optimizing never adds a deferred-field query.
+"""
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import relations, serializers
+
+
+class QueryPlan:
+    """
+    What one model of the serializer tree needs: its columns, joined
+    relations and prefetched relations (each with its own plan).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = {model._meta.pk.name}
+        self.exact = True       # False: load every column of the model
+        self.related = {}       # select_related name -> QueryPlan
+        self.prefetched = {}    # prefetch_related accessor -> QueryPlan
+
+    @classmethod
+    def compile(cls, serializer):
+        plan = cls(serializer.Meta.model)
+        plan.add_serializer(serializer)
+        return plan
+
+    def add_serializer(self, serializer):
+        for field in serializer._readable_fields:
+            self.add_field(field)
+
+    def add_field(self, field):
+        if field.source == '*':
+            # Nested serializer of the same instance, or a method field.
+            if isinstance(field, serializers.Serializer):
+                self.add_serializer(field)
+            else:
+                self.exact = False
+            return
+        plan = self
+        for attr in field.source_attrs[:-1]:
+            plan = plan.follow(attr)
+            if plan is None:
+                return
+        plan.add_leaf(field.source_attrs[-1], field)
+
+    def add_leaf(self, attr, field):
+        model_field = self.resolve(attr)
+        if model_field is None:
+            self.exact = False  # Property or method of the model
+        elif isinstance(field, serializers.ListSerializer):
+            child = self.follow(attr)
+            if child is not None:
+                child.add_serializer(field.child)
+        elif isinstance(field, serializers.BaseSerializer):
+            child = self.follow(attr)
+            if child is not None:
+                child.add_serializer(field)
+        elif isinstance(field, relations.ManyRelatedField):
+            child = self.follow(attr)
+            if child is not None:
+                child.add_related_field(field.child_relation)
+        elif isinstance(field, relations.PrimaryKeyRelatedField) and model_field.concrete:
+            self.columns.add(model_field.name)  # Rendered from the foreign key column alone
+        elif isinstance(field, relations.RelatedField) or model_field.is_relation:
+            child = self.follow(attr)
+            if child is not None:
+                child.add_related_field(field)
+        elif model_field.concrete:
+            self.columns.add(model_field.name)
+        else:
+            self.exact = False
+
+    def add_related_field(self, field):
+        """
+        Columns of the related model a RelatedField renders.
+        """
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            return
+        lookup = getattr(field, 'slug_field', None) or getattr(field, 'lookup_field', None)
+        model_field = self.resolve(lookup) if lookup else None
+        if model_field is not None and model_field.concrete and not model_field.is_relation:
+            self.columns.add(model_field.name)
+        else:
+            self.exact = False  # StringRelatedField and the like: __str__ may read anything
+
+    def resolve(self, attr):
+        """
+        The model field or relation behind attribute `attr`, or None.
+        """
+        opts = self.model._meta
+        try:
+            model_field = opts.get_field(attr)
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is not None and (not model_field.auto_created or model_field.concrete):
+            return model_field
+        for relation in opts.related_objects:
+            if relation.get_accessor_name() == attr:
+                return relation
+        return None
+
+    def follow(self, attr):
+        """
+        The plan of the model behind relation `attr`, or None if it is not one.
+        """
+        relation = self.resolve(attr)
+        if relation is None or not relation.is_relation or relation.related_model is None:
+            self.exact = False
+            return None
+        if relation.many_to_many or relation.one_to_many:
+            children = self.prefetched
+        else:
+            children = self.related
+            if relation.concrete:
+                self.columns.add(relation.name)
+        if attr not in children:
+            children[attr] = QueryPlan(relation.related_model)
+            if relation.one_to_many:
+                # Prefetching matches children to parents through this column.
+                children[attr].columns.add(relation.field.name)
+        return children[attr]
+
+    def load_columns(self):
+        if self.exact:
+            return self.columns
+        return {model_field.name for model_field in self.model._meta.concrete_fields}
+
+    def lookups(self, prefix=''):
+        """
+        (select_related paths, only() paths, [(prefetch path, QueryPlan)]) of this level and below.
+        """
+        select, only, prefetch = [], [f'{prefix}{name}' for name in self.load_columns()], []
+        for name, child in self.related.items():
+            path = f'{prefix}{name}'
+            select.append(path)
+            child_select, child_only, child_prefetch = child.lookups(f'{path}__')
+            select.extend(child_select)
+            only.extend(child_only)
+            prefetch.extend(child_prefetch)
+        for name, child in self.prefetched.items():
+            prefetch.append((f'{prefix}{name}', child))
+        return select, only, prefetch
+
+    def apply(self, queryset, extra_columns=()):
+        """
+        `queryset` with the plan's joins, prefetches and columns. Columns are
+        left alone if the queryset already chose them (only()/defer()) or
+        joins relations itself, which only() would have to know about.
+        """
+        select, only, prefetch = self.lookups()
+        query = queryset.query
+        if query.select_related is not True:
+            queryset = queryset.select_related(*select) if select else queryset
+        existing = {
+            lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+            for lookup in queryset._prefetch_related_lookups
+        }
+        prefetches = [
+            Prefetch(path, queryset=child.apply(child.model._default_manager.all()))
+            for path, child in prefetch if path not in existing
+        ]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        chosen = query.deferred_loading != (frozenset(), True)
+        joined_elsewhere = query.select_related is True or (
+            isinstance(query.select_related, dict) and not set(flatten_tree(query.select_related)) <= set(select)
+        )
+        if chosen or joined_elsewhere or query.values_select:
+            return queryset
+        return queryset.only(*dict.fromkeys([*only, *extra_columns]))
+
+
+def flatten_tree(tree, prefix=''):
+    # {'patient': {'profile': {}}} -> ['patient', 'patient__profile']
+    paths = []
+    for name, subtree in tree.items():
+        path = f'{prefix}{name}'
+        paths.append(path)
+        paths.extend(flatten_tree(subtree, f'{path}__'))
+    return paths
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_query_plan(serializer):
+    """
+    Cached QueryPlan for a serializer instance, keyed like core.fast_serializers.get_field_plan().
+    """
+    key = (type(serializer), tuple(field.field_name for field in serializer._readable_fields))
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+    plan = QueryPlan.compile(serializer)
+    with _plans_lock:
+        _plans[key] = plan
+    return plan
+
+
+def optimize_queryset(queryset, serializer, extra_columns=()):
+    """
+    Apply the select_related/prefetch_related/only() plan of `serializer` to
+    `queryset`, loading `extra_columns` too (ordering, validators, ...).
+    """
+    if not hasattr(getattr(serializer, 'Meta', None), 'model'):
+        return queryset
+    plan = get_query_plan(serializer)
+    if plan.model is not queryset.model:
+        return queryset
+    return plan.apply(queryset, extra_columns)
@@ -0,0 +1,233 @@
+# backend/core/response_cache.py
+"""
+Cache of serialized API responses for TenantViewSet (cache_responses = True).
+
+Entries are keyed by tenant, role (and user unless the view says responses
+are shared per role), request path and query parameters, and by the
+current version of every model the response is built from. Saving or
+deleting a row with a tenant_id bumps that tenant's version of its model
+(apps.tenant.signals), so stale entries are never read again and simply
+expire; nothing is ever scanned or deleted by pattern. Writes that send no
+signals (QuerySet.update(), bulk_create(), raw SQL) have to call
+bump_on_commit() themselves.
+
+Versions are bumped by the worker handling the write, so CACHE_ALIAS has to
+name a cache shared by every worker (Redis): with a per-process cache the
+other workers would keep serving the old entries.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from core import metrics
+from core.db.replicas import PROCESS_LOCAL_CACHES
+
+DEFAULT_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',   # CACHES alias for entries and versions (must be shared across workers)
+    'TTL': 300,                 # Seconds an entry is kept
+    'LOCK_TIMEOUT': 30,         # Seconds a recompute lock is held at most (crashed workers)
+    'WAIT_TIMEOUT': 5,          # Seconds a request waits for another one's recompute before doing its own
+    'POLL_INTERVAL': 0.05,      # Seconds between checks while waiting
+}
+
+_MISSING = object()
+
+
+class ResponseCache:
+    """
+    Versioned, stampede-protected cache: on a miss one request recomputes
+    the entry while concurrent requests for the same key wait for it.
+    """
+
+    def __init__(self, alias='default', ttl=300, lock_timeout=30, wait_timeout=5, poll_interval=0.05, enabled=True):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+
+        self.hits = metrics.counter('response_cache_hits', 'API responses served from the response cache')
+        self.misses = metrics.counter(
+            'response_cache_misses', 'API responses computed and stored in the response cache'
+        )
+        self.waits = metrics.counter('response_cache_waits', 'Requests that waited for a concurrent recompute')
+        self.saved_seconds = metrics.counter(
+            'response_cache_saved_seconds', 'Query and serialization time saved by response cache hits'
+        )
+        self.hit_ratio = metrics.gauge('response_cache_hit_ratio', 'Share of cacheable responses served from the cache')
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULT_RESPONSE_CACHE, **getattr(settings, 'RESPONSE_CACHE', {})}
+        return cls(
+            alias=options['CACHE_ALIAS'],
+            ttl=options['TTL'],
+            lock_timeout=options['LOCK_TIMEOUT'],
+            wait_timeout=options['WAIT_TIMEOUT'],
+            poll_interval=options['POLL_INTERVAL'],
+            enabled=options['ENABLED'],
+        )
+
+    @property
+    def shared(self):
+        """
+        True when CACHE_ALIAS is seen by every worker, so a version bumped by
+        one is seen by all.
+        """
+        return settings.CACHES.get(self.alias, {}).get('BACKEND') not in PROCESS_LOCAL_CACHES
+
+    @property
+    def cache(self):
+        if not self.shared:
+            backend = settings.CACHES.get(self.alias, {}).get('BACKEND')
+            raise ImproperlyConfigured(
+                f"The response cache needs a cache shared by every worker for its versions; "
+                f"CACHES['{self.alias}'] uses {backend}. Set RESPONSE_CACHE['CACHE_ALIAS'] "
+                f"or disable it with RESPONSE_CACHE['ENABLED'] = False."
+            )
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(tenant_id, model):
+        return f'resp:v:{tenant_id}:{model._meta.concrete_model._meta.label_lower}'
+
+    def versions(self, tenant_id, models):
+        """
+        Current version of each model for the tenant, in one cache round trip.
+        """
+        keys = [self.version_key(tenant_id, model) for model in models]
+        found = self.cache.get_many(keys)
+        versions = []
+        for key in keys:
+            version = found.get(key)
+            if version is None:
+                # Start from the clock rather than 1: if the version was evicted,
+                # old entries must not match the new one.
+                self.cache.add(key, time.time_ns(), None)
+                version = self.cache.get(key)
+            versions.append(version)
+        return versions
+
+    def bump(self, tenant_id, model):
+        if not self.shared:  # Nothing reads versions then (writes go on without Redis)
+            return
+        key = self.version_key(tenant_id, model)
+        try:
+            self.cache.incr(key)
+        except ValueError:  # No version yet: nothing can be cached under it
+            pass
+
+    def bump_on_commit(self, tenant_id, model, using=None):
+        """
+        bump() once the current transaction on `using` commits: readers
+        recomputing before that would cache the old rows under the new version.
+        """
+        transaction.on_commit(lambda: self.bump(tenant_id, model), using=using)
+
+    def make_key(self, tenant_id, models, scope, path, params, versions=None):
+        if versions is None:
+            versions = self.versions(tenant_id, models)
+        versions = '.'.join(str(version) for version in versions)
+        query = '&'.join(f'{name}={value}' for name, value in sorted(params))
+        digest = hashlib.md5(f'{path}?{query}'.encode()).hexdigest()
+        return f'resp:{tenant_id}:{scope}:{versions}:{digest}'
+
+    def record(self, hit, entry=None):
+        if hit:
+            self.hits.inc()
+            self.saved_seconds.inc(entry['seconds'])
+        else:
+            self.misses.inc()
+        lookups = self.hits.value + self.misses.value
+        self.hit_ratio.set(self.hits.value / lookups if lookups else 0)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the value cached under `key`, or compute it with `compute()` and
+        store it. Only one caller recomputes a missing key at a time; the
+        others wait up to WAIT_TIMEOUT for its result.
+        """
+        entry = self.cache.get(key, _MISSING)
+        if entry is not _MISSING:
+            self.record(hit=True, entry=entry)
+            return entry['value']
+
+        lock_key, token = f'{key}:lock', uuid.uuid4().hex
+        if not self.cache.add(lock_key, token, self.lock_timeout):
+            self.waits.inc()
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                entry = self.cache.get(key, _MISSING)
+                if entry is not _MISSING:
+                    self.record(hit=True, entry=entry)
+                    return entry['value']
+        try:
+            started = time.perf_counter()
+            value = compute()
+            self._store(key, value, time.perf_counter() - started)
+            return value
+        finally:
+            self._release(lock_key, token)
+
+    async def aget_or_compute(self, key, compute):
+        """
+        get_or_compute() for async views: `compute` is a coroutine function and
+        cache calls run in a worker thread.
+        """
+        entry = await sync_to_async(self.cache.get)(key, _MISSING)
+        if entry is not _MISSING:
+            self.record(hit=True, entry=entry)
+            return entry['value']
+
+        lock_key, token = f'{key}:lock', uuid.uuid4().hex
+        if not await sync_to_async(self.cache.add)(lock_key, token, self.lock_timeout):
+            self.waits.inc()
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                entry = await sync_to_async(self.cache.get)(key, _MISSING)
+                if entry is not _MISSING:
+                    self.record(hit=True, entry=entry)
+                    return entry['value']
+        try:
+            started = time.perf_counter()
+            value = await compute()
+            await sync_to_async(self._store)(key, value, time.perf_counter() - started)
+            return value
+        finally:
+            await sync_to_async(self._release)(lock_key, token)
+
+    def _store(self, key, value, seconds):
+        self.cache.set(key, {'value': value, 'seconds': seconds}, self.ttl)
+        self.record(hit=False)
+
+    def _release(self, lock_key, token):
+        if self.cache.get(lock_key) == token:
+            self.cache.delete(lock_key)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide ResponseCache, built from settings.RESPONSE_CACHE on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache.from_settings()
+    return _response_cache
@@ -0,0 +1,141 @@
+# backend/core/sparse_fields.py
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import ListSerializer
+
+
+def split_param(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+def _flatten(tree, prefix=''):
+    # {'patient': {'profile': {}}} -> ['patient__profile']
+    paths = []
+    for name, subtree in tree.items():
+        path = f'{prefix}{name}'
+        paths.extend(_flatten(subtree, f'{path}__') if subtree else [path])
+    return paths
+
+
+class SparseFieldsMixin:
+    """
+    Let read actions return a subset of the serializer's fields with
+    `?fields=id,date,status` or `?exclude=notes,diagnosis`.
+
+    The serializer drops the other fields and, when every remaining field maps
+    to a model field, the query selects only those columns (plus the primary
+    key and the ordering columns). Unused select_related/prefetch_related
+    lookups are dropped as well. Unknown field names are a 400.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    sparse_fields_actions = ('list', 'retrieve')
+    _sparse_fields = False
+
+    def get_sparse_fields(self, serializer):
+        """
+        Names of the serializer fields to keep, or None to keep them all.
+        """
+        if self._sparse_fields is not False:
+            return self._sparse_fields
+        self._sparse_fields = None
+        if getattr(self, 'action', None) not in self.sparse_fields_actions:
+            return None
+        params = self.request.query_params
+        include = split_param(params.get(self.fields_query_param))
+        exclude = split_param(params.get(self.exclude_query_param))
+        if not include and not exclude:
+            return None
+
+        available = [name for name, field in serializer.fields.items() if not field.write_only]
+        unknown = [name for name in include + exclude if name not in available]
+        if unknown:
+            param = self.fields_query_param if set(unknown) & set(include) else self.exclude_query_param
+            raise ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}."]})
+        keep = [name for name in available if (not include or name in include) and name not in exclude]
+        self._sparse_fields = keep
+        return keep
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        target = serializer.child if isinstance(serializer, ListSerializer) else serializer
+        keep = self.get_sparse_fields(target)
+        if keep is not None:
+            for name in list(target.fields):
+                if name not in keep:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if getattr(self, 'action', None) not in self.sparse_fields_actions:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        keep = self.get_sparse_fields(serializer)
+        if keep is None:
+            return queryset
+        return self.restrict_columns(queryset, serializer, keep)
+
+    def required_columns(self, queryset):
+        """
+        Columns the view itself reads from each row, whatever the serializer
+        renders: the ordering (paginators) and the conditional request validator.
+        """
+        opts = queryset.model._meta
+        columns = []
+        for item in queryset.query.order_by or opts.ordering:
+            if isinstance(item, str) and item != '?':
+                name = item.lstrip('-').split('__')[0]
+                columns.append(opts.pk.name if name == 'pk' else name)
+        if getattr(self, 'conditional_requests', False) and any(f.name == 'updated_at' for f in opts.concrete_fields):
+            columns.append('updated_at')  # Validator of conditional requests
+        return columns
+
+    def restrict_columns(self, queryset, serializer, keep):
+        """
+        Apply only() for the model fields behind the serializer fields in
+        `keep`. Left alone if any of them is computed (method field, property,
+        source='*'), since we cannot tell which columns it reads.
+        """
+        opts = queryset.model._meta
+        columns, relations = {opts.pk.name}, set()
+        for name in keep:
+            source_attrs = serializer.fields[name].source_attrs
+            if not source_attrs:
+                return queryset
+            try:
+                model_field = opts.get_field(source_attrs[0])
+            except FieldDoesNotExist:
+                return queryset
+            if model_field.many_to_many or model_field.one_to_many:
+                relations.add(model_field.name)  # Prefetched; needs no column of ours
+                continue
+            if not model_field.concrete:
+                return queryset
+            columns.add(model_field.name)
+            if model_field.is_relation:
+                relations.add(model_field.name)
+        columns.update(self.required_columns(queryset))
+
+        if isinstance(queryset.query.select_related, dict):
+            kept = {name: tree for name, tree in queryset.query.select_related.items() if name in relations}
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*_flatten(kept))
+        elif queryset.query.select_related:
+            # select_related() without arguments follows every non-null foreign key.
+            kept = [
+                name for name in relations
+                if opts.get_field(name).concrete and not opts.get_field(name).null
+            ]
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*kept)
+        lookups = queryset._prefetch_related_lookups
+        if lookups:
+            queryset = queryset.prefetch_related(None).prefetch_related(*[
+                lookup for lookup in lookups
+                if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] in relations
+            ])
+        return queryset.only(*columns)
@@ -0,0 +1,234 @@
+# backend/core/testing.py
+"""
+Test helpers: tenant fixtures and query instrumentation.
+
+TenantTestMixin gives TestCase classes a tenant and requests made for it, as
+TenantMiddleware and authentication would. SharedLocMemCache stands in for
+the shared cache that the response cache and read replicas require. QueryRecorder captures the SQL
+run on every database connection while it is active (DEBUG does not need to
+be on). QueryCountMixin gives TestCase classes an N+1 guard,
+assertConstantQueries(), and TestRunner (the project's TEST_RUNNER) prints
+the query count and duplicated SQL of every API endpoint the suite called
+with `manage.py test --query-report [PATH]`.
+"""
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+# `IN (%s, %s, %s)` -> `IN (%s, ...)`, so only the number of bound values differs.
+_PLACEHOLDER_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def normalize_sql(sql):
+    return _PLACEHOLDER_LIST.sub('(%s, ...)', sql)
+
+
+class QueryRecorder:
+    """
+    Context manager recording (alias, sql, params, seconds) of each query.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self._wrapper(alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _wrapper(self, alias):
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append((alias, sql, params, time.perf_counter() - started))
+        return record
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        """
+        [(sql, times)] of statements run more than once with any parameters,
+        most repeated first: the usual shape of an N+1.
+        """
+        counts = Counter(normalize_sql(sql) for _, sql, _, _ in self.queries)
+        return [(sql, times) for sql, times in counts.most_common() if times > 1]
+
+    def summary(self, limit=5):
+        lines = [f'{self.count} queries']
+        for sql, times in self.duplicates()[:limit]:
+            lines.append(f'  {times}x {sql[:200]}')
+        return '\n'.join(lines)
+
+
+class SharedLocMemCache(LocMemCache):
+    """
+    Local memory cache accepted where a cache shared by every worker is
+    required: the test process is the only worker.
+    """
+
+
+def create_tenant(owner, subdomain='smile', **fields):
+    """
+    Create a tenant named after `subdomain` ('smile' -> 'Smile'), owned by the auth user `owner`.
+    """
+    from apps.tenant.models import Tenant
+
+    return Tenant.objects.create(**{
+        'name': subdomain.capitalize(), 'subdomain': subdomain, 'schema_name': subdomain, 'address': '1 Main St',
+        'phone': '0600000000', 'email': f'{subdomain}@example.com', 'owner': owner, **fields,
+    })
+
+
+class TenantTestMixin:
+    """
+    Tenant fixtures for TestCase classes: `self.tenant` ('Smile'), owned by
+    the auth user `self.user`, and `self.factory` (an APIRequestFactory).
+    """
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create(username='reception')
+        self.tenant = create_tenant(self.user)
+
+    def tenant_request(self, request, user=None):
+        """
+        Set the tenant on `request`, as TenantMiddleware would, and authenticate `user` (default: `self.user`).
+        """
+        request.tenant = self.tenant
+        force_authenticate(request, user or self.user)
+        return request
+
+
+class QueryCountMixin:
+    """
+    N+1 guard for TestCase classes.
+    """
+
+    def assertConstantQueries(self, call, add_rows, sizes=(1, 100), max_queries=None):
+        """
+        Grow the fixture to each of `sizes` rows with `add_rows(count)` (called
+        with the number of rows to add) and assert `call()` runs the same number
+        of queries every time, and at most `max_queries`. Returns the count.
+        """
+        recorders, created = [], 0
+        for size in sizes:
+            add_rows(size - created)
+            created = size
+            with QueryRecorder() as recorder:
+                call()
+            recorders.append((size, recorder))
+
+        first_size, first = recorders[0]
+        for size, recorder in recorders[1:]:
+            if recorder.count != first.count:
+                self.fail(
+                    f'Query count grows with the fixture: {first.count} queries for {first_size} row(s), '
+                    f'{recorder.count} for {size}.\n{recorder.summary()}'
+                )
+        if max_queries is not None and first.count > max_queries:
+            self.fail(f'{first.count} queries, expected at most {max_queries}.\n{first.summary()}')
+        return first.count
+
+
+class EndpointQueryLog:
+    """
+    Query counts per API endpoint, collected by wrapping APIView.dispatch().
+    """
+
+    def __init__(self):
+        self.endpoints = {}     # name -> [calls, max queries, recorder of the costliest call]
+        self._dispatch = None
+
+    def install(self):
+        log, self._dispatch = self, APIView.dispatch
+        original = self._dispatch
+
+        def dispatch(view, request, *args, **kwargs):
+            with QueryRecorder() as recorder:
+                response = original(view, request, *args, **kwargs)
+            log.add(f'{request.method} {type(view).__name__}.{getattr(view, "action", None) or "dispatch"}', recorder)
+            return response
+        APIView.dispatch = dispatch
+
+    def uninstall(self):
+        if self._dispatch is not None:
+            APIView.dispatch = self._dispatch
+            self._dispatch = None
+
+    def add(self, name, recorder):
+        entry = self.endpoints.setdefault(name, [0, -1, None])
+        entry[0] += 1
+        if recorder.count > entry[1]:
+            entry[1], entry[2] = recorder.count, recorder
+
+    def report(self):
+        lines = [f'{"endpoint":<60} {"calls":>5} {"queries":>7} {"duplicated":>10}']
+        ranked = sorted(self.endpoints.items(), key=lambda item: (-item[1][1], item[0]))
+        for name, (calls, queries, recorder) in ranked:
+            duplicates = recorder.duplicates()
+            lines.append(f'{name:<60} {calls:>5} {queries:>7} {sum(times for _, times in duplicates):>10}')
+            for sql, times in duplicates[:3]:
+                lines.append(f'    {times}x {sql[:160]}')
+        return '\n'.join(lines) + '\n'
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner with `--query-report [PATH]`: after the run, list every
+    endpoint called with its highest query count and its repeated SQL
+    (to stdout, or to PATH).
+
+    The process-wide audit log (core.audit) is switched off: its table is
+    not created by migrations, and tests of auditing use their own writer.
+    """
+
+    def __init__(self, query_report=None, **kwargs):
+        super().__init__(**kwargs)
+        self.query_report = query_report
+        self.query_log = EndpointQueryLog()
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--query-report', nargs='?', const='-', default=None, metavar='PATH',
+            help="Report query counts and duplicated SQL per API endpoint (to stdout, or to PATH).",
+        )
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.AUDIT_LOG = {**getattr(settings, 'AUDIT_LOG', {}), 'ENABLED': False}
+        if self.query_report:
+            self.query_log.install()
+
+    def teardown_test_environment(self, **kwargs):
+        if self.query_report:
+            self.query_log.uninstall()
+            report = self.query_log.report()
+            if self.query_report == '-':
+                sys.stdout.write('\n' + report)
+            else:
+                with open(self.query_report, 'w') as output:
+                    output.write(report)
+        super().teardown_test_environment(**kwargs)
@@ -1,9 +1,25 @@
 # backend/core/utils.py
 from rest_framework.response import Response
 from rest_framework import status, viewsets, mixins
-from rest_framework.permissions import IsAuthenticated
-from django.core.exceptions import PermissionDenied
-from functools import wraps
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied, SynchronousOnlyOperation, ValidationError
+from django.core.validators import validate_ipv46_address
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from core.audit import get_audit_log
+from core.db.counts import EstimatedCountPaginator
+from core.db.replicas import get_replica_set, set_replica_reads
+from core.fast_serializers import get_field_plan, ordering_columns
+from core.pagination import KeysetPagination
+from core.query_optimizer import optimize_queryset
+from core.response_cache import get_response_cache
+from core.sparse_fields import SparseFieldsMixin
+from functools import update_wrapper, wraps
+import hashlib
 
 class CustomResponse:
     @staticmethod
@@ -30,12 +46,203 @@ class CustomResponse:
         }
         return Response(response_data, status=status_code)
 
-class TenantViewSet(viewsets.ModelViewSet):
+class TenantViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     """
     Base ViewSet that filters querysets and performs actions based on the tenant context.
+    Read actions accept ?fields= / ?exclude= (see core.sparse_fields).
     """
     permission_classes = [IsAuthenticated]
+    # Actions whose reads may be served by a read replica (see core.db.replicas).
+    replica_actions = ('list', 'retrieve')
+    # Page lists by keyset (core.pagination.KeysetPagination) instead of the
+    # default page numbers; meant for large tables.
+    keyset_pagination = False
+    # Answer list/retrieve with an ETag (and Last-Modified for single objects)
+    # and send 304 Not Modified to clients that already have the current
+    # version. Lists are validated by the tenant's response cache versions of
+    # the model and of `response_cache_dependencies`, single objects by their
+    # `updated_at` field. Versions are only trusted from a cache shared by
+    # every worker; with a per-process cache lists get no validators.
+    conditional_requests = True
+    etag = last_modified = None
+    # Serve list/retrieve from the tenant-scoped response cache
+    # (core.response_cache). Entries are keyed by role and, unless
+    # response_cache_per_user is off, by user; they are invalidated by writes
+    # to the view's model and to `response_cache_dependencies` (models whose
+    # rows are rendered too, e.g. nested serializers or StringRelatedField).
+    cache_responses = False
+    response_cache_per_user = True
+    response_cache_dependencies = ()
+    # Render lists from values() rows through a precompiled field plan instead
+    # of a serializer per row (core.fast_serializers). Same output; views
+    # whose serializer the plan cannot reproduce keep the regular path.
+    fast_list = False
+    # Derive select_related/prefetch_related/only() for reads from the
+    # serializer's fields (core.query_optimizer).
+    optimize_queries = True
+
+    @property
+    def paginator(self):
+        if self.keyset_pagination and not hasattr(self, '_paginator'):
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replicas = get_replica_set()
+        set_replica_reads(
+            self.action in self.replica_actions
+            and request.method in SAFE_METHODS
+            and bool(replicas.replicas)
+            and not replicas.is_sticky(request.user, getattr(request, 'tenant', None))
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Not a token reset: under ASGI initial() runs in another context.
+        set_replica_reads(False)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # Read your own writes: keep this user's reads on the primary for a while.
+            get_replica_set().mark_sticky(request.user, getattr(request, 'tenant', None))
+        if self.etag is not None and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(self.last_modified.timestamp())
+            # Responses differ per user: browsers may keep them but must revalidate.
+            response['Cache-Control'] = 'private, no-cache'
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        not_modified = self.check_list_modified(self.get_queryset().model)
+        if not_modified is not None:
+            return not_modified
+        if self.caches_responses():
+            key = self.response_cache_key(self.get_queryset().model)
+            return Response(get_response_cache().get_or_compute(key, self.list_data))
+        return Response(self.list_data())
+
+    def list_data(self):
+        """
+        The list response body: ListModelMixin.list(), with the fast path.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = self.get_fast_plan()
+        if plan is not None:
+            queryset = plan.values(queryset, ordering_columns(queryset))
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        data = plan.render(rows) if plan is not None else self.get_serializer(rows, many=True).data
+        return data if page is None else self.get_paginated_response(data).data
+
+    def get_fast_plan(self):
+        if not self.fast_list:
+            return None
+        return get_field_plan(self.get_serializer())
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        not_modified = self.check_object_modified(instance)
+        if not_modified is not None:
+            return not_modified
+        if self.caches_responses():
+            key = self.response_cache_key(type(instance))
+            return Response(get_response_cache().get_or_compute(key, lambda: self.get_serializer(instance).data))
+        return Response(self.get_serializer(instance).data)
+
+    def caches_responses(self):
+        return (
+            self.cache_responses
+            and get_response_cache().enabled
+            and getattr(self.request, 'tenant', None) is not None
+        )
+
+    def response_cache_key(self, model):
+        user = self.request.user
+        scope = getattr(user, 'role', None) or 'none'
+        if self.response_cache_per_user:
+            scope = f'{scope}:{user.pk}'
+        return get_response_cache().make_key(
+            self.request.tenant.pk,
+            (model, *self.response_cache_dependencies),
+            scope,
+            self.request.path,
+            self.request.query_params.lists(),
+            versions=self.model_versions(model),
+        )
+
+    def model_versions(self, model):
+        """
+        The tenant's response cache versions of `model` and of
+        `response_cache_dependencies`, fetched once per request: they change
+        whenever a row the response renders is saved or deleted.
+        """
+        if getattr(self, '_model_versions', None) is None:
+            self._model_versions = get_response_cache().versions(
+                self.request.tenant.pk, (model, *self.response_cache_dependencies),
+            )
+        return self._model_versions
+
+    def uses_validators(self, model):
+        return self.conditional_requests and any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+    def uses_list_validators(self, model):
+        # Versions are only bumped for rows with a tenant_id (apps.tenant.signals), and
+        # only by the worker handling the write: other workers must see the same cache.
+        return (
+            self.conditional_requests
+            and getattr(self.request, 'tenant', None) is not None
+            and any(field.attname == 'tenant_id' for field in model._meta.concrete_fields)
+            and get_response_cache().shared
+        )
+
+    def is_conditional(self):
+        return 'HTTP_IF_NONE_MATCH' in self.request.META or 'HTTP_IF_MODIFIED_SINCE' in self.request.META
+
+    def make_etag(self, *parts):
+        # Bodies also depend on who asks (role filtering), not only on the rows.
+        tenant = getattr(self.request, 'tenant', None)
+        key = ':'.join(str(part) for part in (getattr(tenant, 'pk', None), self.request.user.pk, *parts))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def check_list_modified(self, model):
+        """
+        Validate a list by the versions of the models it renders (model_versions):
+        one cache round trip, shared with the response cache key, and no query.
+        Any row of the tenant saved or deleted, including nested ones, changes
+        the ETag. Returns a 304 response, or None when the list must be sent.
+        """
+        if not self.uses_list_validators(model):
+            return None
+        # The request path and query are part of the ETag: filters and pages have their own.
+        query = '&'.join(f'{name}={value}' for name, value in sorted(self.request.query_params.lists()))
+        self.etag = self.make_etag(self.request.path, query, *self.model_versions(model))
+        if not self.is_conditional():
+            return None
+        return get_conditional_response(self.request, etag=self.etag)
+
+    def check_object_modified(self, instance):
+        if not self.uses_validators(type(instance)):
+            return None
+        parts = [instance.pk, instance.updated_at.isoformat()]
+        if self.response_cache_dependencies and getattr(self.request, 'tenant', None) is not None:
+            if not get_response_cache().shared:
+                return None
+            # Nested rows may change without updated_at moving, so no Last-Modified either.
+            parts.extend(self.model_versions(type(instance))[1:])
+        else:
+            self.last_modified = instance.updated_at
+        self.etag = self.make_etag(*parts)
+        if not self.is_conditional():
+            return None
+        return get_conditional_response(
+            self.request, etag=self.etag,
+            last_modified=self.last_modified and int(self.last_modified.timestamp()),
+        )
     
+    def filter_queryset(self, queryset):
+        if self.optimize_queries and self.request.method in SAFE_METHODS:
+            queryset = optimize_queryset(queryset, self.get_serializer(), self.required_columns(queryset))
+        return super().filter_queryset(queryset)
+
     def get_queryset(self):
         """
         Filter queryset by tenant to ensure multi-tenant isolation.
@@ -49,6 +256,127 @@ class TenantViewSet(viewsets.ModelViewSet):
         """
         serializer.save(tenant=self.request.tenant)
 
+class AsyncTenantViewSet(TenantViewSet):
+    """
+    TenantViewSet whose read actions (`async_actions`) run as native async
+    views when settings.ASYNC_TENANT_VIEWS is on (config/asgi.py turns it on).
+
+    Authentication and pagination run in a worker thread, the ORM is used
+    through its async API and serialization happens on the event loop. Other
+    actions keep going through the regular sync dispatch.
+    """
+    async_actions = ('list', 'retrieve')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not getattr(settings, 'ASYNC_TENANT_VIEWS', False):
+            return view
+
+        async_methods = {method for method, action in actions.items() if action in cls.async_actions}
+        if 'get' in async_methods and 'head' not in actions:
+            async_methods.add('head')
+        if not async_methods:
+            return view
+
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method.lower() not in async_methods:
+                return await sync_view(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            if 'get' in actions and 'head' not in actions:
+                actions['head'] = actions['get']
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        # Keeps cls/initkwargs/actions and csrf_exempt from the sync view.
+        update_wrapper(async_view, view)
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        Async counterpart of APIView.dispatch() for the actions in `async_actions`.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication and throttling may hit the database.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        not_modified = await sync_to_async(self.check_list_modified)(queryset.model)
+        if not_modified is not None:
+            return not_modified
+        if self.caches_responses():
+            key = await sync_to_async(self.response_cache_key)(queryset.model)
+            return Response(await get_response_cache().aget_or_compute(key, lambda: self.alist_data(queryset)))
+        return Response(await self.alist_data(queryset))
+
+    async def alist_data(self, queryset):
+        plan = self.get_fast_plan()
+        if plan is not None:
+            queryset = plan.values(queryset, ordering_columns(queryset))
+        page = await self.apaginate_queryset(queryset)
+        rows = [row async for row in queryset] if page is None else page
+        if plan is not None:
+            data = plan.render(rows)
+        else:
+            data = await self.aserialize(self.get_serializer(rows, many=True))
+        return data if page is None else self.get_paginated_response(data).data
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        not_modified = await sync_to_async(self.check_object_modified)(instance)
+        if not_modified is not None:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        if self.caches_responses():
+            key = await sync_to_async(self.response_cache_key)(type(instance))
+            return Response(await get_response_cache().aget_or_compute(key, lambda: self.aserialize(serializer)))
+        return Response(await self.aserialize(serializer))
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, ValidationError, TypeError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        return await sync_to_async(self.paginate_queryset)(queryset)
+
+    async def aserialize(self, serializer):
+        """
+        Return serializer.data, finishing in a worker thread if a field turns
+        out to need a query (e.g. a related object that was not select_related).
+        """
+        try:
+            return serializer.data
+        except SynchronousOnlyOperation:
+            return await sync_to_async(lambda: serializer.data)()
+
 def tenant_required(f):
     """
     Decorator to ensure that request contains tenant information.
@@ -82,17 +410,129 @@ class TenantMixin:
         queryset = super().get_queryset()
         return queryset.filter(tenant=self.request.tenant)
 
+def audited_ip(request):
+    # Forwarded headers are client-controlled; an invalid address would fail the whole audit batch.
+    try:
+        ip = get_client_ip(request)
+        validate_ipv46_address(ip)
+    except ValidationError:
+        return None
+    return ip
+
 class AuditMixin:
     """
-    Mixin to automatically add audit fields to created/updated objects.
+    Mixin to automatically add audit fields to created/updated objects, and
+    to record who read or changed which rows in the audit trail (core.audit).
+
+    The rows are taken from what the view fetched (the page, the object,
+    the exported rows), never from the rendered body, which sparse fieldsets
+    may strip of its ids.
     """
+    # Actions recorded in the audit trail (None: every action). Failed requests are not recorded.
+    audit_actions = None
+    audited_ids = None
+
     def perform_create(self, serializer):
-        serializer.save(
-            created_by=self.request.user,  # Audit: created_by
-            tenant=self.request.tenant      # Audit: tenant context
-        )
+        fields = {'tenant': self.request.tenant}      # Audit: tenant context
+        if self.has_audit_field('created_by'):
+            fields['created_by'] = self.request.user  # Audit: created_by
+        serializer.save(**fields)
+        self.audit_rows([serializer.instance])
 
     def perform_update(self, serializer):
-        serializer.save(
-            updated_by=self.request.user   # Audit: updated_by
+        fields = {}
+        if self.has_audit_field('updated_by'):
+            fields['updated_by'] = self.request.user  # Audit: updated_by
+        serializer.save(**fields)
+        self.audit_rows([serializer.instance])
+
+    def has_audit_field(self, name):
+        return any(field.name == name for field in self.get_audited_model()._meta.concrete_fields)
+
+    def get_audited_model(self):
+        if getattr(self, 'queryset', None) is not None:
+            return self.queryset.model
+        return self.get_serializer_class().Meta.model
+
+    def audits(self, action):
+        return bool(action) and (self.audit_actions is None or action in self.audit_actions)
+
+    def audit_rows(self, rows):
+        """
+        Note the primary keys of rows (model instances or values() dicts) the response is about.
+        """
+        attname = self.get_audited_model()._meta.pk.attname
+        if self.audited_ids is None:
+            self.audited_ids = []
+        self.audited_ids.extend(str(row[attname] if isinstance(row, dict) else row.pk) for row in rows)
+
+    def caches_responses(self):
+        # A cached response skips the queries the audited rows are read from.
+        return super().caches_responses() and not self.audits(getattr(self, 'action', None))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if self.audits(getattr(self, 'action', None)):
+            if page is not None:
+                self.audit_rows(page)
+            else:
+                self.audited_ids = [str(pk) for pk in queryset.values_list('pk', flat=True)]
+        return page
+
+    def export_rendered(self, rows):
+        if self.audits(getattr(self, 'action', None)):
+            self.audit_rows(rows)
+        super().export_rendered(rows)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        action = getattr(self, 'action', None)
+        if response.status_code < 400 and self.audits(action):
+            if response.streaming:
+                # Exports: the rows are only known once they have all been sent.
+                response._resource_closers.append(lambda: self.record_audit(request, response))
+            else:
+                self.record_audit(request, response)
+        return response
+
+    def record_audit(self, request, response):
+        tenant, user = getattr(request, 'tenant', None), getattr(request, 'user', None)
+        get_audit_log().record(
+            tenant_id=getattr(tenant, 'pk', None),
+            user_id=user.pk if user is not None and user.is_authenticated else None,
+            action=self.action,
+            model=self.get_audited_model()._meta.label_lower,
+            object_ids=self.get_audited_object_ids(response),
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            ip=audited_ip(request),
         )
+
+    def get_audited_object_ids(self, response):
+        """
+        Primary keys the response was about: the URL's for detail actions,
+        else those of the rows the view fetched. None when unknown.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            return [str(self.kwargs[lookup_url_kwarg])]
+        return self.audited_ids
+
+class EstimatedCountAdminMixin:
+    """
+    Mixin for ModelAdmin: the change list shows the planner's row estimate
+    for large tables instead of running COUNT(*) (twice) on every page.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None and changelist.paginator.count_is_estimate:
+            self.message_user(
+                request, f"About {changelist.result_count:,} rows: the count is estimated from table statistics.",
+                messages.INFO,
+            )
+        return response
@@ -0,0 +1,131 @@
+from datetime import date, time
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from apps.appointments.conflicts import (
+    AppointmentConflict, booking_guard, bulk_book, find_conflicts, lock_dentists,
+)
+from apps.appointments.models import Appointment
+from apps.appointments.views import AppointmentViewSet
+from apps.users.models import User as ClinicUser
+from core.response_cache import get_response_cache
+from core.testing import TenantTestMixin
+
+DAY = date(2030, 1, 7)
+
+
+class ExclusionViolation(Exception):
+    pgcode = '23P01'
+
+
+class AppointmentConflictTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dentist = ClinicUser.objects.create(username='dentist', tenant=self.tenant, role='dentist')
+        self.other_dentist = ClinicUser.objects.create(username='dentist2', tenant=self.tenant, role='dentist')
+        self.patient = ClinicUser.objects.create(username='patient', tenant=self.tenant, role='patient')
+        self.receptionist = ClinicUser.objects.create(username='reception', tenant=self.tenant, role='receptionist')
+        self.booked = self.book(time(9), time(10))
+
+    def book(self, start_time, end_time, dentist=None, status='scheduled', save=True):
+        appointment = Appointment(
+            tenant=self.tenant, patient=self.patient, dentist=dentist or self.dentist, date=DAY,
+            start_time=start_time, end_time=end_time, status=status,
+        )
+        if save:
+            appointment.save()
+        return appointment
+
+    def call(self, actions, request, **kwargs):
+        self.tenant_request(request, self.receptionist)
+        return AppointmentViewSet.as_view(actions)(request, **kwargs)
+
+    def create(self, start_time, end_time, dentist=None, status='scheduled'):
+        return self.call({'post': 'create'}, self.factory.post('/appointments/', {
+            'tenant': self.tenant.pk, 'patient': self.patient.pk, 'dentist': (dentist or self.dentist).pk,
+            'date': DAY, 'start_time': start_time, 'end_time': end_time, 'status': status,
+        }, format='json'))
+
+    def test_overlapping_booking_is_a_conflict(self):
+        response = self.create('09:30', '10:30')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [self.booked.pk])
+
+        self.assertEqual(self.create('10:00', '10:30').status_code, 201)
+        self.assertEqual(self.create('09:30', '10:30', dentist=self.other_dentist).status_code, 201)
+        self.assertEqual(self.create('09:30', '10:30', status='cancelled').status_code, 201)
+        self.assertEqual(self.create('11:00', '10:30').status_code, 400)
+
+    def test_moving_a_booking(self):
+        later = self.book(time(11), time(12))
+        url = f'/appointments/{later.pk}/'
+        response = self.call({'patch': 'partial_update'}, self.factory.patch(url, {'start_time': '11:30'}),
+                             pk=later.pk)
+        self.assertEqual(response.status_code, 200)  # Overlapping its own old time is fine
+        response = self.call({'patch': 'partial_update'}, self.factory.patch(url, {'start_time': '09:45'}),
+                             pk=later.pk)
+        self.assertEqual(response.status_code, 409)
+
+    def test_pre_checks_run_under_the_dentist_lock(self):
+        # Series occurrences are invisible to the constraint: only the lock keeps a racing series out.
+        calls = []
+        with mock.patch('apps.appointments.conflicts.lock_dentists',
+                        side_effect=lambda tenant, ids, using: calls.append(('lock', tenant, list(ids)))), \
+                mock.patch('apps.appointments.views.ensure_available',
+                           side_effect=lambda *args, **kwargs: calls.append(('check',))):
+            self.assertEqual(self.create('11:00', '11:30').status_code, 201)
+        self.assertEqual(calls, [('lock', self.tenant, [self.dentist.pk]), ('check',)])
+
+    def test_dentist_locks_are_taken_in_id_order(self):
+        connection = mock.MagicMock(vendor='postgresql')
+        with mock.patch('apps.appointments.conflicts.connections', {'default': connection}):
+            lock_dentists(self.tenant, [9, 3, 9], using='default')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        self.assertEqual([call.args[1] for call in cursor.execute.call_args_list], [
+            [self.tenant.pk, 3], [self.tenant.pk, 9],
+        ])
+
+    def test_constraint_violations_become_conflicts(self):
+        with self.assertRaises(AppointmentConflict):
+            with booking_guard():
+                raise IntegrityError('conflicting key value violates exclusion constraint') from ExclusionViolation()
+        with self.assertRaises(IntegrityError):
+            with booking_guard():
+                raise IntegrityError('null value in column "date"')
+
+        # A booking racing past the pre-check is rejected by the database.
+        violation = IntegrityError()
+        violation.__cause__ = ExclusionViolation()
+        with mock.patch('apps.appointments.views.ensure_available'), \
+                mock.patch.object(Appointment, 'save', side_effect=violation):
+            self.assertEqual(self.create('09:30', '10:30').status_code, 409)
+
+    def test_batch_conflicts(self):
+        rows = [
+            self.book(time(10), time(11), save=False),
+            self.book(time(9, 30), time(9, 45), save=False),                # Overlaps the stored booking
+            self.book(time(10, 30), time(10, 45), save=False),              # Overlaps row 0
+            self.book(time(8), time(9), dentist=self.other_dentist, save=False),
+            {'dentist_id': self.dentist.pk, 'date': DAY, 'start_time': time(10), 'end_time': time(12),
+             'status': 'cancelled'},
+            {'dentist_id': self.dentist.pk, 'date': DAY, 'start_time': time(8, 30), 'end_time': time(12)},
+        ]
+        with self.assertNumQueries(2):
+            conflicts = find_conflicts(self.tenant, rows)
+        self.assertEqual(
+            {(conflict.row, conflict.other_row, conflict.appointment) for conflict in conflicts},
+            {(1, 5, None), (1, None, self.booked.pk), (5, None, self.booked.pk), (0, 5, None), (2, 5, None)},
+        )
+        self.assertEqual(find_conflicts(self.tenant, [rows[0], rows[3]]), [])
+
+        with self.assertRaises(AppointmentConflict) as raised:
+            bulk_book(self.tenant, rows[:3])
+        self.assertEqual(sorted({conflict['row'] for conflict in raised.exception.conflicts}), [1, 2])
+        with override_settings(CACHES={'default': {'BACKEND': 'core.testing.SharedLocMemCache'}}):
+            versions = get_response_cache().versions(self.tenant.pk, [Appointment])
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_book(self.tenant, [rows[0], rows[3]])
+            # No post_save for bulk inserts: cached lists and ETags must still see the new rows.
+            self.assertNotEqual(get_response_cache().versions(self.tenant.pk, [Appointment]), versions)
+        self.assertEqual(Appointment.objects.count(), 3)
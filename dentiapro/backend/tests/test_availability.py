@@ -0,0 +1,101 @@
+from datetime import date, datetime, time
+
+from django.test import SimpleTestCase, TestCase
+from apps.appointments.availability import AvailabilityIndex, find_free_slots, merge, subtract
+from apps.appointments.models import Appointment, WorkingHours
+from apps.appointments.views import AppointmentViewSet
+from apps.users.models import User as ClinicUser
+from core.testing import TenantTestMixin
+
+MONDAY = date(2030, 1, 7)
+TUESDAY = date(2030, 1, 8)
+
+
+def slot_times(slots):
+    return [(slot.dentist_id, slot.date.day, slot.start_time.strftime('%H:%M')) for slot in slots]
+
+
+class AvailabilityIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = AvailabilityIndex()
+        for dentist_id in (1, 2):
+            self.index.add_working_hours(dentist_id, MONDAY.weekday(), time(9), time(11))
+        self.index.add_working_hours(1, MONDAY.weekday(), time(14), time(15))
+
+    def test_interval_helpers(self):
+        self.assertEqual(merge([(30, 40), (0, 10), (5, 20), (20, 25)]), [(0, 25), (30, 40)])
+        self.assertEqual(subtract([(0, 60), (90, 120)], [(10, 20), (50, 100)]), [(0, 10), (20, 50), (100, 120)])
+        self.assertEqual(subtract([(0, 60)], []), [(0, 60)])
+
+    def test_bookings_are_carved_out_of_working_hours(self):
+        self.index.add_booking(1, MONDAY, time(9, 30), time(10))
+        self.index.add_booking(1, MONDAY, time(9, 45), time(10, 30))  # Overlaps the previous one
+        self.index.add_booking(2, MONDAY, time(8), time(10))            # Starts before opening time
+        self.assertEqual(self.index.free_intervals(1, MONDAY), [(540, 570), (630, 660), (840, 900)])
+        self.assertEqual(self.index.free_intervals(2, MONDAY), [(600, 660)])
+        self.assertEqual(self.index.free_intervals(1, TUESDAY), [])
+        self.assertEqual(self.index.free_intervals(3, MONDAY), [])
+
+    def test_free_slots_are_chronological_on_the_step_grid(self):
+        self.index.add_booking(1, MONDAY, time(9), time(9, 50))
+        slots = self.index.free_slots(MONDAY, TUESDAY, 30, step=15, limit=5)
+        self.assertEqual(slot_times(slots), [
+            (2, 7, '09:00'), (2, 7, '09:15'), (2, 7, '09:30'), (2, 7, '09:45'), (1, 7, '10:00'),
+        ])
+        self.assertEqual(slots[0].end_time, time(9, 30))
+
+    def test_filters(self):
+        slots = self.index.free_slots(MONDAY, MONDAY, 60, dentist_ids=[1, 3], earliest=datetime(2030, 1, 7, 9, 0, 1))
+        self.assertEqual(slot_times(slots), [(1, 7, '10:00'), (1, 7, '14:00')])
+        self.assertEqual(self.index.free_slots(MONDAY, MONDAY, 60, earliest=datetime(2030, 1, 8)), [])
+
+
+class AvailabilityAPITest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dentists = [
+            ClinicUser.objects.create(username=f'dentist{i}', tenant=self.tenant, role='dentist') for i in (1, 2)
+        ]
+        self.patient = ClinicUser.objects.create(username='patient', tenant=self.tenant, role='patient')
+        self.receptionist = ClinicUser.objects.create(username='reception', tenant=self.tenant, role='receptionist')
+        for dentist in self.dentists:
+            WorkingHours.objects.create(
+                tenant=self.tenant, dentist=dentist, weekday=MONDAY.weekday(), start_time=time(9), end_time=time(10),
+            )
+        self.book(self.dentists[0], time(9), time(9, 30))
+        self.book(self.dentists[0], time(9, 30), time(10), status='cancelled')
+
+    def book(self, dentist, start_time, end_time, status='scheduled'):
+        Appointment.objects.create(
+            tenant=self.tenant, patient=self.patient, dentist=dentist, date=MONDAY,
+            start_time=start_time, end_time=end_time, status=status,
+        )
+
+    def get(self, user, **params):
+        request = self.factory.get('/appointments/availability/', params)
+        self.tenant_request(request, user)
+        return AppointmentViewSet.as_view({'get': 'availability'})(request)
+
+    def test_free_slots(self):
+        first, second = (dentist.pk for dentist in self.dentists)
+        with self.assertNumQueries(3):
+            slots = find_free_slots(self.tenant, MONDAY, TUESDAY, 30)
+        self.assertEqual(slot_times(slots), [(second, 7, '09:00'), (first, 7, '09:30'), (second, 7, '09:30')])
+
+        response = self.get(self.receptionist, **{'from': '2030-01-07', 'to': '2030-01-08', 'duration': 30,
+                                                  'dentist': f'{first}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {'dentist': first, 'date': MONDAY, 'start_time': time(9, 30), 'end_time': time(10)},
+        ])
+
+    def test_dentists_only_see_their_own_calendar(self):
+        response = self.get(self.dentists[1], **{'from': '2030-01-07', 'to': '2030-01-07', 'duration': 60})
+        self.assertEqual([slot['dentist'] for slot in response.data], [self.dentists[1].pk])
+
+    def test_invalid_parameters(self):
+        response = self.get(self.receptionist, **{'from': '2030-01-07', 'to': '2030-06-07', 'duration': 30})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('to', response.data)
+        response = self.get(self.receptionist, **{'from': '2030-01-07', 'to': '2030-01-08', 'dentist': 'a'})
+        self.assertEqual(set(response.data), {'duration', 'dentist'})
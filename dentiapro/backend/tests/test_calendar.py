@@ -0,0 +1,54 @@
+from datetime import date, time, timedelta
+
+from django.test import TestCase
+from apps.appointments.calendar import CALENDAR_FIELDS, calendar_queryset
+from apps.appointments.models import Appointment
+from apps.appointments.views import AppointmentViewSet
+from apps.users.models import User as ClinicUser
+from core.testing import TenantTestMixin
+
+MONDAY = date(2030, 1, 7)
+
+
+class CalendarTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dentists = [
+            ClinicUser.objects.create(username=f'dentist{i}', tenant=self.tenant, role='dentist') for i in (1, 2)
+        ]
+        self.patient = ClinicUser.objects.create(username='patient', tenant=self.tenant, role='patient')
+        self.receptionist = ClinicUser.objects.create(username='reception', tenant=self.tenant, role='receptionist')
+        for offset, hour, dentist in [(0, 11, 0), (0, 9, 1), (1, 9, 0), (7, 9, 0)]:
+            Appointment.objects.create(
+                tenant=self.tenant, patient=self.patient, dentist=self.dentists[dentist],
+                date=MONDAY + timedelta(days=offset), start_time=time(hour), end_time=time(hour, 30),
+            )
+
+    def get(self, user, **params):
+        request = self.factory.get('/appointments/calendar/', params)
+        self.tenant_request(request, user)
+        return AppointmentViewSet.as_view({'get': 'calendar'})(request)
+
+    def test_calendar(self):
+        first, second = (dentist.pk for dentist in self.dentists)
+        response = self.get(self.receptionist, **{'from': '2030-01-07', 'to': '2030-01-13'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['date'].day, row['start_time'].hour, row['dentist']) for row in response.data],
+            [(7, 9, second), (7, 11, first), (8, 9, first)],
+        )
+        self.assertEqual(set(response.data[0]), set(CALENDAR_FIELDS))
+
+        response = self.get(self.receptionist, **{'from': '2030-01-07', 'to': '2030-01-14', 'dentist': first})
+        self.assertEqual([row['date'].day for row in response.data], [7, 8, 14])
+        response = self.get(self.dentists[1], **{'from': '2030-01-07', 'to': '2030-01-14', 'dentist': first})
+        self.assertEqual(response.data, [])
+        response = self.get(self.receptionist, **{'from': '2030-01-14', 'to': '2030-01-07'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_calendar_queries_use_their_index(self):
+        queryset = Appointment.objects.filter(tenant=self.tenant)
+        dentist_week = calendar_queryset(queryset, MONDAY, MONDAY + timedelta(days=6), [self.dentists[0].pk])
+        self.assertIn('appointments_dentist_cal_idx', dentist_week.explain())
+        clinic_day = calendar_queryset(queryset, MONDAY, MONDAY)
+        self.assertIn('appointments_clinic_cal_idx', clinic_day.explain())
@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from apps.tenant.models import Domain
+from apps.tenant.serializers import DomainSerializer
+from core.response_cache import get_response_cache
+from core.testing import TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class DomainListViewSet(TenantViewSet):
+    queryset = Domain.objects.all()
+    serializer_class = DomainSerializer
+    pagination_class = None
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'core.testing.SharedLocMemCache'}})
+class ConditionalRequestTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.domain = Domain.objects.create(domain='smile.ma', tenant=self.tenant)
+        self.list_view = DomainListViewSet.as_view({'get': 'list'})
+        self.detail_view = DomainListViewSet.as_view({'get': 'retrieve'})
+
+    def get(self, view, **headers):
+        request = self.factory.get('/domains/', **headers)
+        self.tenant_request(request)
+        return view(request, pk=self.domain.pk) if view is self.detail_view else view(request)
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.get(self.list_view)['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(self.list_view, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_list_etag_changes_on_update_create_and_delete(self):
+        etags = {self.get(self.list_view)['ETag']}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.domain.is_primary = True
+            self.domain.save()
+        etags.add(self.get(self.list_view)['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Domain.objects.create(domain='smile.com', tenant=self.tenant)
+        etags.add(self.get(self.list_view)['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.domain.delete()
+        response = self.get(self.list_view, HTTP_IF_NONE_MATCH=','.join(etags))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(etags | {response['ETag']}), 4)
+
+    def test_list_etag_changes_with_dependencies(self):
+        DomainListViewSet.response_cache_dependencies = (User,)
+        self.addCleanup(setattr, DomainListViewSet, 'response_cache_dependencies', ())
+        etag = self.get(self.list_view)['ETag']
+        get_response_cache().bump(self.tenant.pk, User)  # e.g. a user rendered by name was renamed
+        self.assertEqual(self.get(self.list_view, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_validators(self):
+        response = self.get(self.detail_view)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(self.detail_view, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.get(self.detail_view, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_lists_have_no_validators_without_a_shared_cache(self):
+        # Another worker's writes would not bump this worker's versions.
+        response = self.get(self.list_view)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertTrue(self.get(self.detail_view).has_header('ETag'))
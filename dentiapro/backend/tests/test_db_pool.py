@@ -0,0 +1,110 @@
+import threading
+import time
+from django.test import TestCase
+from core.db.pool import ConnectionPool, PoolTimeout, get_pool, pool_target
+
+
+class FakeConnection:
+    autocommit = True
+
+    def __init__(self):
+        self.closed = False
+        self.transaction_status = 0
+        self.pings = 0
+
+    def get_transaction_status(self):
+        return self.transaction_status
+
+    def rollback(self):
+        self.transaction_status = 0
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def execute(self, sql):
+                if connection.closed:
+                    raise ConnectionError('server closed the connection')
+                connection.pings += 1
+
+        return Cursor()
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool('test', max_size=2, timeout=0.2)
+
+    def test_connections_are_reused(self):
+        connection = self.pool.checkout(FakeConnection)
+        self.pool.checkin(connection)
+        self.assertIs(self.pool.checkout(FakeConnection), connection)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_checkout_times_out_when_saturated(self):
+        self.pool.checkout(FakeConnection)
+        self.pool.checkout(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            self.pool.checkout(FakeConnection)
+        self.assertGreaterEqual(self.pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_connection_released_by_another_thread(self):
+        first = self.pool.checkout(FakeConnection)
+        self.pool.checkout(FakeConnection)
+
+        def release():
+            time.sleep(0.05)
+            self.pool.checkin(first)
+
+        threading.Thread(target=release).start()
+        self.assertIs(self.pool.checkout(FakeConnection), first)
+
+    def test_open_transaction_is_rolled_back_on_checkin(self):
+        connection = self.pool.checkout(FakeConnection)
+        connection.transaction_status = 2
+        self.pool.checkin(connection)
+        self.assertEqual(connection.transaction_status, 0)
+
+    def test_rollback_on_checkin_forgets_the_search_path(self):
+        connection = self.pool.checkout(FakeConnection)
+        self.pool.info(connection).search_path = 'smile'  # SET inside the transaction rolled back below
+        connection.transaction_status = 2
+        self.pool.checkin(connection)
+        self.assertIsNone(self.pool.info(self.pool.checkout(FakeConnection)).search_path)
+
+        self.pool.info(connection).search_path = 'smile'  # Committed: kept for the next checkout
+        self.pool.checkin(connection)
+        self.assertEqual(self.pool.info(self.pool.checkout(FakeConnection)).search_path, 'smile')
+
+    def test_connections_past_max_lifetime_are_recycled(self):
+        self.pool.max_lifetime = 0
+        connection = self.pool.checkout(FakeConnection)
+        time.sleep(0.01)
+        self.pool.checkin(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_dead_idle_connection_is_replaced(self):
+        self.pool.health_check_interval = 0
+        connection = self.pool.checkout(FakeConnection)
+        self.pool.checkin(connection)
+        connection.closed = True
+        replacement = self.pool.checkout(FakeConnection)
+        self.assertIsNot(replacement, connection)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_pools_are_keyed_by_what_they_connect_to(self):
+        settings_dict = {'HOST': 'db', 'PORT': 5432, 'NAME': 'dentiapro', 'USER': 'app', 'POOL': {}}
+        pool = get_pool('keyed', target=pool_target(settings_dict))
+        self.assertIs(get_pool('keyed', target=pool_target(settings_dict)), pool)
+        maintenance = get_pool('keyed', target=pool_target({**settings_dict, 'NAME': 'postgres'}), name='postgres')
+        self.assertIsNot(maintenance, pool)
+        self.assertEqual(maintenance.size_gauge.name, 'db_pool_postgres_size')
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+from django.test import TestCase, override_settings
+from core.db.replicas import ReplicaSet
+
+
+class ReplicaSetTest(TestCase):
+    def setUp(self):
+        replica = {**connections.databases['default'], 'REPLICA_OF': 'default'}
+        patcher = mock.patch.dict(connections.databases, {'replica1': replica})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.replicas = ReplicaSet(max_lag=5, lag_check_interval=60, cache_alias='default')
+
+    def pick(self):
+        # TestCase runs every test inside a transaction on the primary.
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            return self.replicas.pick('default')
+
+    def test_replicas_are_found_from_databases(self):
+        self.assertEqual(self.replicas.replicas_of('default'), ['replica1'])
+        self.assertTrue(self.replicas.is_replica('replica1'))
+        self.assertEqual(self.replicas.primary_of('replica1'), 'default')
+        self.assertEqual(self.replicas.primary_of('default'), 'default')
+
+    def test_pick_skips_lagging_replicas(self):
+        with mock.patch.object(ReplicaSet, 'lag', return_value=1):
+            self.assertEqual(self.pick(), 'replica1')
+        with mock.patch.object(ReplicaSet, 'lag', return_value=30):
+            self.assertIsNone(self.pick())
+        with mock.patch.object(ReplicaSet, 'lag', return_value=None):
+            self.assertIsNone(self.pick())
+
+    def test_pick_stays_on_primary_inside_transaction(self):
+        with mock.patch.object(ReplicaSet, 'lag', return_value=0):
+            self.assertEqual(self.pick(), 'replica1')
+            self.assertIsNone(self.replicas.pick('default'))
+
+    def test_lag_is_measured_once_per_interval(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (2.5,)
+        connection = mock.Mock(cursor=mock.Mock(return_value=cursor))
+        with mock.patch('core.db.replicas.connections', {'replica1': connection}):
+            self.assertEqual(self.replicas.lag('replica1'), 2.5)
+            self.assertEqual(self.replicas.lag('replica1'), 2.5)
+        self.assertEqual(connection.cursor.call_count, 1)
+
+    def test_unreachable_replica_has_no_lag(self):
+        connection = mock.Mock(cursor=mock.Mock(side_effect=DatabaseError('connection refused')))
+        with mock.patch('core.db.replicas.connections', {'replica1': connection}):
+            self.assertIsNone(self.replicas.lag('replica1'))
+            self.assertFalse(self.replicas.is_fresh('replica1'))
+
+    def test_writers_read_from_primary_for_a_while(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir}
+        user, tenant, other = mock.Mock(pk=7, is_authenticated=True), mock.Mock(pk=1), mock.Mock(pk=2)
+        with override_settings(CACHES={'default': shared}):
+            self.assertFalse(self.replicas.is_sticky(user, tenant))
+            self.replicas.mark_sticky(user, tenant)
+            self.assertTrue(self.replicas.is_sticky(user, tenant))
+            self.assertFalse(self.replicas.is_sticky(user, other))  # Ids are per tenant
+            self.replicas.mark_sticky(AnonymousUser(), tenant)
+            self.assertFalse(self.replicas.is_sticky(AnonymousUser(), tenant))
+
+    def test_sticky_markers_need_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.replicas.mark_sticky(mock.Mock(pk=7, is_authenticated=True))
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from apps.tenant.models import Domain
+from core.export import CSVWriter, StreamingExportMixin
+from core.testing import TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class DomainSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'is_primary', 'created_at']
+
+
+class LabelledDomainSerializer(DomainSerializer):
+    label = serializers.SerializerMethodField()
+
+    class Meta(DomainSerializer.Meta):
+        fields = ['id', 'domain', 'label']
+
+    def get_label(self, obj):
+        return obj.domain.upper()
+
+
+class DomainViewSet(StreamingExportMixin, TenantViewSet):
+    queryset = Domain.objects.order_by('id')
+    serializer_class = DomainSerializer
+    export_chunk_size = 2
+
+
+class StreamingExportTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.domains = [Domain.objects.create(domain=f'smile{i}.ma', tenant=self.tenant) for i in range(5)]
+
+    def export(self, query='', **initkwargs):
+        view = DomainViewSet.as_view({'get': 'export'}, **initkwargs)
+        request = self.factory.get(f'/domains/export/{query}')
+        self.tenant_request(request)
+        return view(request)
+
+    def test_ndjson_streams_in_chunks(self):
+        response = self.export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('attachment; filename="domain-', response['Content-Disposition'])
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['domain'] for row in rows], [domain.domain for domain in self.domains])
+        self.assertEqual(rows[0], DomainSerializer(self.domains[0]).data)
+
+    def test_csv_with_sparse_fields(self):
+        response = self.export('?output=csv&fields=id,domain')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'domain'])
+        self.assertEqual(rows[1:], [[str(domain.id), domain.domain] for domain in self.domains])
+
+    def test_csv_columns_come_from_the_serializer(self):
+        class TenantSerializer(serializers.Serializer):
+            id = serializers.IntegerField()
+            name = serializers.CharField()
+
+        class NestedDomainSerializer(serializers.Serializer):
+            domain = serializers.CharField()
+            tenant = TenantSerializer(allow_null=True)
+            password = serializers.CharField(write_only=True)
+
+        writer = CSVWriter(NestedDomainSerializer())
+        # The first row's null relation must not hide tenant.id and tenant.name.
+        content = writer.write([{'domain': 'a.ma', 'tenant': None}])
+        content += writer.write([{'domain': 'b.ma', 'tenant': {'id': 1, 'name': 'Smile'}}])
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows, [['domain', 'tenant.id', 'tenant.name'], ['a.ma', '', ''], ['b.ma', '1', 'Smile']])
+
+    def test_serializer_without_fast_plan(self):
+        response = self.export(serializer_class=LabelledDomainSerializer)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[-1]['label'], 'SMILE4.MA')
+        self.assertEqual(len(rows), 5)
+
+    @override_settings(ASYNC_TENANT_VIEWS=True)
+    def test_async_iterator_under_asgi(self):
+        response = self.export()
+        self.assertTrue(response.is_async)
+
+        async def consume():
+            return [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(async_to_sync(consume)()), 3)
+
+    def test_unknown_output_is_rejected(self):
+        response = self.export('?output=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output', response.data)
@@ -0,0 +1,64 @@
+from django.test import TestCase
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from apps.tenant.models import Domain
+from apps.tenant.serializers import DomainSerializer, TenantSerializer
+from core.fast_serializers import FieldPlan, get_field_plan
+from core.pagination import KeysetPagination
+from core.testing import TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class NestedDomainSerializer(serializers.ModelSerializer):
+    tenant = TenantSerializer(read_only=True)
+
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'tenant', 'is_primary', 'created_at', 'updated_at']
+
+
+class DomainViewSet(TenantViewSet):
+    queryset = Domain.objects.order_by('-created_at')
+    serializer_class = NestedDomainSerializer
+    pagination_class = KeysetPagination
+    conditional_requests = False
+
+
+class FieldPlanTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Domain.objects.create(domain=f'smile{i}.ma', tenant=self.tenant, is_primary=i == 0)
+
+    def test_output_is_byte_identical(self):
+        for serializer_class in (DomainSerializer, NestedDomainSerializer, TenantSerializer):
+            queryset = serializer_class.Meta.model.objects.order_by('id')
+            plan = get_field_plan(serializer_class())
+            self.assertIsNotNone(plan)
+            fast = JSONRenderer().render(plan.render(plan.values(queryset)))
+            slow = JSONRenderer().render(serializer_class(queryset, many=True).data)
+            self.assertEqual(fast, slow)
+
+    def test_serializers_with_computed_fields_get_no_plan(self):
+        class ComputedSerializer(serializers.ModelSerializer):
+            label = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Domain
+                fields = ['id', 'label']
+
+            def get_label(self, obj):
+                return obj.domain.upper()
+
+        self.assertIsNone(FieldPlan.compile(ComputedSerializer()))
+
+    def test_fast_list_matches_regular_list(self):
+        def get(fast_list):
+            view = DomainViewSet.as_view({'get': 'list'}, fast_list=fast_list)
+            request = self.factory.get('/domains/?page_size=3')
+            self.tenant_request(request)
+            response = view(request)
+            response.render()
+            return response.content
+
+        self.assertEqual(get(fast_list=True), get(fast_list=False))
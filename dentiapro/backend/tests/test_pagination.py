@@ -0,0 +1,106 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from core.pagination import EstimatedCountPagination, KeysetPagination
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        now = timezone.now().replace(microsecond=123456)
+        # Pairs of users share a date_joined, so pages must break ties on id.
+        User.objects.bulk_create(
+            User(username=f'user{i}', date_joined=now - timedelta(minutes=i // 2)) for i in range(25)
+        )
+        self.queryset = User.objects.order_by('-date_joined')
+        self.expected = list(self.queryset.order_by('-date_joined', '-id').values_list('id', flat=True))
+
+    def paginate(self, url):
+        paginator = KeysetPagination()
+        request = Request(self.factory.get(url))
+        rows = paginator.paginate_queryset(self.queryset, request)
+        return [row.id for row in rows], paginator.get_next_link(), paginator.get_previous_link()
+
+    def test_forward_pages_cover_every_row_once(self):
+        seen, url, pages = [], '/users/?page_size=10', 0
+        while url:
+            ids, url, previous = self.paginate(url)
+            self.assertEqual(previous is None, pages == 0)
+            seen += ids
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_link_returns_the_previous_page(self):
+        first, next_url, _ = self.paginate('/users/?page_size=10')
+        second, next_url, previous_url = self.paginate(next_url)
+        self.assertEqual(second, self.expected[10:20])
+        ids, next_url, previous_url = self.paginate(previous_url)
+        self.assertEqual(ids, first)
+        self.assertIsNone(previous_url)
+        self.assertEqual(self.paginate(next_url)[0], second)
+
+    def test_deep_pages_use_one_query_without_count_or_offset(self):
+        _, next_url, _ = self.paginate('/users/?page_size=10')
+        _, next_url, _ = self.paginate(next_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.paginate(next_url)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.paginate('/users/?cursor=garbage')
+
+
+@override_settings(ESTIMATED_COUNTS={'THRESHOLD': 1000})
+class EstimatedCountPaginationTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        User.objects.bulk_create(User(username=f'user{i}') for i in range(5))
+
+    def paginate(self, estimate, url='/users/'):
+        paginator = EstimatedCountPagination()
+        paginator.page_size = 2
+        request = Request(self.factory.get(url))
+        with mock.patch('core.db.counts.estimate_count', return_value=estimate) as estimate_count:
+            with CaptureQueriesContext(connection) as queries:
+                rows = paginator.paginate_queryset(User.objects.order_by('id'), request)
+                data = paginator.get_paginated_response([row.username for row in rows]).data
+        estimate_count.assert_called_once()
+        return data, queries
+
+    def test_large_result_sets_are_estimated(self):
+        data, queries = self.paginate(250000)
+        self.assertEqual(data['count'], 250000)
+        self.assertTrue(data['count_is_estimate'])
+        self.assertEqual(data['results'], ['user0', 'user1'])
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries))
+
+    def test_small_result_sets_are_counted(self):
+        for estimate in (None, 999):
+            data, _ = self.paginate(estimate)
+            self.assertEqual(data['count'], 5)
+            self.assertFalse(data['count_is_estimate'])
+
+    def test_estimates_do_not_limit_navigation(self):
+        # Estimated at 2 rows (one page of 2) while there are 5.
+        with mock.patch('core.db.counts.get_count_options', return_value={'ENABLED': True, 'THRESHOLD': 1}):
+            first, _ = self.paginate(2)
+            last, _ = self.paginate(2, '/users/?page=3')
+        self.assertEqual((first['count'], first['count_is_estimate']), (2, True))
+        self.assertIn('page=2', first['next'])
+        self.assertEqual(last['results'], ['user4'])
+        self.assertIsNone(last['next'])
+        self.assertIn('page=2', last['previous'])
+
+        with self.assertRaises(NotFound):
+            self.paginate(250000, '/users/?page=4')
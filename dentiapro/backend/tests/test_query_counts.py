@@ -0,0 +1,117 @@
+from datetime import date, time
+
+from django.test import TestCase
+from rest_framework import serializers
+from apps.appointments.models import Appointment
+from apps.appointments.views import AppointmentViewSet
+from apps.medical_records.models import MedicalRecord
+from apps.medical_records.views import MedicalRecordViewSet
+from apps.tenant.models import Domain
+from apps.users.models import User as ClinicUser
+from core.testing import EndpointQueryLog, QueryCountMixin, QueryRecorder, TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class DomainSerializer(serializers.ModelSerializer):
+    tenant = serializers.StringRelatedField()
+
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'tenant']
+
+
+class DomainViewSet(TenantViewSet):
+    queryset = Domain.objects.order_by('id')
+    serializer_class = DomainSerializer
+    pagination_class = None
+
+
+class QueryGuardTest(TenantTestMixin, QueryCountMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = 0
+
+    def add_domains(self, count):
+        for _ in range(count):
+            self.rows += 1
+            Domain.objects.create(domain=f'smile{self.rows}.ma', tenant=self.tenant)
+
+    def list_domains(self, **initkwargs):
+        view = DomainViewSet.as_view({'get': 'list'}, **initkwargs)
+        request = self.factory.get('/domains/')
+        self.tenant_request(request)
+        return view(request)
+
+    def test_n_plus_one_is_reported(self):
+        with self.assertRaises(self.failureException) as failure:
+            self.assertConstantQueries(lambda: self.list_domains(optimize_queries=False), self.add_domains, (1, 10))
+        self.assertIn('1 row(s)', str(failure.exception))
+        self.assertIn('10x SELECT', str(failure.exception))
+
+    def test_constant_queries(self):
+        self.assertEqual(self.assertConstantQueries(self.list_domains, self.add_domains, max_queries=1), 1)
+
+    def test_recorder_groups_parameters(self):
+        self.add_domains(3)
+        with QueryRecorder() as recorder:
+            for domain in Domain.objects.all():
+                Domain.objects.filter(pk__in=[domain.pk] * domain.pk).exists()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.duplicates()), 1)
+        self.assertEqual(recorder.duplicates()[0][1], 3)
+
+    def test_endpoint_report(self):
+        self.add_domains(3)
+        log = EndpointQueryLog()
+        log.install()
+        try:
+            self.list_domains(optimize_queries=False)
+            self.list_domains(optimize_queries=False)
+        finally:
+            log.uninstall()
+        report = log.report()
+        self.assertRegex(report, r'GET DomainViewSet\.list\s+2\s+4\s+3')
+        self.assertIn('3x SELECT', report)
+
+
+class APIQueryCountTest(TenantTestMixin, QueryCountMixin, TestCase):
+    """
+    Listing appointments and medical records must not cost a query per row.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.dentist = ClinicUser.objects.create(username='dentist', tenant=self.tenant, role='dentist')
+        self.rows = 0
+
+    def add_patient(self):
+        self.rows += 1
+        return ClinicUser.objects.create(username=f'patient{self.rows}', tenant=self.tenant, role='patient')
+
+    def add_appointments(self, count):
+        for _ in range(count):
+            Appointment.objects.create(
+                tenant=self.tenant, patient=self.add_patient(), dentist=self.dentist,
+                date=date(2024, 1, 1 + self.rows % 28), start_time=time(9), end_time=time(10),
+            )
+
+    def add_records(self, count):
+        for _ in range(count):
+            MedicalRecord.objects.create(
+                tenant=self.tenant, patient=self.add_patient(), dentist=self.dentist,
+                diagnosis='Cavity', treatment_plan='Filling',
+            )
+
+    def list(self, viewset):
+        view = viewset.as_view({'get': 'list'}, cache_responses=False)
+        request = self.factory.get('/')
+        self.tenant_request(request, self.dentist)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_appointment_list(self):
+        self.assertConstantQueries(lambda: self.list(AppointmentViewSet), self.add_appointments)
+
+    def test_medical_record_list(self):
+        self.assertConstantQueries(lambda: self.list(MedicalRecordViewSet), self.add_records)
@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory, force_authenticate
+from apps.tenant.models import Domain, Tenant
+from apps.tenant.serializers import TenantDetailSerializer, TenantSerializer
+from core.query_optimizer import QueryPlan, optimize_queryset
+from core.testing import create_tenant
+from core.utils import TenantViewSet
+
+
+class NestedDomainSerializer(serializers.ModelSerializer):
+    tenant = TenantSerializer(read_only=True)
+
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'tenant', 'is_primary']
+
+
+class LabelledDomainSerializer(serializers.ModelSerializer):
+    tenant = serializers.StringRelatedField()
+    owner = serializers.CharField(source='tenant.owner.username')
+    label = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'tenant', 'owner', 'label']
+
+    def get_label(self, obj):
+        return obj.domain.upper()
+
+
+class DomainViewSet(TenantViewSet):
+    queryset = Domain.objects.order_by('id')
+    serializer_class = NestedDomainSerializer
+    pagination_class = None
+    conditional_requests = False
+
+
+class QueryOptimizerTest(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create(username='reception')
+        self.tenants = []
+        for name in ('smile', 'molar', 'canine'):
+            tenant = create_tenant(self.user, name)
+            Domain.objects.create(domain=f'{name}.ma', tenant=tenant)
+            Domain.objects.create(domain=f'www.{name}.ma', tenant=tenant)
+            self.tenants.append(tenant)
+
+    def test_nested_serializer_is_joined_with_its_columns(self):
+        plan = QueryPlan.compile(NestedDomainSerializer())
+        select, only, prefetch = plan.lookups()
+        self.assertEqual(select, ['tenant'])
+        self.assertEqual(set(only), {
+            'id', 'domain', 'tenant', 'is_primary',
+            'tenant__id', 'tenant__name', 'tenant__subdomain', 'tenant__email', 'tenant__created_at',
+            'tenant__updated_at',
+        })
+        self.assertEqual(prefetch, [])
+
+        queryset = optimize_queryset(Domain.objects.order_by('id'), NestedDomainSerializer())
+        with self.assertNumQueries(1):
+            data = NestedDomainSerializer(queryset, many=True).data
+        self.assertEqual(data[0]['tenant']['name'], 'Smile')
+
+    def test_sources_method_fields_and_str_load_whole_rows(self):
+        plan = QueryPlan.compile(LabelledDomainSerializer())
+        select, only, _ = plan.lookups()
+        self.assertEqual(select, ['tenant', 'tenant__owner'])
+        self.assertIn('created_at', only)  # Method field: every Domain column
+        self.assertIn('tenant__address', only)  # Tenant.__str__
+        self.assertEqual(
+            {path for path in only if path.startswith('tenant__owner__')},
+            {'tenant__owner__id', 'tenant__owner__username'},
+        )
+
+        queryset = optimize_queryset(Domain.objects.order_by('id'), LabelledDomainSerializer())
+        with self.assertNumQueries(1):
+            data = LabelledDomainSerializer(queryset, many=True).data
+        self.assertEqual(data[0]['owner'], 'reception')
+        self.assertEqual(data[0]['label'], 'SMILE.MA')
+
+    def test_reverse_relation_is_prefetched(self):
+        queryset = optimize_queryset(Tenant.objects.order_by('id'), TenantDetailSerializer())
+        with self.assertNumQueries(2):
+            data = TenantDetailSerializer(queryset, many=True).data
+        self.assertEqual([domain['domain'] for domain in data[1]['domains']], ['molar.ma', 'www.molar.ma'])
+
+    def test_view_reads_are_optimized(self):
+        view = DomainViewSet.as_view({'get': 'list'})
+        request = self.factory.get('/domains/')
+        request.tenant = self.tenants[0]
+        force_authenticate(request, self.user)
+        with self.assertNumQueries(1):
+            response = view(request)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]['tenant']['subdomain'], 'smile')
@@ -0,0 +1,191 @@
+from datetime import date, time, timedelta
+from itertools import islice
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from apps.appointments.availability import find_free_slots
+from apps.appointments.models import Appointment, AppointmentSeries, WorkingHours
+from apps.appointments.recurrence import RecurrenceRule
+from apps.appointments.views import AppointmentSeriesViewSet, AppointmentViewSet
+from apps.users.models import User as ClinicUser
+from core.testing import TenantTestMixin
+
+MONDAY = date(2030, 1, 7)
+
+
+class RecurrenceRuleTest(SimpleTestCase):
+    def dates(self, rule, dtstart, start, end):
+        return list(RecurrenceRule.parse(rule).between(dtstart, start, end))
+
+    def test_parse(self):
+        rule = RecurrenceRule.parse('freq=weekly;byday=TH,MO;interval=2;count=6')
+        self.assertEqual((rule.freq, rule.interval, rule.byday, rule.count), ('WEEKLY', 2, (0, 3), 6))
+        self.assertEqual(str(rule), 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH;COUNT=6')
+        self.assertEqual(RecurrenceRule.parse('FREQ=DAILY;UNTIL=20300131T000000Z').until, date(2030, 1, 31))
+        for invalid in ('FREQ=YEARLY', 'FREQ=DAILY;BYDAY=MO', 'FREQ=DAILY;COUNT=2;UNTIL=20300101',
+                        'FREQ=WEEKLY;BYDAY=XX', 'FREQ=DAILY;INTERVAL=0', 'FREQ=DAILY;BYHOUR=9', 'FREQ'):
+            with self.assertRaises(ValueError, msg=invalid):
+                RecurrenceRule.parse(invalid)
+
+    def test_between(self):
+        self.assertEqual(
+            self.dates('FREQ=DAILY;INTERVAL=3', MONDAY, MONDAY + timedelta(days=4), MONDAY + timedelta(days=10)),
+            [MONDAY + timedelta(days=6), MONDAY + timedelta(days=9)],
+        )
+        self.assertEqual(
+            self.dates('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH', MONDAY + timedelta(days=1), MONDAY, date(2030, 1, 31)),
+            [date(2030, 1, 10), date(2030, 1, 21), date(2030, 1, 24)],
+        )
+        self.assertEqual(
+            self.dates('FREQ=MONTHLY', date(2030, 1, 31), date(2030, 1, 1), date(2030, 5, 31)),
+            [date(2030, 1, 31), date(2030, 3, 31), date(2030, 5, 31)],  # No 31st in February and April
+        )
+        self.assertEqual(self.dates('FREQ=DAILY', MONDAY, MONDAY - timedelta(days=7), MONDAY - timedelta(days=1)), [])
+
+    def test_windows_match_the_full_expansion(self):
+        dtstart = date(2030, 1, 30)
+        for rule in ('FREQ=DAILY;INTERVAL=5', 'FREQ=WEEKLY;INTERVAL=3;BYDAY=TU,SA', 'FREQ=MONTHLY;INTERVAL=5'):
+            parsed = RecurrenceRule.parse(rule)
+            everything = list(parsed.between(dtstart, dtstart, date(2060, 1, 1)))
+            for start in (date(2031, 2, 1), date(2047, 6, 17)):
+                end = start + timedelta(days=400)
+                expected = [day for day in everything if start <= day <= end]
+                self.assertEqual(list(parsed.between(dtstart, start, end)), expected, rule)
+
+    def test_last_date(self):
+        rule = RecurrenceRule.parse('FREQ=WEEKLY;BYDAY=MO,FR;COUNT=5')
+        self.assertEqual(rule.last_date(MONDAY), list(islice(rule.between(MONDAY, MONDAY, date(2031, 1, 1)), 5))[-1])
+        self.assertEqual(rule.last_date(MONDAY), date(2030, 1, 21))
+        self.assertIsNone(RecurrenceRule.parse('FREQ=DAILY').last_date(MONDAY))
+
+
+class AppointmentSeriesTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dentist = ClinicUser.objects.create(username='dentist', tenant=self.tenant, role='dentist')
+        self.patient = ClinicUser.objects.create(username='patient', tenant=self.tenant, role='patient')
+        self.receptionist = ClinicUser.objects.create(username='reception', tenant=self.tenant, role='receptionist')
+
+    def call(self, viewset, actions, request, **kwargs):
+        self.tenant_request(request, self.receptionist)
+        return viewset.as_view(actions)(request, **kwargs)
+
+    def create_series(self, rule='FREQ=WEEKLY;COUNT=4', start_date=MONDAY, status=201, **times):
+        response = self.call(AppointmentSeriesViewSet, {'post': 'create'}, self.factory.post('/appointment-series/', {
+            'patient': self.patient.pk, 'dentist': self.dentist.pk, 'start_date': start_date, 'start_time': '09:00',
+            'end_time': '09:30', 'rule': rule, **times,
+        }, format='json'))
+        self.assertEqual(response.status_code, status, response.data)
+        return response.data
+
+    def update_series(self, series, **data):
+        return self.call(
+            AppointmentSeriesViewSet, {'patch': 'partial_update'},
+            self.factory.patch(f'/appointment-series/{series}/', data, format='json'), pk=series,
+        )
+
+    def calendar(self, start=MONDAY, end=MONDAY + timedelta(days=30)):
+        response = self.call(AppointmentViewSet, {'get': 'calendar'}, self.factory.get('/appointments/calendar/', {
+            'from': start, 'to': end,
+        }))
+        return [(row['id'], row['date'].day, row['start_time'].hour, row['status']) for row in response.data]
+
+    def change(self, series, day, **data):
+        return self.call(
+            AppointmentSeriesViewSet, {'patch': 'occurrence'},
+            self.factory.patch(f'/appointment-series/{series}/occurrences/{day}/', data, format='json'),
+            pk=series, occurrence_date=str(day),
+        )
+
+    def test_occurrences_are_expanded_for_the_window(self):
+        series = self.create_series()
+        self.assertEqual(series['last_date'], '2030-01-28')
+        self.assertEqual(self.calendar(), [(None, day, 9, 'scheduled') for day in (7, 14, 21, 28)])
+        self.assertEqual(self.calendar(MONDAY + timedelta(days=8), MONDAY + timedelta(days=8)), [])
+        self.assertEqual(Appointment.objects.count(), 0)
+
+        response = self.call(AppointmentSeriesViewSet, {'post': 'create'}, self.factory.post('/appointment-series/', {
+            'patient': self.patient.pk, 'dentist': self.dentist.pk, 'start_date': MONDAY, 'start_time': '09:00',
+            'end_time': '09:30', 'rule': 'FREQ=HOURLY',
+        }, format='json'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('rule', response.data)
+
+    def test_changed_occurrences_are_materialized(self):
+        series = self.create_series()['id']
+        response = self.change(series, date(2030, 1, 14), start_time='11:00', end_time='11:30')
+        self.assertEqual(response.status_code, 200, response.data)
+        moved = response.data['id']
+        self.assertEqual(response.data['series'], series)
+        self.assertEqual(response.data['original_date'], '2030-01-14')
+        cancelled = self.change(series, date(2030, 1, 21), status='cancelled').data['id']
+        self.change(series, date(2030, 1, 14), start_time='10:00', end_time='10:30')  # Same row again
+
+        self.assertEqual(Appointment.objects.count(), 2)
+        self.assertEqual(self.calendar(), [
+            (None, 7, 9, 'scheduled'), (moved, 14, 10, 'scheduled'), (cancelled, 21, 9, 'cancelled'),
+            (None, 28, 9, 'scheduled'),
+        ])
+        self.assertEqual(self.change(series, date(2030, 1, 15), status='cancelled').status_code, 404)
+        self.assertEqual(self.change(series, date(2030, 2, 4), status='cancelled').status_code, 404)  # After COUNT
+
+    def test_occurrences_block_their_time(self):
+        self.create_series('FREQ=DAILY')
+        WorkingHours.objects.create(
+            tenant=self.tenant, dentist=self.dentist, weekday=0, start_time=time(9), end_time=time(10),
+        )
+        slots = find_free_slots(self.tenant, MONDAY + timedelta(days=7), MONDAY + timedelta(days=7), 30)
+        self.assertEqual([slot.start_time for slot in slots], [time(9, 30)])
+
+        response = self.call(AppointmentViewSet, {'post': 'create'}, self.factory.post('/appointments/', {
+            'tenant': self.tenant.pk, 'patient': self.patient.pk, 'dentist': self.dentist.pk, 'date': MONDAY,
+            'start_time': '09:15', 'end_time': '09:45', 'status': 'scheduled',
+        }, format='json'))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.data['series']), 1)
+
+    def test_series_do_not_double_book(self):
+        booked = Appointment.objects.create(
+            tenant=self.tenant, patient=self.patient, dentist=self.dentist, date=MONDAY + timedelta(days=14),
+            start_time=time(9, 15), end_time=time(9, 45),
+        )
+        response = self.create_series(status=409)
+        self.assertEqual(response['conflicts'], [
+            {'date': MONDAY + timedelta(days=14), 'appointment': booked.pk, 'series': None},
+        ])
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+        series = self.create_series(start_time='10:00', end_time='10:30')['id']
+        # Another series over the first one, from its third week on.
+        response = self.create_series(
+            'FREQ=DAILY', start_date=MONDAY + timedelta(days=20), status=409, start_time='10:00', end_time='10:30',
+        )
+        self.assertEqual([row['series'] for row in response['conflicts']], [series])
+
+        # Rescheduling is checked, against its own materialized occurrences too; other changes are not.
+        self.assertEqual(self.update_series(series, start_time='09:00', end_time='09:30').status_code, 409)
+        self.assertEqual(self.change(
+            series, MONDAY + timedelta(days=7), date=MONDAY + timedelta(days=8), start_time='12:00', end_time='12:30',
+        ).status_code, 200)
+        response = self.update_series(series, rule='FREQ=DAILY;COUNT=10', start_time='12:00', end_time='12:30')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'][0]['appointment'], Appointment.objects.get(series=series).pk)
+        self.assertEqual(self.update_series(series, notes='Aligners').status_code, 200)
+
+    def test_series_writes_lock_their_dentist(self):
+        with mock.patch('apps.appointments.conflicts.lock_dentists') as lock:
+            series = self.create_series()['id']
+            self.change(series, MONDAY, start_time='11:00', end_time='11:30', dentist=self.dentist.pk)
+        self.assertEqual([call.args[:2] for call in lock.call_args_list], [
+            (self.tenant, [self.dentist.pk]), (self.tenant, [self.dentist.pk, self.dentist.pk]),
+        ])
+
+    def test_open_ended_series_are_checked_up_to_the_horizon(self):
+        far = Appointment.objects.create(
+            tenant=self.tenant, patient=self.patient, dentist=self.dentist, date=MONDAY + timedelta(weeks=60),
+            start_time=time(9), end_time=time(9, 30),
+        )
+        AppointmentSeries.objects.filter(pk=self.create_series('FREQ=WEEKLY')['id']).delete()
+        far.date = MONDAY + timedelta(weeks=40)
+        far.save()
+        self.create_series('FREQ=WEEKLY', status=409)
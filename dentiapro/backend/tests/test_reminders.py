@@ -0,0 +1,129 @@
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from apps.appointments.models import Appointment, AppointmentSeries, ReminderDelivery
+from apps.appointments.reminders import FakeTransport, ReminderScheduler
+from apps.users.models import User as ClinicUser
+from core.testing import create_tenant
+
+NOW = timezone.make_aware(datetime(2030, 1, 7, 8, 0))
+MONDAY = date(2030, 1, 7)
+
+
+class ReminderSchedulerTest(TestCase):
+    def setUp(self):
+        FakeTransport.outbox = []
+        FakeTransport.failing = set()
+        FakeTransport.opened = 0
+        self.owner = User.objects.create(username='owner')
+        self.tenant = self.create_tenant('smile')
+        self.scheduler = ReminderScheduler(
+            channels={'sms': FakeTransport, 'email': FakeTransport}, concurrency=2, batch_size=2,
+        )
+
+    def create_tenant(self, name):
+        tenant = create_tenant(self.owner, name)
+        tenant.dentist = ClinicUser.objects.create(
+            username=f'{name}-dentist', tenant=tenant, role='dentist', last_name='Haddad',
+        )
+        return tenant
+
+    def add_patient(self, tenant, name, **contacts):
+        return ClinicUser.objects.create(
+            username=f'{tenant.subdomain}-{name}', tenant=tenant, role='patient', first_name=name.title(), **contacts,
+        )
+
+    def book(self, tenant, patient, day, hour, status='scheduled'):
+        return Appointment.objects.create(
+            tenant=tenant, patient=patient, dentist=tenant.dentist, date=day, start_time=time(hour),
+            end_time=time(hour, 30), status=status,
+        )
+
+    def sent(self):
+        return sorted((reminder.to, reminder.delivery.channel) for reminder in FakeTransport.outbox)
+
+    def test_due_reminders_are_sent_once(self):
+        amina = self.add_patient(self.tenant, 'amina', phone='+212600000001', email='amina@example.com')
+        omar = self.add_patient(self.tenant, 'omar', email='omar@example.com')
+        appointment = self.book(self.tenant, amina, MONDAY, 10)
+        self.book(self.tenant, omar, MONDAY + timedelta(days=1), 7)           # Within 24 hours
+        self.book(self.tenant, omar, MONDAY + timedelta(days=1), 9)           # Too far ahead
+        self.book(self.tenant, omar, MONDAY, 7)                               # Already started
+        self.book(self.tenant, omar, MONDAY, 11, status='cancelled')
+
+        stats = self.scheduler.run([self.tenant], NOW)
+        self.assertEqual(stats, {'tenants': 1, 'due': 3, 'sent': 3, 'failed': 0})
+        self.assertEqual(self.sent(), [
+            ('+212600000001', 'sms'), ('amina@example.com', 'email'), ('omar@example.com', 'email'),
+        ])
+        reminder = next(reminder for reminder in FakeTransport.outbox if reminder.delivery.channel == 'sms')
+        self.assertEqual(
+            reminder.body, "Hello Amina, this is a reminder of your appointment with Dr Haddad at Smile on "
+                           "07/01/2030 at 10:00.",
+        )
+        delivery = ReminderDelivery.objects.get(appointment=appointment, channel='sms')
+        self.assertEqual((delivery.status, delivery.attempts, delivery.claim), ('sent', 1, None))
+        self.assertTrue(delivery.provider_id.startswith('fake-'))
+
+        # Later runs, even overlapping ones, do not send them again.
+        self.assertEqual(self.scheduler.run([self.tenant], NOW + timedelta(minutes=5))['sent'], 0)
+        self.assertEqual(len(FakeTransport.outbox), 3)
+
+    def test_failed_reminders_are_retried(self):
+        amina = self.add_patient(self.tenant, 'amina', phone='+212600000001', email='amina@example.com')
+        self.book(self.tenant, amina, MONDAY, 10)
+        FakeTransport.failing = {'+212600000001'}
+        self.assertEqual(self.scheduler.run([self.tenant], NOW)['failed'], 1)
+        self.assertEqual(self.scheduler.run([self.tenant], NOW)['failed'], 1)
+        FakeTransport.failing = set()
+        self.assertEqual(self.scheduler.run([self.tenant], NOW)['sent'], 1)
+        self.assertEqual(ReminderDelivery.objects.get(channel='sms').attempts, 3)
+
+        FakeTransport.failing = {'+212600000001'}
+        self.book(self.tenant, amina, MONDAY, 12)
+        for _ in range(4):
+            self.scheduler.run([self.tenant], NOW)
+        self.assertEqual(ReminderDelivery.objects.filter(status='failed').get().attempts, 3)  # MAX_ATTEMPTS
+
+    def test_claims(self):
+        amina = self.add_patient(self.tenant, 'amina', phone='+212600000001')
+        self.book(self.tenant, amina, MONDAY, 10)
+        reminders = self.scheduler.due(self.tenant, NOW)
+        self.assertEqual(len(self.scheduler.claim(self.tenant, reminders, NOW)), 1)
+        self.assertEqual(self.scheduler.claim(self.tenant, self.scheduler.due(self.tenant, NOW), NOW), [])
+        # The claim of a run that died expires.
+        later = NOW + self.scheduler.claim_timeout + timedelta(seconds=1)
+        self.assertEqual(len(self.scheduler.claim(self.tenant, self.scheduler.due(self.tenant, NOW), later)), 1)
+
+    def test_series_occurrences_are_reminded(self):
+        amina = self.add_patient(self.tenant, 'amina', email='amina@example.com')
+        series = AppointmentSeries.objects.create(
+            tenant=self.tenant, patient=amina, dentist=self.tenant.dentist, start_date=MONDAY - timedelta(days=7),
+            start_time=time(15), end_time=time(15, 30), rule='FREQ=WEEKLY',
+        )
+        self.scheduler.run([self.tenant], NOW)
+        self.assertEqual(self.sent(), [('amina@example.com', 'email')])
+        self.assertEqual(ReminderDelivery.objects.get().series, series)
+
+        # Materializing the occurrence does not remind it again.
+        Appointment.objects.create(
+            tenant=self.tenant, patient=amina, dentist=self.tenant.dentist, date=MONDAY, start_time=time(15),
+            end_time=time(15, 30), series=series, original_date=MONDAY, status='confirmed',
+        )
+        self.assertEqual(self.scheduler.run([self.tenant], NOW)['due'], 0)
+
+    def test_tenants_share_the_worker_pool(self):
+        tenants = [self.tenant] + [self.create_tenant(f'clinic{i}') for i in range(3)]
+        for tenant in tenants:
+            for i in range(3):
+                self.book(tenant, self.add_patient(tenant, f'p{i}', email=f'p{i}@{tenant.subdomain}.ma'), MONDAY, 9 + i)
+
+        with self.assertNumQueries(6):
+            self.scheduler.prepare(self.tenant, NOW)
+        ReminderDelivery.objects.all().delete()
+
+        stats = self.scheduler.run(tenants, NOW)
+        self.assertEqual((stats['sent'], stats['due']), (12, 12))
+        self.assertLessEqual(FakeTransport.opened, 2)   # One email transport per worker, reused for 8 batches
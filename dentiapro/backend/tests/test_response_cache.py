@@ -0,0 +1,102 @@
+import threading
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from apps.tenant.models import Domain, Tenant
+from apps.tenant.serializers import DomainSerializer
+from core.response_cache import ResponseCache, get_response_cache
+from core.testing import TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class DomainViewSet(TenantViewSet):
+    queryset = Domain.objects.all()
+    serializer_class = DomainSerializer
+    pagination_class = None
+    conditional_requests = False
+    cache_responses = True
+
+
+SHARED_CACHES = {'default': {'BACKEND': 'core.testing.SharedLocMemCache'}}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = ResponseCache(wait_timeout=2, poll_interval=0.01)
+
+    def test_entries_are_computed_once(self):
+        calls = []
+        for _ in range(3):
+            value = self.cache.get_or_compute('key', lambda: calls.append(1) or 'value')
+        self.assertEqual(value, 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_bumping_a_version_changes_the_key(self):
+        key = self.cache.make_key(1, (Domain,), 'admin', '/domains/', [('page', ['2'])])
+        self.assertEqual(key, self.cache.make_key(1, (Domain,), 'admin', '/domains/', [('page', ['2'])]))
+        self.cache.bump(2, Domain)
+        self.cache.bump(1, Tenant)
+        self.assertEqual(key, self.cache.make_key(1, (Domain,), 'admin', '/domains/', [('page', ['2'])]))
+        self.cache.bump(1, Domain)
+        self.assertNotEqual(key, self.cache.make_key(1, (Domain,), 'admin', '/domains/', [('page', ['2'])]))
+
+    def test_concurrent_misses_share_one_recompute(self):
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_compute('hot', compute)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_refused(self):
+        # Other workers would never see the versions this one bumps.
+        self.assertFalse(self.cache.shared)
+        with self.assertRaises(ImproperlyConfigured):
+            self.cache.get_or_compute('key', lambda: 'value')
+        self.cache.bump(1, Domain)  # Writes still go through
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedTenantViewSetTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        # Off by default without REDIS_URL (config/settings).
+        enabled = mock.patch.object(get_response_cache(), 'enabled', True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+        Domain.objects.create(domain='smile.ma', tenant=self.tenant)
+        self.view = DomainViewSet.as_view({'get': 'list'})
+
+    def get(self):
+        request = self.factory.get('/domains/')
+        self.tenant_request(request)
+        return self.view(request)
+
+    def test_list_is_served_from_cache_until_a_row_changes(self):
+        hits = get_response_cache().hits.value
+        self.assertEqual(len(self.get().data), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.get().data), 1)
+        self.assertEqual(get_response_cache().hits.value - hits, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Domain.objects.create(domain='smile.com', tenant=self.tenant)
+        self.assertEqual(len(self.get().data), 2)
@@ -0,0 +1,55 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from apps.tenant.models import Domain
+from apps.tenant.serializers import TenantSerializer
+from core.testing import TenantTestMixin
+from core.utils import TenantViewSet
+
+
+class DomainSerializer(serializers.ModelSerializer):
+    tenant = TenantSerializer(read_only=True)
+
+    class Meta:
+        model = Domain
+        fields = ['id', 'domain', 'tenant', 'is_primary', 'created_at', 'updated_at']
+
+
+class DomainViewSet(TenantViewSet):
+    queryset = Domain.objects.select_related('tenant')
+    serializer_class = DomainSerializer
+    pagination_class = None
+    conditional_requests = False
+
+
+class SparseFieldsTest(TenantTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.domain = Domain.objects.create(domain='smile.ma', tenant=self.tenant)
+
+    def get(self, query, action='list'):
+        view = DomainViewSet.as_view({'get': action})
+        request = self.factory.get(f'/domains/{query}')
+        self.tenant_request(request)
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, pk=self.domain.pk) if action == 'retrieve' else view(request)
+        return response, queries[-1]['sql'] if queries else None
+
+    def test_fields_trim_serializer_and_select(self):
+        response, sql = self.get('?fields=id,domain')
+        self.assertEqual(response.data, [{'id': self.domain.id, 'domain': 'smile.ma'}])
+        self.assertNotIn('is_primary', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_exclude_keeps_needed_joins(self):
+        response, sql = self.get('?exclude=created_at,updated_at', action='retrieve')
+        self.assertEqual(set(response.data), {'id', 'domain', 'tenant', 'is_primary'})
+        self.assertEqual(response.data['tenant']['name'], 'Smile')
+        self.assertIn('JOIN', sql)
+        self.assertNotIn('"domains"."created_at"', sql)
+
+    def test_unknown_fields_are_rejected(self):
+        response, _ = self.get('?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)